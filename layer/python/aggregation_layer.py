@@ -0,0 +1,134 @@
+import os
+import heapq
+from operator import itemgetter
+
+#logger オブジェクト
+from logger_layer import ApplicationLogger
+logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
+
+# 並び順: キーの昇順(従来のsort + groupbyと同じ) / 件数の降順(同じ件数はキーの昇順) / 最初に現れた順
+ORDER_KEY   = "key"
+ORDER_COUNT = "count"
+ORDER_FIRST = None
+# この件数以上の場合にNumPy(unique / bincount)で数える(0の場合は使わない)
+# 文字列のキー(メニュー名・日付)は配列への変換が支配的なため、既定では辞書で数える方が速い(tests/benchmark/bench_aggregation.py)
+NUMPY_MIN_ROWS = int(os.getenv("AGGREGATION_NUMPY_MIN_ROWS", "0"))
+
+
+def load_numpy():
+    """
+    NumPyを読み込む。インストールされていない場合はNoneを返す(辞書で数える)
+    """
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def count_by(items, keys, order=ORDER_KEY, top=None, use_numpy=None):
+    """
+    アイテムの配列を1度だけ走査し、複数のキーごとの件数を数える
+
+    Parameters
+    ----------
+    items : iterable
+        アイテム(dict)の配列。ジェネレータでもよい
+    keys : dict
+        集計名 -> 属性名、またはアイテムを受け取りキーを返す関数
+    order : string
+        件数の並び順(ORDER_KEY, ORDER_COUNT, ORDER_FIRST)
+    top : int
+        並べた後に先頭から返す件数。Noneの場合は全て
+    use_numpy : bool
+        NumPyで数えるか。Noneの場合は件数で判定する
+
+    Returns
+    -------
+    counts : dict
+        集計名 -> (キー -> 件数)
+    """
+    getters = [(name, itemgetter(key) if isinstance(key, str) else key) for name, key in keys.items()]
+    numpy   = None
+    if use_numpy or (use_numpy is None and NUMPY_MIN_ROWS > 0 and hasattr(items, "__len__") and len(items) >= NUMPY_MIN_ROWS):
+        numpy = load_numpy()
+    if numpy is not None:
+        counts = _count_by_numpy(numpy, items, getters, keep_first=order is ORDER_FIRST)
+    elif len(getters) == 1:
+        counts = {getters[0][0]: _count_values(map(getters[0][1], items))}
+    else:
+        counts = {name: {} for name, _ in getters}
+        groups = [(counts[name], getter) for name, getter in getters]
+        for item in items:
+            for group, getter in groups:
+                key        = getter(item)
+                group[key] = group.get(key, 0) + 1
+    return {name: order_counts(group, order=order, top=top) for name, group in counts.items()}
+
+
+def order_counts(counts, order=ORDER_KEY, top=None):
+    """
+    件数を並べ替え、先頭のtop件を返す
+
+    Parameters
+    ----------
+    counts : dict
+        キー -> 件数
+    order : string
+        並び順(ORDER_KEY, ORDER_COUNT, ORDER_FIRST)
+    top : int
+        先頭から返す件数。Noneの場合は全て
+
+    Returns
+    -------
+    counts : dict
+        並べ替えたキー -> 件数
+    """
+    if order == ORDER_COUNT:
+        # topを指定した場合は全件を並べずに上位のみを取り出す
+        sort_key = lambda pair: (-pair[1], pair[0])
+        pairs    = heapq.nsmallest(top, counts.items(), key=sort_key) if top is not None else sorted(counts.items(), key=sort_key)
+        return dict(pairs)
+    if order == ORDER_KEY:
+        keys = heapq.nsmallest(top, counts) if top is not None else sorted(counts)
+        return {key: counts[key] for key in keys}
+    if order is not ORDER_FIRST:
+        raise ValueError("Unknown order: {}".format(order))
+    if top is None:
+        return counts
+    return {key: counts[key] for key, _ in zip(counts, range(top))}
+
+
+def _count_values(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+def _count_by_numpy(np, items, getters, keep_first=False):
+    items  = items if isinstance(items, list) else list(items)
+    counts = {}
+    for name, getter in getters:
+        values = list(map(getter, items))
+        try:
+            array = np.asarray(values)
+            if array.dtype.kind in "iu" and len(array) > 0 and not keep_first and 0 <= array.min() and array.max() < max(len(array) * 4, 1024):
+                # 0以上の小さい整数はbincountで数える(IDのような大きな値はuniqueで数え、巨大な配列を作らない)
+                bins = np.bincount(array)
+                keys = np.flatnonzero(bins)
+                counts[name] = dict(zip(keys.tolist(), bins[keys].tolist()))
+            elif array.dtype.kind in "iufUSb":
+                keys, first_indexes, key_counts = np.unique(array, return_index=True, return_counts=True)
+                if keep_first:
+                    # 最初に現れた順に並べ直す
+                    positions  = np.argsort(first_indexes, kind="stable")
+                    keys       = keys[positions]
+                    key_counts = key_counts[positions]
+                counts[name] = dict(zip(keys.tolist(), key_counts.tolist()))
+            else:
+                counts[name] = _count_values(values)
+        except (TypeError, ValueError) as e:
+            # キーの型が混在している場合などは辞書で数える
+            logger.debug("Counting {} without NumPy: {}".format(name, e))
+            counts[name] = _count_values(values)
+    return counts
@@ -0,0 +1,347 @@
+import os
+import copy
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+
+#logger オブジェクト
+from logger_layer import ApplicationLogger
+logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
+
+
+class LruTtlCacheBackend():
+    """
+    プロセス内のLRU + TTLキャッシュ
+    Lambda関数ごと・コンテナごとに独立しており、他の関数(add_todoなど)でのバージョンの更新が届かないため、
+    読み込みと書き込みが同じプロセスで行われる場合(テスト・ローカル実行)のみ使う。create_todo_cacheでは選択できない
+
+    Parameters
+    ----------
+    max_size : int
+        保持する最大件数
+    default_ttl : float
+        有効期間(秒)
+    """
+    def __init__(self, max_size=256, default_ttl=30):
+        self.max_size    = max_size
+        self.default_ttl = default_ttl
+        # key -> (value, expires_at)
+        self._entries    = OrderedDict()
+        self._lock       = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # 呼び出し元が結果を書き換えてもキャッシュが壊れないように複製して返す
+        return copy.deepcopy(value)
+
+    def set(self, key, value, ttl=None):
+        ttl        = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        value      = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """
+        キーが存在しない場合のみ登録する
+
+        Returns
+        -------
+        True : boolean
+            登録した場合
+        False : boolean
+            既に存在した場合
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                return False
+        self.set(key, value, ttl)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class KeyValueCacheBackend():
+    """
+    外部のキーバリューストア(Redis互換のget / set)を使うキャッシュ
+    関数・コンテナをまたいで共有されるため、書き込み後の読み込みでも古いデータを返さない
+
+    Parameters
+    ----------
+    client : object
+        get(key) / set(key, value, ex=秒, nx=bool) を持つクライアント
+    default_ttl : float
+        有効期間(秒)
+    prefix : string
+        キーの接頭辞
+    errors : tuple
+        読み込み時にキャッシュミスとして扱うクライアントの例外(接続エラー・タイムアウトなど)
+    """
+    def __init__(self, client, default_ttl=300, prefix="muscle:", errors=()):
+        self.client      = client
+        self.default_ttl = default_ttl
+        self.prefix      = prefix
+        self.errors      = tuple(errors)
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except self.errors as e:
+            # キャッシュの障害時はキャッシュミスとしてDynamoDBから読み込む
+            logger.warn("Failed reading cache. Treat as a miss")
+            logger.warn(e)
+            return None
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return json.loads(value, object_hook=self.__decode_decimal)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, json.dumps(value, default=self.__encode_decimal), ex=int(ttl) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        return bool(self.client.set(self.prefix + key, json.dumps(value, default=self.__encode_decimal), ex=int(ttl) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    #private method
+    def __encode_decimal(self, obj):
+        # DynamoDBの数値(Decimal)を型情報つきで保存する
+        if isinstance(obj, Decimal):
+            return {"__decimal__": str(obj)}
+        raise TypeError
+
+    def __decode_decimal(self, obj):
+        if "__decimal__" in obj and len(obj) == 1:
+            return Decimal(obj["__decimal__"])
+        return obj
+
+
+class InMemoryKeyValueStore():
+    """
+    KeyValueCacheBackendのテスト・ローカル実行用のスタンドイン
+    Redisのget / set(ex, nx) / deleteと同じ振る舞いをする
+    """
+    def __init__(self):
+        self._values = {}
+        self._lock   = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._values[key]
+                return None
+            return value.encode("utf-8")
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            entry = self._values.get(key)
+            if nx and entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                return None
+            self._values[key] = (value, time.monotonic() + ex if ex else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+
+class TodoCache():
+    """
+    ユーザごとのTodoの読み込み結果をキャッシュするクラス
+
+    キャッシュのキーにはユーザごとのバージョンを含め、Todoを書き込むメソッドが書き込み後にバージョンを更新する。
+    読み込み前にバージョンを確定させるため、更新と並行して読み込んだ結果が新しいバージョンで使われることはない。
+    バージョンは乱数で発行するため、バージョンのキーが消えた場合も古いエントリを参照しない
+
+    読み込みはGSIへのQuery(結果整合性)のため、更新直後の読み込みは書き込み前の結果を返すことがある。
+    バージョンに更新日時を持たせ、更新からsettle_seconds以内に始めた読み込みの結果は登録しない
+
+    Parameters
+    ----------
+    backend : object
+        LruTtlCacheBackend / KeyValueCacheBackend
+    ttl_seconds : float
+        読み込み結果の有効期間(秒)
+    settle_seconds : float
+        書き込みがGSIに反映されるまでの時間(秒)。この間の読み込み結果はキャッシュしない
+    """
+    def __init__(self, backend, ttl_seconds=None, settle_seconds=0):
+        self.backend        = backend
+        self.ttl_seconds    = ttl_seconds
+        self.settle_seconds = settle_seconds
+        self._counters      = {"hit": 0, "miss": 0, "invalidate": 0}
+        self._lock          = threading.Lock()
+
+    def get_or_load(self, user_name, query_name, loader):
+        """
+        キャッシュから読み込み結果を取得する。存在しない場合はloaderで読み込んで登録する
+
+        Parameters
+        ----------
+        user_name : string
+            ユーザ名
+        query_name : string
+            読み込み内容を表す名前(パラメータを含める)
+        loader : function
+            DynamoDBから読み込む関数
+
+        Returns
+        -------
+        value : object
+            読み込み結果
+        """
+        try:
+            version = self.__get_version(user_name)
+            key     = "todos:{}:{}:{}".format(user_name, version, query_name)
+            value   = self.backend.get(key)
+        except Exception as e:
+            # キャッシュの障害時はDynamoDBから読み込む
+            logger.warn("Failed reading cache")
+            logger.warn(e)
+            return loader()
+        if value is not None:
+            self.__count("hit")
+            return value
+        self.__count("miss")
+        started_at = time.time()
+        value      = loader()
+        if started_at - self.__get_invalidated_at(version) < self.settle_seconds:
+            # GSIに直前の書き込みが反映されていない可能性があるため、新しいバージョンで登録しない
+            logger.debug("Todos of {} were written recently. Skip caching".format(user_name))
+            return value
+        try:
+            self.backend.set(key, value, self.ttl_seconds)
+        except Exception as e:
+            logger.warn("Failed writing cache")
+            logger.warn(e)
+        return value
+
+    def invalidate(self, user_name):
+        """
+        ユーザのバージョンを更新し、以前の読み込み結果を参照しないようにする
+        """
+        # バージョンは<乱数>:<更新日時>(更新日時から書き込みがGSIに反映されたかを判定する)
+        self.backend.set(self.__version_key(user_name), "{}:{}".format(uuid.uuid4().hex, time.time()), 0)
+        self.__count("invalidate")
+
+    def get_counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    #private method
+    def __version_key(self, user_name):
+        return "todo-version:{}".format(user_name)
+
+    def __get_version(self, user_name):
+        version_key = self.__version_key(user_name)
+        version     = self.backend.get(version_key)
+        if version is None:
+            # 書き込みによる更新ではないため、更新日時は0にする
+            self.backend.add(version_key, "{}:0".format(uuid.uuid4().hex), 0)
+            version = self.backend.get(version_key)
+        if version is None:
+            raise RuntimeError("version of {} is not available".format(user_name))
+        return version
+
+    def __get_invalidated_at(self, version):
+        _, _, invalidated_at = version.rpartition(":")
+        try:
+            return float(invalidated_at)
+        except ValueError:
+            # 更新日時を持たない以前のバージョン
+            return 0.0
+
+    def __count(self, counter_name):
+        with self._lock:
+            self._counters[counter_name] += 1
+
+
+class NullTodoCache():
+    """
+    キャッシュを利用しない場合のTodoCache
+    """
+    def get_or_load(self, user_name, query_name, loader):
+        return loader()
+
+    def invalidate(self, user_name):
+        pass
+
+    def get_counters(self):
+        return {}
+
+
+def create_todo_cache():
+    """
+    環境変数TODO_CACHE_BACKENDに応じたTodoCacheを生成する
+
+    none  : キャッシュしない(既定値)
+    redis : TODO_CACHE_URLのRedis(レイヤーのrequirements.txtのredisパッケージを使う)
+            Redisの障害時にLambdaのタイムアウトまで待たないように、接続・応答をTODO_CACHE_TIMEOUT_SECONDSで打ち切る
+    書き込む関数と読み込む関数が別のコンテナで動くため、関数をまたいで共有されるRedisのみ選択できる
+    (memoryは読み込み側にバージョンの更新が届かず、TTLの間古いデータを返すため廃止した)
+    """
+    backend_name = os.getenv("TODO_CACHE_BACKEND", "none")
+    if backend_name == "redis":
+        import redis
+        ttl_seconds    = float(os.getenv("TODO_CACHE_TTL_SECONDS", "300"))
+        settle_seconds = float(os.getenv("TODO_CACHE_SETTLE_SECONDS", "5"))
+        timeout        = float(os.getenv("TODO_CACHE_TIMEOUT_SECONDS", "0.2"))
+        client         = redis.Redis.from_url(os.getenv("TODO_CACHE_URL"), socket_timeout=timeout, socket_connect_timeout=timeout)
+        backend        = KeyValueCacheBackend(client, default_ttl=ttl_seconds, errors=(redis.RedisError,))
+        return TodoCache(backend, ttl_seconds, settle_seconds)
+    if backend_name != "none":
+        logger.warn("TODO_CACHE_BACKEND={} is not supported. Todo cache is disabled".format(backend_name))
+    return NullTodoCache()
+
+
+# ウォームスタート間で共有するTodoキャッシュ(初回利用時に生成する)
+_todo_cache      = None
+_todo_cache_lock = threading.Lock()
+
+def get_todo_cache():
+    """
+    プロセスで共有するTodoキャッシュを取得する
+    """
+    global _todo_cache
+    with _todo_cache_lock:
+        if _todo_cache is None:
+            _todo_cache = create_todo_cache()
+        return _todo_cache
+
+def set_todo_cache(todo_cache):
+    """
+    プロセスで共有するTodoキャッシュを差し替える。テストやローカル実行で利用する
+    """
+    global _todo_cache
+    with _todo_cache_lock:
+        _todo_cache = todo_cache
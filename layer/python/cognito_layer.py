@@ -1,15 +1,263 @@
-import boto3
 import os
 import json
 import base64
-import jwt
-from jwt.algorithms import RSAAlgorithm
-import requests as req
+import hashlib
+import time
+import threading
+import urllib.request
+from collections import OrderedDict
+# jwt・jwt.algorithms(cryptography)は読み込みが重いため、トークンの検証時に読み込む(コールドスタートの短縮)
 
 #logger オブジェクト
 from logger_layer import ApplicationLogger
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
 
+# 公開鍵(JWKS)の取得先
+COGNITO_JWKS_URL = "https://cognito-idp.ap-northeast-1.amazonaws.com/ap-northeast-1_pClKUpMPC/.well-known/jwks.json"
+
+
+class TokenVerificationError(Exception):
+    """
+    トークンを検証できない場合の例外(署名・有効期限・発行者・クレームが不正、kidに対応する公開鍵がないなど)
+    jwtを読み込まずに捕捉できるように、jwtの例外はこの例外に変換する。ハンドラは401を返す
+    """
+    pass
+
+
+class JwksKeyStore():
+    """
+    Cognitoの公開鍵(JWKS)をkid単位でキャッシュするクラス
+    ウォームスタート中はプロセス内で鍵を使い回し、未知のkidを受け取った場合のみ再取得する
+
+    Parameters
+    ----------
+    jwks_url : string
+        公開鍵の取得先URL
+    ttl_seconds : int
+        取得した鍵を新しいとみなす秒数。超過後は再取得を試み、失敗した場合は古い鍵を使い続ける
+    min_refresh_interval : int
+        再取得の最短間隔(秒)。不正なkidによる連続取得を防ぐ
+    fetcher : function
+        URLを受け取りJWKS(dict)を返す関数。未指定の場合はHTTPで取得する
+    """
+    def __init__(self, jwks_url=COGNITO_JWKS_URL, ttl_seconds=3600, min_refresh_interval=30, fetcher=None):
+        self.jwks_url             = jwks_url
+        self.ttl_seconds          = ttl_seconds
+        self.min_refresh_interval = min_refresh_interval
+        self.fetcher              = fetcher if fetcher else self.__fetch_jwks
+        # kid -> 公開鍵オブジェクト
+        self._keys                = {}
+        self._fetched_at          = None
+        self._last_refresh_at     = None
+        self._generation          = 0
+        self._lock                = threading.Lock()
+        # 同時に発生した再取得を1回にまとめるためのロック
+        self._refresh_lock        = threading.Lock()
+        self._counters            = {
+            "hit": 0,
+            "miss": 0,
+            "refresh": 0,
+            "refresh_failure": 0,
+            "stale": 0
+        }
+
+    def get_public_key(self, kid):
+        """
+        kidに対応する公開鍵を取得する
+
+        Parameters
+        ----------
+        kid : string
+            JWTヘッダーに記載された鍵ID
+
+        Returns
+        -------
+        public_key : RSAPublicKey
+            公開鍵。取得できない場合はNone
+        """
+        with self._lock:
+            public_key = self._keys.get(kid)
+            generation = self._generation
+            if public_key is not None and not self.__is_expired(time.monotonic()):
+                self._counters["hit"] += 1
+                return public_key
+            self._counters["miss"] += 1
+        self.__refresh(generation)
+        with self._lock:
+            if kid in self._keys and self.__is_expired(time.monotonic()):
+                # 再取得に失敗した場合は期限切れの鍵を使い続ける
+                self._counters["stale"] += 1
+            return self._keys.get(kid)
+
+    def load_keys(self, jwks):
+        """
+        JWKS(dict)を直接読み込む。ローカル環境やテストで利用する
+        """
+        from jwt.algorithms import RSAAlgorithm
+        keys = {jwk_key["kid"]: RSAAlgorithm.from_jwk(json.dumps(jwk_key)) for jwk_key in jwks["keys"]}
+        with self._lock:
+            self._keys        = keys
+            self._fetched_at  = time.monotonic()
+            self._generation += 1
+
+    def get_counters(self):
+        """
+        ヒット数・ミス数・再取得数などのカウンタを返す
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def clear(self):
+        """
+        キャッシュした鍵とカウンタを破棄する
+        """
+        with self._lock:
+            self._keys            = {}
+            self._fetched_at      = None
+            self._last_refresh_at = None
+            self._generation     += 1
+            for counter_name in self._counters:
+                self._counters[counter_name] = 0
+
+    #private method
+    def __is_expired(self, now):
+        return self._fetched_at is None or now - self._fetched_at >= self.ttl_seconds
+
+    def __refresh(self, generation):
+        with self._refresh_lock:
+            with self._lock:
+                # 待機中に他のスレッドが再取得を終えていれば何もしない
+                if self._generation != generation:
+                    return
+                now = time.monotonic()
+                if self._last_refresh_at is not None and now - self._last_refresh_at < self.min_refresh_interval:
+                    logger.debug("Skip refreshing public cert. last refresh is too recent")
+                    return
+                self._last_refresh_at = now
+            try:
+                logger.debug("Requesting public cert")
+                jwks = self.fetcher(self.jwks_url)
+                self.load_keys(jwks)
+                with self._lock:
+                    self._counters["refresh"] += 1
+                logger.debug("Success requesting public cert")
+            except Exception as e:
+                with self._lock:
+                    self._counters["refresh_failure"] += 1
+                logger.warn(e)
+                logger.warn("Failed requesting public cert")
+
+    def __fetch_jwks(self, url):
+        # requestsの読み込みを避け、標準ライブラリで取得する(HTTPエラーはHTTPErrorとして送出される)
+        with urllib.request.urlopen(url, timeout=3) as public_key_res:
+            return json.loads(public_key_res.read().decode("utf-8"))
+
+
+class VerifiedClaimsCache():
+    """
+    署名検証済みのトークンとクレームを対応付けるLRUキャッシュ
+    トークン本体は保持せず、SHA-256のダイジェストをキーにする
+
+    Parameters
+    ----------
+    max_size : int
+        保持するトークンの最大数。超過した場合は最も古く参照されたものから破棄する
+    """
+    def __init__(self, max_size=1024):
+        self.max_size  = max_size
+        # digest -> (claims, exp)
+        self._entries  = OrderedDict()
+        self._lock     = threading.Lock()
+        self._counters = {
+            "hit": 0,
+            "miss": 0,
+            "expired": 0,
+            "evicted": 0
+        }
+
+    def get(self, token, token_use="id"):
+        """
+        キャッシュからトークンのクレームを取得する
+
+        Parameters
+        ----------
+        token : string
+            JWT
+        token_use : string
+            トークンの種別(id / access)。種別ごとに検証内容が異なるためキーを分ける
+
+        Returns
+        -------
+        claims : dict
+            検証済みのクレーム。キャッシュにない場合、有効期限切れの場合はNone
+        """
+        digest = self.__digest(token, token_use)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self._counters["miss"] += 1
+                return None
+            claims, exp = entry
+            if exp <= time.time():
+                del self._entries[digest]
+                self._counters["expired"] += 1
+                self._counters["miss"] += 1
+                return None
+            self._entries.move_to_end(digest)
+            self._counters["hit"] += 1
+            return dict(claims)
+
+    def put(self, token, claims, token_use="id"):
+        """
+        検証済みのクレームをキャッシュに登録する。expを持たないクレームは登録しない
+        """
+        if "exp" not in claims:
+            return
+        digest = self.__digest(token, token_use)
+        with self._lock:
+            self._entries[digest] = (dict(claims), claims["exp"])
+            self._entries.move_to_end(digest)
+            if len(self._entries) > self.max_size:
+                self.__evict(time.time())
+
+    def get_counters(self):
+        """
+        ヒット数・ミス数・破棄数のカウンタを返す
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["size"] = len(self._entries)
+            return counters
+
+    def clear(self):
+        """
+        キャッシュとカウンタを破棄する
+        """
+        with self._lock:
+            self._entries.clear()
+            for counter_name in self._counters:
+                self._counters[counter_name] = 0
+
+    #private method
+    def __digest(self, token, token_use):
+        return hashlib.sha256("{}:{}".format(token_use, token).encode("utf-8")).digest()
+
+    def __evict(self, now):
+        # 期限切れのものを優先して破棄し、それでも溢れる場合は最も古いものを破棄する
+        expired_digests = [digest for digest, (claims, exp) in self._entries.items() if exp <= now]
+        for digest in expired_digests:
+            del self._entries[digest]
+            self._counters["expired"] += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._counters["evicted"] += 1
+
+
+# ウォームスタート間で共有する公開鍵ストア
+jwks_key_store = JwksKeyStore()
+# ウォームスタート間で共有する検証済みクレームのキャッシュ
+verified_claims_cache = VerifiedClaimsCache(max_size=int(os.getenv("COGNITO_CLAIMS_CACHE_SIZE", "1024")))
+
 
 class CognitoObject():
     def __init__(self):
@@ -20,37 +268,109 @@ class CognitoObject():
         #　環境変数取得
         issuer = os.getenv('COGNITO_ISSUER')
         audience = os.getenv('COGNITO_AUDIENCE')
+        # 検証済みのトークンであれば署名の検証を省略する
+        claims = verified_claims_cache.get(id_token, token_use="id")
+        if claims is not None:
+            logger.debug("claims cache hit. counters: {}".format(verified_claims_cache.get_counters()))
+            return claims
         try:
-            # header情報取得
-            header = jwt.get_unverified_header(id_token)
-            # 公開鍵取得
-            logger.debug("Requesting public crt")
-            url = "https://cognito-idp.ap-northeast-1.amazonaws.com/ap-northeast-1_pClKUpMPC/.well-known/jwks.json"
-            public_key_res = req.get(url)
-            public_key_res.raise_for_status()
-            logger.debug("Success requesting public cert")
-            public_key = public_key_res.json()
-            logger.debug("public key: {}".format(public_key))
-            jwk_list = public_key["keys"]
-            # header情報のkidと一致する鍵を取得
-            jwk_key = next(filter(lambda k: k['kid'] == header['kid'], jwk_list))
-            # 公開鍵へデコード
-            logger.debug(json.dumps(jwk_key, indent=2))
-            public_key = RSAAlgorithm.from_jwk(json.dumps(jwk_key))
             # 署名の検証 & tokenデコード
-            claims = jwt.decode(
-                id_token,
-                public_key,
-                issuer=issuer,
-                audience=audience,
-                algorithms=["RS256"]
-            )
+            claims = self.decode_verified_token(id_token, issuer=issuer, audience=audience)
             logger.debug("claims: {}".format(claims))
+            verified_claims_cache.put(id_token, claims, token_use="id")
             return claims
-        except req.exceptions.HTTPError as e:
-            logger.warn(e)
-            logger.warn("Failed requesting public cert")
         except Exception as e:
             logger.warn(e)
             logger.warn("Failed decoding token.")
             raise
+
+    @classmethod
+    def get_user_info_from_access_token(self, access_token):
+        """
+        Cognito Access Tokenをローカルで検証し、クレームを取得するメソッド
+        cognito-idpのGetUserは呼び出さず、署名・発行者・token_use・client_idを検証する
+
+        Parameters
+        ----------
+        access_token : string
+            Cognito Access Token
+
+        Returns
+        -------
+        claims : dict
+            検証済みのクレーム
+
+        Raises
+        ------
+        TokenVerificationError
+            トークンが不正な場合、または公開鍵が取得できない場合
+        """
+        logger.debug("access token received. token: {}".format(access_token))
+        #　環境変数取得
+        issuer    = os.getenv('COGNITO_ISSUER')
+        client_id = os.getenv('COGNITO_CLIENT_ID', os.getenv('COGNITO_AUDIENCE'))
+        claims = verified_claims_cache.get(access_token, token_use="access")
+        if claims is not None:
+            logger.debug("claims cache hit. counters: {}".format(verified_claims_cache.get_counters()))
+            return claims
+        try:
+            # Access Tokenはaudを持たないため、client_idを個別に検証する
+            claims = self.decode_verified_token(access_token, issuer=issuer, options={"verify_aud": False})
+            if claims.get("token_use") != "access":
+                raise TokenVerificationError("token_use is not access. token_use: {}".format(claims.get("token_use")))
+            if claims.get("client_id") != client_id:
+                raise TokenVerificationError("client_id is invalid. client_id: {}".format(claims.get("client_id")))
+            logger.debug("claims: {}".format(claims))
+            verified_claims_cache.put(access_token, claims, token_use="access")
+            return claims
+        except Exception as e:
+            logger.warn(e)
+            logger.warn("Failed decoding access token.")
+            raise
+
+    @classmethod
+    def decode_verified_token(self, token, issuer=None, audience=None, options=None):
+        """
+        JWTの署名を検証してデコードするメソッド
+
+        Parameters
+        ----------
+        token : string
+            JWT
+        issuer : string
+            期待する発行者
+        audience : string
+            期待するaud
+        options : dict
+            jwt.decodeに渡す検証オプション
+
+        Returns
+        -------
+        claims : dict
+            検証済みのクレーム
+
+        Raises
+        ------
+        TokenVerificationError
+            トークンが不正な場合、またはkidに対応する公開鍵が取得できない場合(未知のkid・再取得の間隔内など)
+        """
+        import jwt
+        try:
+            # header情報取得
+            header = jwt.get_unverified_header(token)
+            # header情報のkidと一致する公開鍵を取得
+            public_key = jwks_key_store.get_public_key(header.get('kid'))
+            logger.debug("public key store counters: {}".format(jwks_key_store.get_counters()))
+            if public_key is None:
+                logger.warn("Failed requesting public cert")
+                raise TokenVerificationError("public key is not found. kid: {}".format(header.get('kid')))
+            return jwt.decode(
+                token,
+                public_key,
+                issuer=issuer,
+                audience=audience,
+                algorithms=["RS256"],
+                options=options
+            )
+        except jwt.InvalidTokenError as e:
+            raise TokenVerificationError(str(e)) from e
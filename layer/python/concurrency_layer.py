@@ -0,0 +1,128 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+#logger オブジェクト
+from logger_layer import ApplicationLogger
+logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
+
+# 呼び出しごとの集計(Lambdaの残り時間の取得に利用する)
+from metrics_layer import invocation_metrics
+
+
+class TaskTimeoutError(Exception):
+    """
+    run_concurrentlyのタスクが制限時間内に終わらなかった場合の例外
+    """
+    def __init__(self, task_name, timeout):
+        super().__init__("task {} did not finish in {:.3f}s".format(task_name, timeout))
+        self.task_name = task_name
+        self.timeout   = timeout
+
+
+# 用途ごとのスレッドプール(初回利用時に生成し、ウォームスタート間で使い回す)
+# ハンドラのタスクとDynamoDBの並列読み込みでプールを分け、タスクの中から同じプールを待って詰まらないようにする
+_executors      = {}
+_executors_lock = threading.Lock()
+# スレッドプールのワーカーが実行中のプール名
+_worker_state   = threading.local()
+
+def get_executor(name="handler", max_workers=None):
+    """
+    用途ごとに共有するスレッドプールを取得する
+
+    Parameters
+    ----------
+    name : string
+        プールの名前(handler: ハンドラのサブリクエスト, dynamodb: DynamoDBの並列読み込み)
+    max_workers : int
+        初回生成時のスレッド数。未指定の場合は環境変数CONCURRENCY_MAX_WORKERS(既定値8)
+
+    Returns
+    -------
+    executor : ThreadPoolExecutor
+        スレッドプール
+    """
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            max_workers = max_workers or int(os.getenv("CONCURRENCY_MAX_WORKERS", "8"))
+            executor    = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name,
+                                             initializer=_mark_worker, initargs=(name,))
+            _executors[name] = executor
+        return executor
+
+def _mark_worker(name):
+    _worker_state.executor_name = name
+
+def is_running_in(name):
+    """
+    呼び出し元がnameのプールのワーカーか判定する
+    """
+    return getattr(_worker_state, "executor_name", None) == name
+
+def get_task_timeout(timeout=None):
+    """
+    タスクの制限時間(秒)を返す
+    指定がない場合は環境変数CONCURRENCY_TASK_TIMEOUT(既定値10秒)とし、Lambdaの残り時間を超えないようにする
+    """
+    timeout = float(os.getenv("CONCURRENCY_TASK_TIMEOUT", "10")) if timeout is None else timeout
+    context = invocation_metrics.context
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        # 応答を返す時間を残す
+        remaining = context.get_remaining_time_in_millis() / 1000 - float(os.getenv("CONCURRENCY_TIME_MARGIN", "0.5"))
+        timeout   = max(0.0, min(timeout, remaining))
+    return timeout
+
+def run_concurrently(tasks, timeout=None, executor_name="handler"):
+    """
+    互いに依存しない複数のI/Oを並行に実行し、全ての結果を待つ
+
+    Parameters
+    ----------
+    tasks : dict
+        タスク名 -> 引数なしの関数。関数の代わりに(関数, 制限時間)を指定するとタスクごとの制限時間になる
+    timeout : float
+        タスクの制限時間(秒)。各タスクの開始からの時間で判定する
+    executor_name : string
+        利用するスレッドプールの名前
+
+    Returns
+    -------
+    results : dict
+        タスク名 -> 関数の戻り値
+
+    Raises
+    ------
+    TaskTimeoutError
+        制限時間内に終わらないタスクがあった場合
+    Exception
+        タスクが送出した例外(最初に登録したタスクのものから順に確認する)
+    """
+    task_functions = {}
+    task_timeouts  = {}
+    for task_name, task in tasks.items():
+        function, task_timeout = task if isinstance(task, tuple) else (task, timeout)
+        task_functions[task_name] = function
+        task_timeouts[task_name]  = get_task_timeout(task_timeout)
+    if is_running_in(executor_name) or len(task_functions) == 1:
+        # タスクが1件の場合と、同じプールのワーカーから呼ばれた場合(プールの空きを待って詰まらないように)は呼び出し元で順に実行する
+        return {task_name: function() for task_name, function in task_functions.items()}
+    executor   = get_executor(executor_name)
+    started_at = time.monotonic()
+    futures    = {task_name: executor.submit(function) for task_name, function in task_functions.items()}
+    results    = {}
+    try:
+        for task_name, future in futures.items():
+            remaining = task_timeouts[task_name] - (time.monotonic() - started_at)
+            try:
+                results[task_name] = future.result(timeout=max(0.0, remaining))
+            except FutureTimeoutError:
+                logger.warn("Task {} is timed out".format(task_name))
+                raise TaskTimeoutError(task_name, task_timeouts[task_name])
+    finally:
+        # 失敗した場合は未着手のタスクを取り消す(実行中のタスクは完了まで続く)
+        for future in futures.values():
+            future.cancel()
+    return results
@@ -1,31 +1,155 @@
-import boto3
-from boto3.dynamodb.conditions import Key, Attr
-from botocore.client import Config
-from botocore.exceptions import ClientError
+# boto3・botocore.client・boto3.dynamodb.*は読み込みが重いため、初回の利用時に読み込む(コールドスタートの短縮)
+# botocore.exceptionsは軽量で、例外の捕捉に必要なためモジュールの読み込み時に読み込む
+from botocore.exceptions import ClientError, EndpointConnectionError, ConnectionClosedError, ReadTimeoutError, ConnectTimeoutError
 
 import os
+import heapq
+import queue
+import random
+import threading
+import time
+import uuid
 from decimal import Decimal
 from datetime import datetime, timedelta
-from itertools import groupby
 import decimal
+# Todoキャッシュ
+from cache_layer import get_todo_cache
+# 呼び出しごとのDynamoDB操作の集計
+from metrics_layer import invocation_metrics
+# 共有スレッドプール
+from concurrency_layer import get_executor, run_concurrently
+# グラフ用の件数の集計
+from aggregation_layer import count_by, ORDER_FIRST
 #logger オブジェクト
 from logger_layer import ApplicationLogger
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
 
-class DynamodbObject():
-    def __init__(self):
+def create_client_config():
+    """
+    DynamoDBクライアント用のbotocore設定を生成する
+    コネクションプールを大きめに取り、タイムアウトを短くしてハングしたリクエストを早期に打ち切る
+    """
+    from botocore.client import Config
+    config_params = {
+        "max_pool_connections": int(os.getenv("DYNAMODB_MAX_POOL_CONNECTIONS", "20")),
+        "connect_timeout": float(os.getenv("DYNAMODB_CONNECT_TIMEOUT", "2")),
+        "read_timeout": float(os.getenv("DYNAMODB_READ_TIMEOUT", "5")),
+        # 再試行はRetryPolicyで行うため、botocoreの再試行は既定で無効にする
+        "retries": {"max_attempts": int(os.getenv("DYNAMODB_SDK_MAX_ATTEMPTS", "0"))}
+    }
+    try:
+        return Config(tcp_keepalive=True, **config_params)
+    except TypeError:
+        # tcp_keepaliveに未対応のbotocore
+        return Config(**config_params)
+
+class DynamodbResourceRegistry():
+    """
+    boto3のSession・DynamoDBリソース・Tableオブジェクトをウォームスタート間で共有するレジストリ
+
+    Sessionと低レベルのクライアント(スレッドセーフ)はコンテナで1つだけ生成し、全てのスレッドで共有する
+    boto3のリソース・Tableはスレッドセーフではないため、スレッドごとに共有のクライアントを使うリソースを作る
+    (サービス定義の読み込みを伴わないため、生成は1ms未満)
+    resource_factoryで差し替えたリソース(インメモリのDynamoDBなど)は、そのまま全てのスレッドで共有する
+
+    Parameters
+    ----------
+    config : botocore.client.Config
+        リソース生成時に渡すクライアント設定
+    config_factory : function
+        configが未指定の場合に、初回のリソース生成時に呼び出して設定を生成する関数
+    """
+    def __init__(self, config=None, config_factory=None):
+        self.config = config
+        self.config_factory = config_factory
+        self.resource_factory = None
+        self._lock   = threading.Lock()
+        self._shared = None
+        self._local  = threading.local()
+
+    def get_resource(self):
+        """
+        呼び出し元スレッドのDynamoDBリソースを取得する。未生成の場合は生成する
+        """
+        resource = getattr(self._local, "resource", None)
+        if resource is None:
+            shared, is_boto3 = self.__get_shared_resource()
+            # boto3のリソースは共有のクライアントを使うスレッド用のリソースを作る
+            resource = type(shared)(client=shared.meta.client) if is_boto3 else shared
+            self._local.resource = resource
+            self._local.tables   = {}
+        return resource
+
+    def get_client(self):
+        """
+        DynamoDBクライアントを取得する(全てのスレッドで共有する)
+        """
+        return self.get_resource().meta.client
+
+    def get_table(self, table_name):
+        """
+        呼び出し元スレッドのTableオブジェクトを取得する。未生成の場合は生成する
+        """
+        self.get_resource()
+        table = self._local.tables.get(table_name)
+        if table is None:
+            table = self._local.resource.Table(table_name)
+            self._local.tables[table_name] = table
+        return table
+
+    def reset(self):
+        """
+        生成済みのリソースを破棄する。テストや設定の変更時に利用する
+        """
+        with self._lock:
+            self._shared = None
+            self._local  = threading.local()
+
+    def set_resource_factory(self, resource_factory):
+        """
+        リソースの生成方法を差し替える(インメモリのDynamoDBなど)。Noneを指定するとboto3に戻す
+        """
+        self.resource_factory = resource_factory
+        self.reset()
+
+    #private method
+    def __get_shared_resource(self):
+        shared = self._shared
+        if shared is None:
+            with self._lock:
+                shared = self._shared
+                if shared is None:
+                    if self.resource_factory:
+                        shared = (self.resource_factory(), False)
+                    else:
+                        resource = self.__create_resource()
+                        shared   = (resource, resource.__class__.__module__.startswith("boto3."))
+                    self._shared = shared
+        return shared
+
+    def __create_resource(self):
+        if os.getenv("DYNAMODB_BACKEND") == "memory":
+            # プロセス内のインメモリのDynamoDB(ベンチマーク・負荷試験用)
+            from memory_dynamodb_layer import get_shared_memory_resource
+            return get_shared_memory_resource()
         try:
+            import boto3
+            if self.config is None and self.config_factory is not None:
+                self.config = self.config_factory()
+            session = boto3.session.Session()
             if os.getenv("AWS_SAM_LOCAL"):
                 logger.debug("Local DynamoDB")
-                dynamodb_resource = boto3.resource("dynamodb", 
+                dynamodb_resource = session.resource("dynamodb",
                     endpoint_url = os.getenv("DYNAMODB_ENDPOINT"),
                     region_name = "ap-northeast-2",
                     aws_access_key_id = os.getenv("DYNAMODB_ACCESS_ID"),
-                    aws_secret_access_key = os.getenv("DYNAMODB_ACCESS_KEY")
+                    aws_secret_access_key = os.getenv("DYNAMODB_ACCESS_KEY"),
+                    config = self.config
                 )
             else:
-                dynamodb_resource = boto3.resource("dynamodb")
+                dynamodb_resource = session.resource("dynamodb", config = self.config)
             logger.debug(dynamodb_resource)
+            return dynamodb_resource
         except ClientError as e:
             logger.warn('Dynamodb Error Occured')
             logger.warn(e)
@@ -34,12 +158,218 @@ class DynamodbObject():
             logger.warn('Error is Occured')
             logger.warn(e)
             raise
-        self.dynamodb = dynamodb_resource
-    
+
+# Scan / Queryに渡すことができるパラメータ
+DYNAMODB_REQUEST_PARAMETERS = (
+    "IndexName",
+    "KeyConditionExpression",
+    "FilterExpression",
+    "ProjectionExpression",
+    "ExpressionAttributeValues",
+    "ExpressionAttributeNames",
+    "ScanIndexForward",
+    "ExclusiveStartKey",
+    "ConsistentRead",
+    "Select",
+    "Segment",
+    "TotalSegments"
+)
+
+# BatchWriteItemで1回に書き込める件数
+BATCH_WRITE_MAX_ITEMS = 25
+
+# Todo登録時に必須のパラメータ
+TODO_REQUIRED_PARAMETERS = ("user_name", "name", "weight", "set", "clear_plan")
+
+# Todoの用途ごとに取得する属性
+TODO_PROJECTIONS = {
+    # 円グラフ・折れ線グラフ
+    "chart": ("name", "clear_date"),
+    # タイムライン
+    "timeline": ("id", "user_name", "name", "weight", "set", "clear_date", "comment"),
+    # トレーニングメニューの推移
+    "trend": ("id", "name", "weight", "set", "clear_plan", "clear_date")
+}
+
+# 集計(TodoAggregates)の属性名の接頭辞
+TODO_AGGREGATE_MENU_PREFIX = "menu#"
+TODO_AGGREGATE_DAY_PREFIX  = "day#"
+# 集計を全件から作り直した日時の属性。ADDで作られた(導入前の完了を含まない)集計と区別する
+TODO_AGGREGATE_BUILT_ATTRIBUTE   = "built_at"
+# 加算のたびに1増やす版数と、最後に加算した日時(UNIX時間)の属性。作り直した集計を条件つきで書き込むために使う
+TODO_AGGREGATE_VERSION_ATTRIBUTE = "version"
+TODO_AGGREGATE_UPDATED_ATTRIBUTE = "updated_at"
+
+# タイムライン(TimelineInbox)のフォロワー数上限超えのユーザを登録するパーティション
+TIMELINE_CELEBRITIES_PARTITION = "#celebrities"
+# フォロワー数上限超えのユーザがエントリを書き込むパーティションの接頭辞
+TIMELINE_OUTBOX_PREFIX         = "#outbox#"
+
+# スロットリング時に再試行するエラーコード
+THROTTLING_ERROR_CODES = (
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded"
+)
+
+# 再試行するエラーコード(スロットリング・一時的なサーバエラー)
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES + (
+    "InternalServerError",
+    "ServiceUnavailable"
+)
+
+# 再試行する通信エラー
+RETRYABLE_EXCEPTIONS = (
+    EndpointConnectionError,
+    ConnectionClosedError,
+    ReadTimeoutError,
+    ConnectTimeoutError
+)
+
+class TodoNotFoundError(Exception):
+    """
+    指定したidのTodoが存在しない場合の例外(ハンドラは404を返す)
+    """
+    pass
+
+class RetryPolicy():
+    """
+    DynamoDBの操作を再試行する方針
+    待機時間はジッター付きの指数バックオフ(0〜min(max_delay, base_delay * 2^attempt)の一様乱数)とする
+
+    以下のいずれかに該当する場合は再試行せずに例外を送出する
+    - 操作ごとの再試行回数がmax_retriesに達した
+    - 1回のハンドラ呼び出しでの再試行回数がinvocation_budgetに達した
+    - 待機するとLambdaの残り時間がtime_margin_msを下回る
+
+    Parameters
+    ----------
+    max_retries : int
+        操作ごとの再試行回数の上限
+    base_delay : float
+        待機時間の基準値(秒)
+    max_delay : float
+        待機時間の上限(秒)
+    invocation_budget : int
+        1回のハンドラ呼び出しでの再試行回数の上限。Noneの場合は無制限
+    time_margin_ms : float
+        再試行後に残しておくLambdaの実行時間(ミリ秒)
+    """
+    def __init__(self, max_retries=5, base_delay=0.05, max_delay=1.0, invocation_budget=50, time_margin_ms=500):
+        self.max_retries       = max_retries
+        self.base_delay        = base_delay
+        self.max_delay         = max_delay
+        self.invocation_budget = invocation_budget
+        self.time_margin_ms    = time_margin_ms
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            max_retries       = int(os.getenv("DYNAMODB_RETRY_MAX_RETRIES", "5")),
+            base_delay        = float(os.getenv("DYNAMODB_RETRY_BASE_DELAY", "0.05")),
+            max_delay         = float(os.getenv("DYNAMODB_RETRY_MAX_DELAY", "1.0")),
+            invocation_budget = int(os.getenv("DYNAMODB_RETRY_BUDGET", "50")),
+            time_margin_ms    = float(os.getenv("DYNAMODB_RETRY_TIME_MARGIN_MS", "500"))
+        )
+
+    def is_retryable(self, error):
+        """
+        再試行できるエラーか判定する
+        """
+        if isinstance(error, ClientError):
+            return error.response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+        return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+    def get_delay(self, attempt):
+        """
+        attempt回目(0始まり)の再試行までの待機時間を返す
+
+        Returns
+        -------
+        delay : float
+            待機時間(秒)。再試行できない場合はNone
+        """
+        if attempt >= self.max_retries:
+            return None
+        if self.invocation_budget is not None and invocation_metrics.get_counter("dynamodb_retries") >= self.invocation_budget:
+            logger.warn("Retry budget for this invocation is exhausted")
+            return None
+        delay   = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        context = invocation_metrics.context
+        if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+            if context.get_remaining_time_in_millis() - delay * 1000 < self.time_margin_ms:
+                logger.warn("Not enough time left to retry")
+                return None
+        return delay
+
+    def wait(self, attempt, description=""):
+        """
+        再試行まで待機する
+
+        Returns
+        -------
+        True : boolean
+            待機した(再試行してよい)場合
+        False : boolean
+            再試行できない場合
+        """
+        delay = self.get_delay(attempt)
+        if delay is None:
+            invocation_metrics.increment("dynamodb_retries_exhausted")
+            return False
+        logger.info("Retry {} after {:.3f}s (attempt {})".format(description, delay, attempt + 1))
+        invocation_metrics.increment("dynamodb_retries")
+        time.sleep(delay)
+        return True
+
+    def call(self, function, description=""):
+        """
+        functionを実行し、再試行できるエラーの場合は待機して再実行する
+        """
+        attempt = 0
+        while True:
+            try:
+                return function()
+            except Exception as e:
+                if not self.is_retryable(e) or not self.wait(attempt, description):
+                    raise
+                attempt += 1
+
+# DynamoDBの操作で共有する再試行の方針
+dynamodb_retry_policy = RetryPolicy.from_environment()
+
+# ウォームスタート間で共有するDynamoDBリソースのレジストリ
+dynamodb_registry = DynamodbResourceRegistry(config_factory=create_client_config)
+
+def get_scan_executor():
+    """
+    並列Scan・日付ごとのQueryで利用するスレッドプールを取得する(ウォームスタート間で使い回す)
+    """
+    return get_executor("dynamodb", int(os.getenv("DYNAMODB_SCAN_MAX_WORKERS", "8")))
+
+class DynamodbObject():
+    def __init__(self):
+        # リソースはレジストリで共有し、インスタンスごとには生成しない
+        self.dynamodb_table_name = ""
+        # 用途ごとに取得する属性(名前 -> 属性名の配列)
+        self.projections         = {}
+        # スロットリング時などの再試行の方針
+        self.retry_policy        = dynamodb_retry_policy
+        dynamodb_registry.get_resource()
+
+    @property
+    def dynamodb(self):
+        return dynamodb_registry.get_resource()
+
+    @property
+    def table(self):
+        return dynamodb_registry.get_table(self.dynamodb_table_name)
+
     def set_table(self,table_name):
         try:
             logger.debug("Table name is {}".format(table_name))
-            self.table = self.dynamodb.Table(table_name)
+            self.dynamodb_table_name = table_name
+            dynamodb_registry.get_table(table_name)
             logger.debug("Table name {} is exist".format(table_name))
         except ClientError as e:
             logger.warn(e)
@@ -48,7 +378,7 @@ class DynamodbObject():
             logger.warn(e)
             raise
     
-    def get_item(self, query={}):
+    def get_item(self, query={}, projection=None):
         """
         テーブルに対してScanをかけるメソッド。
         抽出条件(query)が指定されている場合はQueryをかける
@@ -57,6 +387,8 @@ class DynamodbObject():
         ------------
         query : Map
             クエリの条件
+        projection : string or tuple
+            取得する属性。self.projectionsに登録した名前、または属性名の配列
         Returns
         --------
          db_response : Dynamodb
@@ -64,14 +396,8 @@ class DynamodbObject():
         """
         try:
             logger.info("Query:{}".format(query))
-            if query:
-                db_response = self.table.scan(
-                    FilterExpression = query["FilterExpression"],
-                    ExpressionAttributeValues = query["ExpressionAttributeValues"],
-                    ExpressionAttributeNames  = query["ExpressionAttributeNames"]
-                )
-            else:
-                db_response = self.table.scan()
+            params      = self.with_projection(query, projection)
+            db_response = self.execute_operation("scan", **self.__build_request_params(params))
             return db_response
         except ClientError as e:
             logger.warn(e)
@@ -94,7 +420,7 @@ class DynamodbObject():
             DynamoDBのレスポンス
         """
         try:
-            result = self.table.query(
+            result = self.execute_operation("query",
                 KeyConditionExpression = key_condition_expression
             )
             return result
@@ -109,25 +435,13 @@ class DynamodbObject():
             logger.warn(e)
             raise
 
-    def get_item_from_gsi(self, params):
+    def get_item_from_gsi(self, params, projection=None):
         try:
             logger.debug("Query Params: {}".format(params))
             if "FilterExpression" in params:
                 logger.debug("Query has Fileter Expression. Filter {}".format(params["FilterExpression"]))
-                result = self.table.query(
-                    IndexName                 = params["IndexName"],
-                    KeyConditionExpression    = params["KeyConditionExpression"],
-                    FilterExpression          = params["FilterExpression"],
-                    ExpressionAttributeValues = params["ExpressionAttributeValues"],
-                    ExpressionAttributeNames  = params["ExpressionAttributeNames"]
-                )
-            else:
-                result = self.table.query(
-                    IndexName                 = params["IndexName"],
-                    KeyConditionExpression    = params["KeyConditionExpression"],
-                    ExpressionAttributeValues = params["ExpressionAttributeValues"],
-                    ExpressionAttributeNames  = params['ExpressionAttributeNames']
-                )
+            params = self.with_projection(params, projection)
+            result = self.execute_operation("query", **self.__build_request_params(params))
             return result
         except ClientError as e:
             logger.warn("ClientError is occured")
@@ -138,9 +452,120 @@ class DynamodbObject():
             logger.warn(e)
             raise
 
+    def with_projection(self, params, projection=None):
+        """
+        リクエストパラメータにProjectionExpressionを追加する
+        属性名は予約語(name, setなど)と衝突しないようにExpressionAttributeNamesで置き換える
+
+        Parameters
+        ----------
+        params : dict
+            Scan / Queryのパラメータ
+        projection : string or tuple
+            取得する属性。self.projectionsに登録した名前、または属性名の配列。Noneの場合は全属性
+
+        Returns
+        -------
+        params : dict
+            ProjectionExpressionを追加したパラメータ(引数のdictは変更しない)
+        """
+        if not projection:
+            return params
+        attributes = self.projections[projection] if isinstance(projection, str) else projection
+        params     = dict(params)
+        names      = dict(params.get("ExpressionAttributeNames") or {})
+        placeholders = []
+        for index, attribute in enumerate(attributes):
+            placeholder = "#proj{}".format(index)
+            names[placeholder] = attribute
+            placeholders.append(placeholder)
+        params["ProjectionExpression"]     = ", ".join(placeholders)
+        params["ExpressionAttributeNames"] = names
+        return params
+
+    def iter_scan(self, query={}, limit=None, page_size=None, projection=None):
+        """
+        テーブルに対してScanを実行し、LastEvaluatedKeyを辿りながら1件ずつ返すジェネレータ
+        ページは必要になった時点で取得するため、途中で打ち切った場合は以降のページを読まない
+
+        Parameters
+        ----------
+        query : dict
+            Scanの条件(FilterExpression, ExpressionAttributeValues, ExpressionAttributeNamesなど)
+        limit : int
+            返却する最大件数。Noneの場合は全件
+        page_size : int
+            1回のScanで評価する最大件数(DynamoDBのLimit)
+        projection : string or tuple
+            取得する属性。self.projectionsに登録した名前、または属性名の配列
+
+        Yields
+        ------
+        item : dict
+            テーブルのアイテム
+        """
+        logger.info("Scan Query:{}".format(query))
+        return self.__iter_items("scan", self.with_projection(query, projection), limit, page_size)
+
+    def iter_query(self, params, limit=None, page_size=None, projection=None):
+        """
+        テーブルまたはインデックスに対してQueryを実行し、LastEvaluatedKeyを辿りながら1件ずつ返すジェネレータ
+
+        Parameters
+        ----------
+        params : dict
+            Queryの条件(IndexName, KeyConditionExpression, FilterExpressionなど)
+        limit : int
+            返却する最大件数。Noneの場合は全件
+        page_size : int
+            1回のQueryで評価する最大件数(DynamoDBのLimit)
+        projection : string or tuple
+            取得する属性。self.projectionsに登録した名前、または属性名の配列
+
+        Yields
+        ------
+        item : dict
+            テーブルのアイテム
+        """
+        logger.debug("Query Params: {}".format(params))
+        return self.__iter_items("query", self.with_projection(params, projection), limit, page_size)
+
+    def parallel_scan(self, query={}, total_segments=None, max_workers=None, page_size=None, projection=None):
+        """
+        テーブルをSegment / TotalSegmentsで分割し、スレッドプールで並列にScanするジェネレータ
+        各セグメントの結果は取得した順に1つのストリームへまとめて返す(順序は保証しない)
+
+        Parameters
+        ----------
+        query : dict
+            Scanの条件(FilterExpression, ExpressionAttributeValues, ExpressionAttributeNamesなど)
+        total_segments : int
+            分割数。未指定の場合は環境変数DYNAMODB_SCAN_SEGMENTS(既定値4)
+        max_workers : int
+            同時に実行するセグメント数。未指定の場合はtotal_segmentsと同じ
+        page_size : int
+            1回のScanで評価する最大件数(DynamoDBのLimit)。スロットリング時はself.retry_policyで再試行する
+        projection : string or tuple
+            取得する属性。self.projectionsに登録した名前、または属性名の配列
+
+        Yields
+        ------
+        item : dict
+            テーブルのアイテム
+        """
+        total_segments = total_segments or int(os.getenv("DYNAMODB_SCAN_SEGMENTS", "4"))
+        max_workers    = min(max_workers or total_segments, total_segments)
+        logger.info("Parallel Scan Query:{} segments:{} workers:{}".format(query, total_segments, max_workers))
+        request_params = self.__build_request_params(self.with_projection(query, projection))
+        if page_size:
+            request_params["Limit"] = page_size
+        # ワーカーごとに担当するセグメントを割り当てる
+        worker_segments = [list(range(worker, total_segments, max_workers)) for worker in range(max_workers)]
+        return self.__merge_segments(worker_segments, total_segments, request_params)
+
     def put_one_item(self,item):
         try:
-            result = self.table.put_item(
+            result = self.execute_operation("put_item",
                 Item = item
             )
             return result
@@ -159,7 +584,7 @@ class DynamodbObject():
             if attribute_names:
                 logger.info("attirbute_names {}".format(attribute_names))
             logger.debug("Updating Item")
-            result = self.table.update_item(
+            result = self.execute_operation("update_item",
                 Key = key,
                 UpdateExpression = update_query,
                 ExpressionAttributeValues = attribute_values,
@@ -189,7 +614,7 @@ class DynamodbObject():
         """
 
         try:
-            delete_result = self.table.delete_item(
+            delete_result = self.execute_operation("delete_item",
                 Key = delete_parameter["key"]
             )
             return delete_result
@@ -201,6 +626,275 @@ class DynamodbObject():
             logger.warn("Some Expetion is Occured")
             logger.warn(e)
             raise
+    def get_one_item(self, key, projection=None, consistent_read=False):
+        """
+        キーを指定して1件のアイテムを取得する(GetItem)
+
+        Parameters
+        ----------
+        key : dict
+            アイテムのキー
+        projection : string or tuple
+            取得する属性。self.projectionsに登録した名前、または属性名の配列
+        consistent_read : boolean
+            強い整合性で読み込む場合はTrue
+
+        Returns
+        -------
+        item : dict
+            アイテム。存在しない場合はNone
+        """
+        try:
+            params = self.with_projection({}, projection)
+            if consistent_read:
+                params["ConsistentRead"] = True
+            result = self.execute_operation("get_item", Key=key, **params)
+            return result.get("Item")
+        except ClientError as e:
+            logger.warn(e)
+            raise
+        except Exception as e:
+            logger.warn(e)
+            raise
+
+    def transact_write(self, transact_items):
+        """
+        TransactWriteItemsで複数のアイテムをまとめて書き込む(全て成功するか、全て失敗する)
+        再試行しても二重に適用されないよう、ClientRequestTokenを付与する
+
+        Parameters
+        ----------
+        transact_items : list
+            {"Update": {...}} / {"Put": {...}} / {"ConditionCheck": {...}} の配列。
+            Key, Item, ExpressionAttributeValuesにはPythonの値をそのまま指定する
+
+        Returns
+        -------
+        result : dict
+            DynamoDBのレスポンス
+        """
+        from boto3.dynamodb.types import TypeSerializer
+        serializer = TypeSerializer()
+        requests   = []
+        for transact_item in transact_items:
+            for action, params in transact_item.items():
+                params = dict(params)
+                for attribute in ("Key", "Item", "ExpressionAttributeValues"):
+                    if attribute in params:
+                        params[attribute] = {name: serializer.serialize(value) for name, value in params[attribute].items()}
+                requests.append({action: params})
+        try:
+            return self.execute_operation("transact_write_items", target=dynamodb_registry.get_client(),
+                TransactItems = requests,
+                ClientRequestToken = uuid.uuid4().hex
+            )
+        except ClientError as e:
+            logger.warn("Transaction is Failed")
+            logger.warn(e)
+            raise
+
+    def batch_put_items(self, items):
+        """
+        BatchWriteItemで複数のアイテムを登録する
+        25件ずつに分割して書き込み、UnprocessedItemsはself.retry_policyに従って待機してから再送する
+
+        Parameters
+        ----------
+        items : list
+            登録するアイテムの配列
+
+        Returns
+        -------
+        unprocessed_items : list
+            再送しても登録できなかったアイテムの配列
+        """
+        requests = [{"PutRequest": {"Item": item}} for item in items]
+        return [request["PutRequest"]["Item"] for request, _ in self.__batch_write(requests)]
+
+    def try_batch_put_items(self, items):
+        """
+        BatchWriteItemで複数のアイテムを登録する。batch_put_itemsと異なり、チャンク(25件)の書き込みでエラーになっても
+        残りのチャンクを書き込み、書き込めなかったアイテムと理由を返す(呼び出し元がアイテムごとの結果を返す場合に使う)
+
+        Parameters
+        ----------
+        items : list
+            登録するアイテムの配列
+
+        Returns
+        -------
+        failed_items : list
+            書き込めなかった(アイテム, 理由)の配列
+        """
+        requests = [{"PutRequest": {"Item": item}} for item in items]
+        return [(request["PutRequest"]["Item"], message) for request, message in self.__batch_write(requests, continue_on_error=True)]
+
+    def batch_delete_items(self, keys):
+        """
+        BatchWriteItemで複数のアイテムを削除する
+
+        Parameters
+        ----------
+        keys : list
+            削除するアイテムのキーの配列
+
+        Returns
+        -------
+        unprocessed_keys : list
+            再送しても削除できなかったキーの配列
+        """
+        requests = [{"DeleteRequest": {"Key": key}} for key in keys]
+        return [request["DeleteRequest"]["Key"] for request, _ in self.__batch_write(requests)]
+
+    def execute_operation(self, operation_name, target=None, **params):
+        """
+        DynamoDBの操作を実行し、所要時間・件数・消費キャパシティを呼び出しごとの集計(metrics_layer)へ記録する
+        DynamoDBへのリクエストは全てこのメソッドを経由させる
+
+        スロットリングなどの一時的なエラーはself.retry_policyに従って再試行する
+
+        Parameters
+        ----------
+        operation_name : string
+            boto3のメソッド名(scan, query, put_item, update_item, delete_item, batch_write_itemなど)
+        target : object
+            操作を実行するTableまたはリソース。未指定の場合はself.table
+        params : dict
+            操作に渡すパラメータ
+
+        Returns
+        -------
+        response : dict
+            DynamoDBのレスポンス
+        """
+        target = self.table if target is None else target
+        params.setdefault("ReturnConsumedCapacity", "INDEXES")
+        description = "{} on {}".format(operation_name, self.dynamodb_table_name)
+        return self.retry_policy.call(lambda: self.__execute_once(target, operation_name, params), description)
+
+    #private method
+    def __batch_write(self, requests, continue_on_error=False):
+        # 25件ずつに分割して書き込み、UnprocessedItemsは再送する。書き込めなかったリクエストを(リクエスト, 理由)の配列で返す
+        # continue_on_errorの場合はエラーになったチャンクの残りを書き込めなかったものとして次のチャンクへ進む
+        # (それ以前のチャンクは書き込み済みのため、呼び出し元がアイテムごとの結果を返せるようにする)
+        failed_requests = []
+        for start in range(0, len(requests), BATCH_WRITE_MAX_ITEMS):
+            chunk   = requests[start:start + BATCH_WRITE_MAX_ITEMS]
+            attempt = 0
+            try:
+                while chunk:
+                    result = self.execute_operation("batch_write_item", target=self.dynamodb, RequestItems={self.dynamodb_table_name: chunk})
+                    chunk  = result.get("UnprocessedItems", {}).get(self.dynamodb_table_name, [])
+                    if not chunk:
+                        break
+                    if not self.retry_policy.wait(attempt, "{} unprocessed items".format(len(chunk))):
+                        logger.warn("{} items are unprocessed.".format(len(chunk)))
+                        failed_requests.extend((request, "item is unprocessed.") for request in chunk)
+                        break
+                    attempt += 1
+            except ClientError as e:
+                if not continue_on_error:
+                    raise
+                logger.warn("Batch write is Failed. {} items are not written".format(len(chunk)))
+                logger.warn(e)
+                failed_requests.extend((request, str(e)) for request in chunk)
+        return failed_requests
+
+    def __execute_once(self, target, operation_name, params):
+        # 再試行した場合も1回のリクエストごとに記録する
+        response   = None
+        started_at = time.perf_counter()
+        try:
+            response = getattr(target, operation_name)(**params)
+            return response
+        finally:
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            invocation_metrics.record_dynamodb_call(self.dynamodb_table_name, operation_name, elapsed_ms, response, params.get("IndexName"))
+
+    def __build_request_params(self, params):
+        request_params = {}
+        for param_name in DYNAMODB_REQUEST_PARAMETERS:
+            if param_name in params and params[param_name] not in ("", None, {}):
+                request_params[param_name] = params[param_name]
+        return request_params
+
+    def __iter_items(self, operation_name, params, limit=None, page_size=None):
+        request_params = self.__build_request_params(params)
+        returned_count = 0
+        while True:
+            if limit is not None and returned_count >= limit:
+                return
+            page_limit = page_size
+            if limit is not None and "FilterExpression" not in request_params:
+                # フィルタがない場合は残りの件数以上を読まない
+                remaining  = limit - returned_count
+                page_limit = min(page_limit, remaining) if page_limit else remaining
+            if page_limit:
+                request_params["Limit"] = page_limit
+            try:
+                db_response = self.execute_operation(operation_name, **request_params)
+            except ClientError as e:
+                logger.warn("ClientError is occured")
+                logger.warn(e)
+                raise
+            logger.debug("Page read. Count: {} ScannedCount: {}".format(db_response.get("Count"), db_response.get("ScannedCount")))
+            for item in db_response["Items"]:
+                yield item
+                returned_count += 1
+                if limit is not None and returned_count >= limit:
+                    return
+            if "LastEvaluatedKey" not in db_response:
+                return
+            request_params["ExclusiveStartKey"] = db_response["LastEvaluatedKey"]
+
+    def __merge_segments(self, worker_segments, total_segments, request_params):
+        # ページ単位で受け渡し、キューを有限にしてメモリ使用量を一定に保つ
+        page_queue   = queue.Queue(maxsize=len(worker_segments) * 2)
+        stop_event   = threading.Event()
+        executor     = get_scan_executor()
+        for segments in worker_segments:
+            executor.submit(self.__scan_segments, segments, total_segments, dict(request_params), page_queue, stop_event)
+        running_workers = len(worker_segments)
+        try:
+            while running_workers:
+                page = page_queue.get()
+                if page is None:
+                    running_workers -= 1
+                    continue
+                if isinstance(page, Exception):
+                    raise page
+                for item in page:
+                    yield item
+        finally:
+            # 呼び出し元が途中で読み込みをやめた場合はワーカーを止める
+            stop_event.set()
+
+    def __scan_segments(self, segments, total_segments, request_params, page_queue, stop_event):
+        try:
+            table = dynamodb_registry.get_table(self.dynamodb_table_name)
+            for segment in segments:
+                params = dict(request_params, Segment=segment, TotalSegments=total_segments)
+                while not stop_event.is_set():
+                    db_response = self.execute_operation("scan", target=table, **params)
+                    self.__put_page(page_queue, stop_event, db_response["Items"])
+                    if "LastEvaluatedKey" not in db_response:
+                        break
+                    params["ExclusiveStartKey"] = db_response["LastEvaluatedKey"]
+            self.__put_page(page_queue, stop_event, None)
+        except Exception as e:
+            logger.warn("Parallel scan is failed")
+            logger.warn(e)
+            self.__put_page(page_queue, stop_event, e)
+            self.__put_page(page_queue, stop_event, None)
+
+    def __put_page(self, page_queue, stop_event, page):
+        while not stop_event.is_set():
+            try:
+                page_queue.put(page, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
 class Todo(DynamodbObject):
     def __init__(self,env_str=""):
         super().__init__()
@@ -208,6 +902,17 @@ class Todo(DynamodbObject):
         self.atomic_counter = TodoAtomicCounter(env_str)
         self.clear_date_lsi = 'ClearDateLSIndex'
         self.user_name_gsi  = 'UserNameGSIndex'
+        # 完了日(YYYY-MM-DD)をパーティションキー、clear_dateをソートキーに持つスパースインデックス
+        self.clear_date_bucket_gsi = 'ClearDateBucketGSIndex'
+        self.projections    = TODO_PROJECTIONS
+        # ユーザごとのグラフ用の集計
+        self.aggregate      = TodoAggregate()
+
+    @property
+    def cache(self):
+        # ユーザごとの読み込み結果のキャッシュ(TODO_CACHE_BACKENDで切り替える)
+        # インスタンスはウォームスタート間で使い回すため、差し替えられたキャッシュに追従するよう都度取得する
+        return get_todo_cache()
 
     def get_all_todos(self,user_name=""):
         now            = datetime.now()
@@ -233,9 +938,11 @@ class Todo(DynamodbObject):
                     'ExpressionAttributeValues': exp_attribute_values,
                     'ExpressionAttributeNames':  exp_attribute_names
                 }
-                db_response = self.get_item_from_gsi(query)
-                logger.debug("Response: {}".format(db_response))
-                return db_response["Items"]
+                # 1MBを超える場合もページを辿って全件取得する
+                query_name = "all:{}".format(now.strftime('%Y-%m-%d'))
+                items = self.cache.get_or_load(user_name, query_name, lambda: list(self.iter_query(query)))
+                logger.debug("Response: {}".format(items))
+                return items
         except ClientError as e:
             logger.warn("DynamodbCall Failed")
             logger.warn(e)
@@ -245,63 +952,213 @@ class Todo(DynamodbObject):
             logger.warn(e)
             raise
     
-    def get_clear_todos_within_a_month(self, ago_days=0):
+    def get_clear_todos_in_bucket(self, bucket, gte_time_iso="", projection=None):
         """
-        今日の日付からから引数で受けっとった日数前のの完了ずみTodo一覧を取得するメソッド
+        1日分のパーティション(clear_date_bucket)から完了ずみTodoを取得するメソッド
 
         Parameters
-        ------------
-        ago_days : int
-            取得する期間(X日前)
+        ----------
+        bucket : string
+            完了日(YYYY-MM-DD)
+        gte_time_iso : string
+            この日時以降に完了したTodoのみ取得する(ISOフォーマット)
+        projection : string or tuple
+            取得する属性。TODO_PROJECTIONSの名前、または属性名の配列
+
         Returns
         -------
         clear_todos : list
             完了ずみTodoの配列
         """
-        try:
-            today                    = datetime.now()
-            gte_time_iso        = self.__convert_isoformat_string_from_datetime(today + timedelta(days = ago_days))
-            filter_expression = "#ClearD >= :T1"
-            ex_attribute_values      = {
-                ':T1': gte_time_iso
-            }
-            ex_attibute_names        = {
-                '#ClearD': 'clear_date'
-            }
-            query                    = {
-                'FilterExpression': filter_expression,
-                'ExpressionAttributeValues': ex_attribute_values,
-                'ExpressionAttributeNames': ex_attibute_names
-            }
-            db_response              = self.get_item(query=query)
-            logger.debug("response {}".format(db_response))
+        key_condition_exp    = '#B = :b'
+        exp_attribute_values = {
+            ':b': bucket
+        }
+        exp_attribute_names  = {
+            '#B': 'clear_date_bucket'
+        }
+        if gte_time_iso:
+            key_condition_exp += ' AND #ClearD >= :T1'
+            exp_attribute_values[':T1'] = gte_time_iso
+            exp_attribute_names['#ClearD'] = 'clear_date'
+        params = {
+            'IndexName':                 self.clear_date_bucket_gsi,
+            'KeyConditionExpression':    key_condition_exp,
+            'ExpressionAttributeValues': exp_attribute_values,
+            'ExpressionAttributeNames':  exp_attribute_names
+        }
+        return list(self.iter_query(params, projection=projection))
 
-            return db_response["Items"]
-        except Exception as e:
-            logger.warn("Failed.")
-            raise
+    def iter_clear_todos_newest_first(self, ago_days=0, before=None, projection=None, concurrency=None):
+        """
+        今日の日付から引数で受け取った日数前までの完了ずみTodoを、(clear_date, id)の新しい順に返すジェネレータ
+        完了日のパーティションを新しい日から読み込み、1日, 2日, 4日...と最大concurrency日分のQueryを並行に先読みする
+        途中で打ち切った場合は、先読みした範囲より前の日を読まない
+
+        Parameters
+        ----------
+        ago_days : int
+            取得する期間(X日前)
+        before : tuple
+            (clear_date, id)。指定した場合はこれより前のTodoのみ返す(ページングのカーソル)
+        projection : string or tuple
+            取得する属性。id, clear_dateを含める
+        concurrency : int
+            並行に読み込む日数の上限。未指定の場合は環境変数CLEAR_DATE_BUCKET_CONCURRENCY(既定値4)
+
+        Yields
+        ------
+        todo : dict
+            完了ずみTodo
+        """
+        concurrency  = concurrency or int(os.getenv("CLEAR_DATE_BUCKET_CONCURRENCY", "4"))
+        today        = datetime.now()
+        gte_time     = today + timedelta(days = ago_days)
+        gte_time_iso = self.__convert_isoformat_string_from_datetime(gte_time)
+        before_key   = (before[0], int(before[1])) if before else None
+        buckets      = [bucket for bucket in self.get_clear_date_buckets(gte_time, today)
+                        if not (before_key and bucket > before_key[0][:10])]
+        window_size  = 1
+        position     = 0
+        while position < len(buckets):
+            window   = buckets[position:position + window_size]
+            position += len(window)
+            # 1ページが1日で埋まる場合に余分に読まないよう、先読みの日数は倍々に増やす
+            window_size = min(window_size * 2, max(1, concurrency))
+            # 並列Scanと同じDynamoDB用のプールで読み込む(ハンドラのタスクの中から呼ばれても詰まらない)
+            get_scan_executor()
+            results = run_concurrently({
+                bucket: (lambda bucket=bucket: self.get_clear_todos_in_bucket(bucket, gte_time_iso, projection)) for bucket in window
+            }, executor_name="dynamodb")
+            for bucket in window:
+                # 完了日は日付単位のため、同じ日のTodoはidで並べる
+                items = results[bucket]
+                items.sort(key=lambda item: (item["clear_date"], int(item["id"])), reverse=True)
+                for item in items:
+                    if before_key and (item["clear_date"], int(item["id"])) >= before_key:
+                        continue
+                    yield item
+
+    def get_clear_date_buckets(self, start_datetime, end_datetime):
+        """
+        期間に含まれる完了日のパーティション(YYYY-MM-DD)を新しい順に返す
+        """
+        buckets      = []
+        current_date = end_datetime.date()
+        while current_date >= start_datetime.date():
+            buckets.append(current_date.strftime('%Y-%m-%d'))
+            current_date -= timedelta(days = 1)
+        return buckets
 
     def put_todo(self, todo):
         try:
             sequence_number = self.atomic_counter.countup_atomic_counter()
-            todo['id'] = int(sequence_number)
-            #完了予定日のフォーマットをISOに変換
-            complete_plan_date = datetime.strptime(todo['clear_plan'], '%Y-%m-%d')
-            todo['clear_plan'] = self.__convert_isoformat_string_from_datetime(complete_plan_date)
-            # データ登録日算出
-            todo['created_at'] = self.__convert_isoformat_string_from_datetime(datetime.now())
-            todo['clear_date'] = "0"
+            todo = self.__build_todo_item(todo, sequence_number, datetime.now())
             #データ登録
             logger.debug("Start Put Item. Item: {}".format(todo))
             result = self.put_one_item(todo)
             logger.debug("Result {}".format(result))
+            self.__invalidate_cache(todo["user_name"])
             return todo
         except ClientError:
             raise
         except Exception:
             raise
-    
+
+    def put_todos(self, todos):
+        """
+        複数のTodoをまとめて登録するメソッド
+        全件を検証したうえで、有効なTodoの件数分のIDを一度に採番し、BatchWriteItemで書き込む
+
+        Parameters
+        ----------
+        todos : list
+            登録するTodoの配列
+
+        Returns
+        -------
+        results : list
+            Todoごとの登録結果。status(created / invalid / failed)と登録データまたはエラー内容を持つ
+        """
+        results      = [None] * len(todos)
+        valid_todos  = []
+        for index, todo in enumerate(todos):
+            message = self.validate_todo(todo)
+            if message:
+                results[index] = {"index": index, "status": "invalid", "message": message}
+            else:
+                valid_todos.append((index, todo))
+        if not valid_todos:
+            return results
+        items = []
+        try:
+            sequence_numbers = self.atomic_counter.id_allocator.allocate(len(valid_todos))
+            now              = datetime.now()
+            for (index, todo), sequence_number in zip(valid_todos, sequence_numbers):
+                todo_item = {
+                    "user_name": todo["user_name"],
+                    "name": todo["name"],
+                    "weight": int(todo["weight"]),
+                    "set": int(todo["set"]),
+                    "clear_plan": todo["clear_plan"],
+                    "is_cleared": False
+                }
+                item = self.__build_todo_item(todo_item, sequence_number, now)
+                items.append(item)
+                results[index] = {"index": index, "status": "created", "item": item}
+            logger.debug("Start Batch Write. {} items".format(len(items)))
+            # チャンクの書き込みに失敗しても、書き込めたTodoはcreatedとして返す
+            failures = {item["id"]: message for item, message in self.try_batch_put_items(items)}
+            for result in results:
+                if result["status"] == "created" and result["item"]["id"] in failures:
+                    result.update({"status": "failed", "message": failures[result["item"]["id"]]})
+                    del result["item"]
+            return results
+        except ClientError as e:
+            logger.warn("Batch write is Failed")
+            logger.warn(e)
+            raise
+        except Exception as e:
+            logger.warn("Batch write is Failed")
+            logger.warn(e)
+            raise
+        finally:
+            # 一部のみ書き込んだ場合も古い読み込み結果を返さないように、例外時も無効化する
+            for user_name in {item["user_name"] for item in items}:
+                self.__invalidate_cache(user_name)
+
+    def validate_todo(self, todo):
+        """
+        登録するTodoのパラメータを検証するメソッド
+
+        Parameters
+        ----------
+        todo : dict
+            登録するTodo
+
+        Returns
+        -------
+        message : string
+            不正な場合はその理由。正常な場合は空文字
+        """
+        if not isinstance(todo, dict):
+            return "todo is not object."
+        for param_key in TODO_REQUIRED_PARAMETERS:
+            if param_key not in todo:
+                return "{} is not exist in post parameter".format(param_key)
+        try:
+            int(todo["weight"])
+            int(todo["set"])
+            datetime.strptime(todo["clear_plan"], '%Y-%m-%d')
+        except (TypeError, ValueError) as e:
+            return str(e)
+        return ""
+
     def update_todo(self, todo):
+        """
+        Todoを更新するメソッド
+        完了ずみTodoのメニュー名を変更する場合は、集計(TodoAggregates)のメニューごとの件数も同じトランザクションで付け替える
+        """
         try:
             #文字列をdate型に変換する
             clear_plan       = datetime.strptime(todo['clear_plan'], '%Y-%m-%d')
@@ -322,8 +1179,31 @@ class Todo(DynamodbObject):
                 '#N': 'name'
             }
 
-            # データの更新
-            update_response = self.updateItem(key, update_query, attribute_values, attribute_names)
+            # 集計の付け替えが必要か確認するため、現在のメニュー名と完了日を取得する
+            current_todo = self.get_one_item(key, projection=("user_name", "name", "clear_date"))
+            if current_todo and current_todo.get("clear_date", "0") != "0" and current_todo.get("name") != todo['name']:
+                increments = {
+                    self.aggregate.menu_attribute(current_todo["name"]): -1,
+                    self.aggregate.menu_attribute(todo['name']): 1
+                }
+                update_response = self.transact_write([
+                    {"Update": {
+                        "TableName": self.dynamodb_table_name,
+                        "Key": key,
+                        "UpdateExpression": update_query,
+                        "ConditionExpression": "#N = :old_n",
+                        "ExpressionAttributeNames": attribute_names,
+                        "ExpressionAttributeValues": dict(attribute_values, **{':old_n': current_todo["name"]})
+                    }},
+                    {"Update": self.aggregate.build_count_update(current_todo["user_name"], increments)}
+                ])
+            else:
+                # データの更新
+                update_response = self.updateItem(key, update_query, attribute_values, attribute_names)
+            if current_todo and "user_name" in current_todo:
+                self.__invalidate_cache(current_todo["user_name"])
+            if "user_name" in todo:
+                self.__invalidate_cache(todo["user_name"])
             logger.debug("Response is in the below.")
             logger.debug(update_response)
 
@@ -344,23 +1224,83 @@ class Todo(DynamodbObject):
             logger.warn("Some error is occured.")
             raise
     def complete_todo(self, todo):
+        """
+        Todoを完了にするメソッド
+        Todoの更新と集計(TodoAggregates)のメニュー・完了日ごとの件数の加算を1つのトランザクションで書き込む
+        完了ずみのTodoの完了日を変更する場合は、以前の完了日の件数を減らす
+
+        Parameters
+        ----------
+        todo : dict
+            id, clear_date(YYYY-MM-DD), commentを持つ辞書
+
+        Returns
+        -------
+        complete_response : dict
+            更新後の属性(Attributes)
+
+        Raises
+        ------
+        TodoNotFoundError
+            idのTodoが存在しない場合
+        ValueError
+            clear_dateがYYYY-MM-DDでない場合
+        """
         try:
             # 文字列をdate型に変換
             complete_date = datetime.strptime(todo["clear_date"], '%Y-%m-%d')
+            clear_date    = self.__convert_isoformat_string_from_datetime(complete_date)
+            clear_day     = complete_date.strftime('%Y-%m-%d')
             key = {
                 'id': todo["id"],
             }
-            update_query = "set is_cleared= :i, clear_date= :c, #com= :com"
+            # 集計に必要なユーザ名・メニュー名・以前の完了日を取得する
+            current_todo = self.get_one_item(key, projection=("user_name", "name", "clear_date"))
+            if current_todo is None:
+                raise TodoNotFoundError("todo(id:{}) is not found".format(todo["id"]))
+            update_query = "set is_cleared= :i, clear_date= :c, #com= :com, #B= :b"
             attribute_values = {
                 ':i': True,
-                ':c': self.__convert_isoformat_string_from_datetime(complete_date),
-                ':com': todo["comment"]
+                ':c': clear_date,
+                ':com': todo["comment"],
+                ':b': clear_day
             }
             attribute_names = {
-                '#com': 'comment'
+                '#com': 'comment',
+                '#B': 'clear_date_bucket',
+                '#ClearD': 'clear_date'
             }
+            # 読み込んだ後に他のリクエストで完了日が変わっていた場合はトランザクションを失敗させる
+            if "clear_date" in current_todo:
+                condition_expression = "#ClearD = :old_c"
+                attribute_values[':old_c'] = current_todo["clear_date"]
+            else:
+                condition_expression = "attribute_not_exists(#ClearD)"
+            transact_items = [{"Update": {
+                "TableName": self.dynamodb_table_name,
+                "Key": key,
+                "UpdateExpression": update_query,
+                "ConditionExpression": condition_expression,
+                "ExpressionAttributeNames": attribute_names,
+                "ExpressionAttributeValues": attribute_values
+            }}]
+            aggregate_update = self.aggregate.build_count_update(
+                current_todo["user_name"],
+                self.aggregate.get_complete_increments(current_todo.get("name"), current_todo.get("clear_date", "0"), clear_day)
+            )
+            if aggregate_update:
+                transact_items.append({"Update": aggregate_update})
             logger.debug("Change Status Complete")
-            complete_response = self.updateItem(key, update_query, attribute_values, attribute_names)
+            self.transact_write(transact_items)
+            self.__invalidate_cache(current_todo["user_name"])
+            complete_response = {
+                "Attributes": {
+                    "is_cleared": True,
+                    "clear_date": clear_date,
+                    "comment": todo["comment"],
+                    "clear_date_bucket": clear_day
+                }
+            }
             logger.debug(complete_response)
             return complete_response
         except ClientError as e:
@@ -371,7 +1311,45 @@ class Todo(DynamodbObject):
             logger.warn(e)
             raise
     
-    def get_muscle_menu_data(self, user_name, menu_name):
+    def get_clear_todos_for_chart(self, user_name):
+        """
+        グラフ用に、ユーザの完了ずみTodoの名前と完了日のみを取得するメソッド
+
+        Parameters
+        ----------
+        user_name : string
+            ユーザ名
+
+        Returns
+        -------
+        clear_todos : list
+            name, clear_dateのみを持つ完了ずみTodoの配列
+        """
+        try:
+            params = {
+                "IndexName": 'UserNameCreatedGSIndex',
+                "KeyConditionExpression": '#UN = :un',
+                "FilterExpression": '#ClearD > :zero',
+                "ExpressionAttributeNames": {
+                    '#UN': 'user_name',
+                    '#ClearD': 'clear_date'
+                },
+                "ExpressionAttributeValues": {
+                    ':un': user_name,
+                    ':zero': '0'
+                }
+            }
+            return self.cache.get_or_load(user_name, "chart", lambda: list(self.iter_query(params, projection="chart")))
+        except ClientError as e:
+            logger.warn("ClientError is occured. Reason is in the below")
+            logger.warn(e)
+            raise
+        except Exception as e:
+            logger.warn("Some error is occured. Reason in the below")
+            logger.warn(e)
+            raise
+
+    def get_muscle_menu_data(self, user_name, menu_name, projection=None):
         try:
             # Query
             index_name           = 'UserNameCreatedGSIndex'
@@ -397,8 +1375,8 @@ class Todo(DynamodbObject):
                 "ExpressionAttributeValues": exp_attribute_values
             }
             logger.debug("Query Start. pamras {}".format(params))
-            db_response = self.get_item_from_gsi(params)
-            return db_response["Items"]
+            query_name = "menu:{}:{}".format(menu_name, projection)
+            return self.cache.get_or_load(user_name, query_name, lambda: list(self.iter_query(params, projection=projection)))
         except ClientError as e:
             logger.warn("ClientError is occured. Reason is in the below")
             logger.warn(e)
@@ -414,6 +1392,24 @@ class Todo(DynamodbObject):
             return float(obj)
         raise TypeError
     
+    def __invalidate_cache(self, user_name):
+        # キャッシュの障害で書き込みを失敗させない(古いデータはTTLで消える)
+        try:
+            self.cache.invalidate(user_name)
+        except Exception as e:
+            logger.warn("Failed invalidating todo cache")
+            logger.warn(e)
+
+    def __build_todo_item(self, todo, sequence_number, created_at):
+        todo['id'] = int(sequence_number)
+        #完了予定日のフォーマットをISOに変換
+        complete_plan_date = datetime.strptime(todo['clear_plan'], '%Y-%m-%d')
+        todo['clear_plan'] = self.__convert_isoformat_string_from_datetime(complete_plan_date)
+        # データ登録日算出
+        todo['created_at'] = self.__convert_isoformat_string_from_datetime(created_at)
+        todo['clear_date'] = "0"
+        return todo
+
     def __convert_isoformat_string_from_datetime(self, dt):
         return dt.isoformat(timespec='microseconds')
 
@@ -422,34 +1418,397 @@ class Todo(DynamodbObject):
         dt = datetime.fromtimestamp(float_timestamp)
         return dt.strftime("%Y-%m-%d")
 
-    def __group_by_items(self,items, key_attribute):
-        group_item_object = {}
-        items.sort(key = lambda item: item[key_attribute])
-        gropuby_items = groupby(items, key=lambda item: item[key_attribute])
-        for key, group in gropuby_items:
-            # 要素数を出すためにlistへ変換
-            group_list = list(group)
-            group_data_obj = {
-                key: len(group_list)
-            }
-            group_item_object.update(group_data_obj)
-        return group_item_object
-
     def __convert_decimal_from_string_to_input_dynamodb(self,string_datetime):
         tdatetime = datetime.strptime(string_datetime, '%Y-%m-%d')
         decimal_timestamp = Decimal(tdatetime.timestamp())
         return decimal_timestamp
 
+class TodoAggregate(DynamodbObject):
+    """
+    ユーザごとのグラフ用の集計を1アイテムで保持するテーブル(TodoAggregates, パーティションキー: user_name)
+
+    完了ずみTodoの件数をメニュー名ごと(menu#<メニュー名>)・完了日ごと(day#<YYYY-MM-DD>)の
+    トップレベルの数値属性で持ち、Todo.complete_todoがUpdateItemのADDで加算する
+    (ADDはネストした属性に使えないため、マップではなく接頭辞つきの属性にする)
+
+    ADDはアイテムがない場合に新しい件数だけのアイテムを作るため、全件から作り直した集計のみ
+    built_atを持つ。built_atがない集計は以前の完了を含まないため、読み込み側は全件から集計し、
+    その結果を集計として書き込む(次回からは集計を1件読むだけになる)
+
+    加算はversionを1増やし、updated_atを更新する。全件から作り直した集計は、完了ずみTodoを読む前に取得した
+    versionから変わっていない場合のみ書き込む(put_built_item)。完了ずみTodoはGSIから読み込むため、
+    最後の加算からsettle_seconds以内の集計は、加算した完了がまだ読めない可能性があるとして書き込まない
+    """
+    def __init__(self):
+        super().__init__()
+        self.set_table(os.getenv("TODO_AGGREGATES_TABLE", "TodoAggregates"))
+        self.settle_seconds = float(os.getenv("TODO_AGGREGATE_SETTLE_SECONDS", "5"))
+
+    def menu_attribute(self, menu_name):
+        return TODO_AGGREGATE_MENU_PREFIX + menu_name
+
+    def day_attribute(self, clear_day):
+        return TODO_AGGREGATE_DAY_PREFIX + clear_day
+
+    def get_complete_increments(self, menu_name, old_clear_date, clear_day):
+        """
+        Todoを完了にした時に加算する件数を返す
+
+        Parameters
+        ----------
+        menu_name : string
+            メニュー名
+        old_clear_date : string
+            以前の完了日(ISOフォーマット)。未完了の場合は"0"
+        clear_day : string
+            新しい完了日(YYYY-MM-DD)
+
+        Returns
+        -------
+        increments : dict
+            属性名 -> 加算する件数
+        """
+        if not old_clear_date or old_clear_date == "0":
+            return {
+                self.menu_attribute(menu_name): 1,
+                self.day_attribute(clear_day): 1
+            }
+        old_clear_day = old_clear_date[:10]
+        if old_clear_day == clear_day:
+            return {}
+        return {
+            self.day_attribute(old_clear_day): -1,
+            self.day_attribute(clear_day): 1
+        }
+
+    def build_count_update(self, user_name, increments):
+        """
+        件数を加算するUpdate(TransactWriteItemsの要素)を生成する
+
+        Parameters
+        ----------
+        user_name : string
+            ユーザ名
+        increments : dict
+            属性名 -> 加算する件数
+
+        Returns
+        -------
+        update : dict
+            TransactWriteItemsのUpdate。加算する件数がない場合はNone
+        """
+        actions          = []
+        attribute_names  = {}
+        attribute_values = {}
+        for index, (attribute, increment) in enumerate(sorted(increments.items())):
+            if increment == 0:
+                continue
+            attribute_names["#a{}".format(index)]  = attribute
+            attribute_values[":a{}".format(index)] = increment
+            actions.append("#a{} :a{}".format(index, index))
+        if not actions:
+            return None
+        # 作り直しと競合したことが分かるように版数と加算日時を更新する
+        attribute_names["#ver"]  = TODO_AGGREGATE_VERSION_ATTRIBUTE
+        attribute_names["#upd"]  = TODO_AGGREGATE_UPDATED_ATTRIBUTE
+        attribute_values[":one"] = 1
+        attribute_values[":upd"] = int(time.time())
+        actions.append("#ver :one")
+        return {
+            "TableName": self.dynamodb_table_name,
+            "Key": {"user_name": user_name},
+            "UpdateExpression": "ADD " + ", ".join(actions) + " SET #upd = :upd",
+            "ExpressionAttributeNames": attribute_names,
+            "ExpressionAttributeValues": attribute_values
+        }
+
+    def get_chart_data(self, user_name):
+        """
+        グラフ用の集計を取得する
+
+        Parameters
+        ----------
+        user_name : string
+            ユーザ名
+
+        Returns
+        -------
+        chart_data : dict
+            pie(メニュー名 -> 件数), line(完了日 -> 件数)をキーの昇順で持つ辞書。
+            集計が存在しない、または全件から作り直されていない(built_atがない)場合はNone
+        """
+        item = self.get_aggregate_item(user_name)
+        if not self.is_built(item):
+            return None
+        return self.convert_chart_data(item)
+
+    def get_aggregate_item(self, user_name, consistent_read=False):
+        """
+        ユーザの集計のアイテムを取得する。存在しない場合はNone
+        """
+        return self.get_one_item({"user_name": user_name}, consistent_read=consistent_read)
+
+    def is_built(self, item):
+        """
+        集計のアイテムが全件から作り直されたものか(以前の完了を含むか)を返す
+        """
+        return item is not None and TODO_AGGREGATE_BUILT_ATTRIBUTE in item
+
+    def get_settle_wait(self, item):
+        """
+        最後の加算からsettle_secondsが経つまでの秒数を返す(経っている場合は0)
+        """
+        if item is None or TODO_AGGREGATE_UPDATED_ATTRIBUTE not in item:
+            return 0.0
+        return max(0.0, float(item[TODO_AGGREGATE_UPDATED_ATTRIBUTE]) + self.settle_seconds - time.time())
+
+    def put_built_item(self, item, current_item):
+        """
+        全件から作り直した集計を、完了ずみTodoを読む前に取得した集計から加算されていない場合のみ書き込む
+
+        Parameters
+        ----------
+        item : dict
+            build_aggregate_itemで作り直した集計
+        current_item : dict
+            完了ずみTodoを読む前に取得した集計。存在しない場合はNone
+
+        Returns
+        -------
+        is_written : boolean
+            書き込んだ場合はTrue。加算と競合した、または最後の加算から間もない場合はFalse
+        """
+        if self.get_settle_wait(current_item) > 0:
+            logger.info("Aggregate of {} was updated recently. Skip writing".format(item["user_name"]))
+            return False
+        attribute_names  = {"#UN": "user_name"}
+        attribute_values = {}
+        item = dict(item)
+        if current_item is None:
+            condition_expression = "attribute_not_exists(#UN)"
+            item[TODO_AGGREGATE_VERSION_ATTRIBUTE] = 0
+        elif TODO_AGGREGATE_VERSION_ATTRIBUTE in current_item:
+            condition_expression = "#V = :v"
+            attribute_names["#V"]  = TODO_AGGREGATE_VERSION_ATTRIBUTE
+            attribute_values[":v"] = current_item[TODO_AGGREGATE_VERSION_ATTRIBUTE]
+            item[TODO_AGGREGATE_VERSION_ATTRIBUTE] = current_item[TODO_AGGREGATE_VERSION_ATTRIBUTE]
+        else:
+            # 版数の導入前に作られた集計
+            condition_expression = "attribute_exists(#UN) AND attribute_not_exists(#V)"
+            attribute_names["#V"] = TODO_AGGREGATE_VERSION_ATTRIBUTE
+            item[TODO_AGGREGATE_VERSION_ATTRIBUTE] = 0
+        params = {
+            "Item": item,
+            "ConditionExpression": condition_expression,
+            "ExpressionAttributeNames": attribute_names
+        }
+        if attribute_values:
+            params["ExpressionAttributeValues"] = attribute_values
+        try:
+            self.execute_operation("put_item", **params)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                logger.warn(e)
+                raise
+            logger.info("Aggregate of {} was updated while rebuilding. Skip writing".format(item["user_name"]))
+            return False
+
+    def rebuild(self, user_name, load_clear_todos, retries=3, built_at=None):
+        """
+        ユーザの集計を全件から作り直して書き込む。加算と競合した場合は読み直して再試行する
+
+        Parameters
+        ----------
+        user_name : string
+            ユーザ名
+        load_clear_todos : function
+            ユーザ名を受け取り、name, clear_dateを持つ完了ずみTodoの配列を返す関数
+        retries : int
+            競合した場合の再試行回数
+        built_at : string
+            作り直した日時(ISOフォーマット)。未指定の場合は現在日時
+
+        Returns
+        -------
+        item : dict
+            書き込んだ集計。再試行しても書き込めなかった場合はNone
+        """
+        for attempt in range(retries + 1):
+            current_item = self.get_aggregate_item(user_name, consistent_read=True)
+            settle_wait  = self.get_settle_wait(current_item)
+            if settle_wait > 0:
+                # 直近の加算がGSIに反映されるまで待ってから読み直す
+                time.sleep(settle_wait)
+                current_item = self.get_aggregate_item(user_name, consistent_read=True)
+                if self.get_settle_wait(current_item) > 0:
+                    continue
+            item = self.build_aggregate_item(user_name, load_clear_todos(user_name), built_at=built_at)
+            if self.put_built_item(item, current_item):
+                return item
+            logger.info("Retrying rebuild of {} ({}/{})".format(user_name, attempt + 1, retries))
+        return None
+
+    def convert_chart_data(self, item):
+        pie_data  = {}
+        line_data = {}
+        for attribute in sorted(item):
+            count = int(item[attribute]) if isinstance(item[attribute], (int, Decimal)) else 0
+            # 付け替えで0件になった属性は返さない
+            if count <= 0:
+                continue
+            if attribute.startswith(TODO_AGGREGATE_MENU_PREFIX):
+                pie_data[attribute[len(TODO_AGGREGATE_MENU_PREFIX):]] = count
+            elif attribute.startswith(TODO_AGGREGATE_DAY_PREFIX):
+                line_data[attribute[len(TODO_AGGREGATE_DAY_PREFIX):]] = count
+        return {
+            "pie": pie_data,
+            "line": line_data
+        }
+
+    def build_aggregate_item(self, user_name, clear_todos, built_at=None):
+        """
+        完了ずみTodoの配列から集計のアイテムを作り直す(rebuildツール・get_graph_dataの集計の作成用)
+
+        Parameters
+        ----------
+        user_name : string
+            ユーザ名
+        clear_todos : iterable
+            name, clear_dateを持つ完了ずみTodo
+        built_at : string
+            作り直した日時(ISOフォーマット)。未指定の場合は現在日時
+
+        Returns
+        -------
+        item : dict
+            TodoAggregatesのアイテム
+        """
+        counts = count_by(clear_todos, {"menu": "name", "day": lambda todo: todo["clear_date"][:10]}, order=ORDER_FIRST)
+        item   = {"user_name": user_name, TODO_AGGREGATE_BUILT_ATTRIBUTE: built_at or datetime.now().isoformat(timespec="seconds")}
+        item.update((self.menu_attribute(menu_name), count) for menu_name, count in counts["menu"].items())
+        item.update((self.day_attribute(clear_day), count) for clear_day, count in counts["day"].items())
+        return item
+
+class IdBlockAllocator():
+    """
+    アトミックカウンタからIDをブロック単位で予約し、プロセス内で払い出すクラス
+    予約はカウンタへのADDで行うため、コンテナが同時に予約してもブロックは重複しない
+    (コンテナが破棄された場合、使い切らなかったIDは欠番になる)
+
+    ブロックサイズは直近のブロックを使い切るまでの払い出し速度から決め、
+    target_block_secondsの間に払い出す件数を目安にmin_block_size〜max_block_sizeの範囲で調整する
+
+    Parameters
+    ----------
+    reserve_function : function
+        予約する件数を受け取り、予約後のカウンタの値(ブロックの最後のID)を返す関数
+    min_block_size : int
+        ブロックサイズの最小値
+    max_block_size : int
+        ブロックサイズの最大値
+    target_block_seconds : float
+        1ブロックを使い切るまでの目標時間(秒)
+    """
+    def __init__(self, reserve_function, min_block_size=1, max_block_size=100, target_block_seconds=10):
+        self.reserve_function     = reserve_function
+        self.min_block_size       = max(1, min_block_size)
+        self.max_block_size       = max(self.min_block_size, max_block_size)
+        self.target_block_seconds = target_block_seconds
+        self.block_size           = self.min_block_size
+        self._next_id             = 0
+        self._last_id             = -1
+        self._reserved_at         = None
+        self._reserved_size       = 0
+        self._lock                = threading.Lock()
+
+    def allocate(self, count=1):
+        """
+        IDを払い出す
+
+        Parameters
+        ----------
+        count : int
+            払い出す件数
+
+        Returns
+        -------
+        ids : list
+            払い出したIDの配列
+        """
+        ids = []
+        with self._lock:
+            while len(ids) < count:
+                if self._next_id > self._last_id:
+                    self.__reserve_block(count - len(ids))
+                ids.append(self._next_id)
+                self._next_id += 1
+        return ids
+
+    def allocate_one(self):
+        """
+        IDを1件払い出す
+        """
+        return self.allocate(1)[0]
+
+    #private method
+    def __reserve_block(self, required_count):
+        now = time.monotonic()
+        if self._reserved_at is not None:
+            # 直近のブロックを使い切るまでの速度からブロックサイズを見直す
+            elapsed         = max(now - self._reserved_at, 0.001)
+            rate            = self._reserved_size / elapsed
+            self.block_size = int(min(self.max_block_size, max(self.min_block_size, rate * self.target_block_seconds)))
+        reserve_size = max(self.block_size, required_count)
+        last_id      = int(self.reserve_function(reserve_size))
+        logger.debug("Reserved id block. last_id: {} size: {}".format(last_id, reserve_size))
+        self._next_id       = last_id - reserve_size + 1
+        self._last_id       = last_id
+        self._reserved_at   = now
+        self._reserved_size = reserve_size
+
+# カウンタ名ごとのID払い出しオブジェクト(ウォームスタート間で共有する)
+_id_allocators      = {}
+_id_allocators_lock = threading.Lock()
+
 class AtomicCounter(DynamodbObject):
     def __init__(self, env_str="", table_name=""):
         super().__init__()
         self.table_name = table_name
         self.set_table("MuscleAtomicCounter")
+        with _id_allocators_lock:
+            if table_name not in _id_allocators:
+                _id_allocators[table_name] = IdBlockAllocator(
+                    self.reserve_atomic_counter,
+                    min_block_size       = int(os.getenv("ATOMIC_COUNTER_MIN_BLOCK_SIZE", "1")),
+                    max_block_size       = int(os.getenv("ATOMIC_COUNTER_MAX_BLOCK_SIZE", "100")),
+                    target_block_seconds = float(os.getenv("ATOMIC_COUNTER_BLOCK_SECONDS", "10"))
+                )
+            self.id_allocator = _id_allocators[table_name]
     
     def countup_atomic_counter(self):
+        """
+        採番したIDを1件返す。カウンタの更新はブロック単位でまとめて行う
+        """
+        return self.id_allocator.allocate_one()
+
+    def reserve_atomic_counter(self, block_size=1):
+        """
+        カウンタをblock_size分進め、予約したブロックの最後のIDを返す
+
+        Parameters
+        ----------
+        block_size : int
+            予約する件数
+
+        Returns
+        -------
+        current_number : Decimal
+            更新後のカウンタの値
+        """
         try:
             logger.debug("Update atomic counter")
-            sequence_number = self.table.update_item(
+            sequence_number = self.execute_operation("update_item",
                 Key={
                     'table_name': self.table_name
                 },
@@ -458,7 +1817,7 @@ class AtomicCounter(DynamodbObject):
                     '#name': 'current_number'
                 },
                 ExpressionAttributeValues={
-                    ':increment': int(1)
+                    ':increment': int(block_size)
                 },
                 ReturnValues='UPDATED_NEW'
             )
@@ -487,6 +1846,8 @@ class FollowRelation(DynamodbObject):
         super().__init__()
         self.set_table('FollowRelation')
         self.atomic_counter = FollowRelationAtomicCounter()
+        # following_nameをパーティションキーに持つインデックス(フォロワーの取得に利用する)
+        self.following_name_gsi = 'FollowingNameGSIndex'
 
     def scan_all_data(self):
         """
@@ -499,8 +1860,7 @@ class FollowRelation(DynamodbObject):
         """
         try:
             logger.debug("Scan Starting")
-            db_response = self.get_item()
-            items       = db_response["Items"]
+            items       = list(self.parallel_scan())
             logger.debug("Complete Scanning. {} items".format(len(items)))
             return items
         except Exception as e:
@@ -520,12 +1880,12 @@ class FollowRelation(DynamodbObject):
         following_users : list
             パラメータで受け取ったユーザがフォローしているユーザ名のリスト
         """
+        from boto3.dynamodb.conditions import Key
 
         try:
             logger.debug("Query Starting")
             key_condition_expression = Key('follower_name').eq(user_name)
-            db_response = self.query_item(key_condition_expression = key_condition_expression)
-            items       = db_response["Items"]
+            items       = list(self.iter_query({"KeyConditionExpression": key_condition_expression}))
             logger.debug("Complete Query. {} items".format(len(items)))
             logger.debug(items)
             return items
@@ -595,4 +1955,209 @@ class FollowRelation(DynamodbObject):
             return True
         except Exception:
             logger.warn("Failed delete relation item.")
-            raise
\ No newline at end of file
+            raise
+
+    def get_follower_names(self, user_name, limit=None):
+        """
+        引数で受け取ったユーザをフォローしているユーザ名の一覧を取得する
+
+        Parameters
+        ----------
+        user_name : string
+            ユーザ名
+        limit : int
+            取得する最大件数。Noneの場合は全件
+
+        Returns
+        -------
+        follower_names : list
+            フォロワーのユーザ名の配列
+        """
+        from boto3.dynamodb.conditions import Key
+        try:
+            params = {
+                "IndexName": self.following_name_gsi,
+                "KeyConditionExpression": Key('following_name').eq(user_name)
+            }
+            return [item["follower_name"] for item in self.iter_query(params, limit=limit, projection=("follower_name",))]
+        except Exception as e:
+            logger.warn("Failed getting followers")
+            logger.warn(e)
+            raise
+
+class TimelineInbox(DynamodbObject):
+    """
+    フォロワーごとのタイムラインを保持するテーブル(TimelineInbox)
+    パーティションキー: owner_name(タイムラインを読むユーザ), ソートキー: sort_key(<clear_date>#<id>)
+
+    Todoの完了時にtimeline_fanout関数がフォロワーごとのパーティションへエントリを書き込み(fan-out on write)、
+    timelinesは自分のパーティションへの1回のQueryで読み込む。
+    フォロワーがTIMELINE_FANOUT_MAX_FOLLOWERSを超えるユーザは、フォロワーへ書き込まずに
+    自分の送信用パーティション(#outbox#<ユーザ名>)へ1件だけ書き込み、読み込み時にマージする。
+    フォロワーが上限以下に戻ったユーザは、送信用パーティションのエントリがTTLで消えるまで(TIMELINE_INBOX_TTL_DAYS)
+    #celebritiesに残し、その間はフォロワーと送信用パーティションの両方へ書き込む。期限を過ぎると登録はTTLで削除される
+    """
+    def __init__(self):
+        super().__init__()
+        self.set_table(os.getenv("TIMELINE_INBOX_TABLE", "TimelineInbox"))
+        self.max_followers = int(os.getenv("TIMELINE_FANOUT_MAX_FOLLOWERS", "500"))
+        self.ttl_days      = int(os.getenv("TIMELINE_INBOX_TTL_DAYS", "15"))
+        # フォロワーの取得に使うFollowRelation(初回の利用時に生成して使い回す)
+        self._follow_relation = None
+
+    def build_sort_key(self, clear_date, todo_id):
+        """
+        完了日時の新しい順に並べるためのソートキー(<clear_date>#<0埋めしたid>)を生成する
+        """
+        return "{}#{:012d}".format(clear_date, int(todo_id))
+
+    def build_entry(self, todo):
+        """
+        Todoからタイムラインのエントリを生成する
+        """
+        entry = {attribute: todo[attribute] for attribute in TODO_PROJECTIONS["timeline"] if attribute in todo}
+        entry["sort_key"] = self.build_sort_key(todo["clear_date"], todo["id"])
+        # TTLで期間外のエントリを削除する
+        clear_date          = datetime.strptime(todo["clear_date"][:10], '%Y-%m-%d')
+        entry["expires_at"] = int((clear_date + timedelta(days = self.ttl_days)).timestamp())
+        return entry
+
+    def fan_out(self, entry, previous_sort_key=None):
+        """
+        エントリを投稿者のフォロワーのタイムラインへ書き込む
+        フォロワーが上限を超える場合は投稿者の送信用パーティションへ書き込む
+
+        Parameters
+        ----------
+        entry : dict
+            build_entryで生成したエントリ
+        previous_sort_key : string
+            完了日の変更などで置き換える以前のエントリのソートキー
+
+        Returns
+        -------
+        owner_names : list
+            書き込んだパーティションの配列
+        """
+        owner_names = self.get_fan_out_owners(entry["user_name"])
+        items       = [dict(entry, owner_name=owner_name) for owner_name in owner_names]
+        unprocessed_items = self.batch_put_items(items)
+        if unprocessed_items:
+            raise RuntimeError("{} timeline entries are unprocessed".format(len(unprocessed_items)))
+        if previous_sort_key and previous_sort_key != entry["sort_key"]:
+            self.remove(entry["user_name"], previous_sort_key, owner_names)
+        return owner_names
+
+    def remove(self, user_name, sort_key, owner_names=None):
+        """
+        エントリをフォロワーのタイムラインから削除する
+        """
+        owner_names = self.get_fan_out_owners(user_name) if owner_names is None else owner_names
+        keys        = [{"owner_name": owner_name, "sort_key": sort_key} for owner_name in owner_names]
+        unprocessed_keys = self.batch_delete_items(keys)
+        if unprocessed_keys:
+            raise RuntimeError("{} timeline entries are not deleted".format(len(unprocessed_keys)))
+
+    def get_fan_out_owners(self, user_name):
+        """
+        ユーザのエントリを書き込むパーティションを返す
+        """
+        if self._follow_relation is None:
+            self._follow_relation = FollowRelation()
+        follower_names = self._follow_relation.get_follower_names(user_name, limit=self.max_followers + 1)
+        if len(follower_names) > self.max_followers:
+            logger.info("{} has more than {} followers. Writing to outbox".format(user_name, self.max_followers))
+            # 再び上限を超えた場合は期限なしの登録で上書きする
+            self.put_one_item({"owner_name": TIMELINE_CELEBRITIES_PARTITION, "sort_key": user_name})
+            return [TIMELINE_OUTBOX_PREFIX + user_name]
+        if not self.__demote_celebrity(user_name):
+            return follower_names
+        # 送信用パーティションが読まれている間は、エントリの置き換え・削除を反映するため両方へ書き込む
+        return follower_names + [TIMELINE_OUTBOX_PREFIX + user_name]
+
+    def iter_timeline(self, owner_name, following_names, since_sort_key="", before_sort_key=None, page_size=None, celebrities=None):
+        """
+        タイムラインを新しい順に返すジェネレータ
+        自分のパーティションと、フォローしているフォロワー数上限超えのユーザの送信用パーティションをマージし、
+        現在フォローしているユーザのエントリのみ返す
+
+        Parameters
+        ----------
+        owner_name : string
+            タイムラインを読むユーザ名
+        following_names : set
+            フォローしているユーザ名
+        since_sort_key : string
+            このソートキー以降のエントリのみ返す(期間の開始)
+        before_sort_key : string
+            このソートキーより前のエントリのみ返す
+        page_size : int
+            1回のQueryで読み込む件数
+        celebrities : list
+            get_celebritiesの結果(先に読み込んだ場合に指定する)
+
+        Yields
+        ------
+        entry : dict
+            タイムラインのエントリ
+        """
+        celebrities = self.get_celebrities() if celebrities is None else celebrities
+        celebrities = [name for name in celebrities if name in following_names]
+        partitions  = [owner_name] + [TIMELINE_OUTBOX_PREFIX + name for name in celebrities]
+        streams     = [self.__iter_partition(partition, since_sort_key, before_sort_key, page_size) for partition in partitions]
+        last_sort_key = None
+        for entry in heapq.merge(*streams, key=lambda entry: entry["sort_key"], reverse=True):
+            if entry["sort_key"] == last_sort_key or entry.get("user_name") not in following_names:
+                continue
+            last_sort_key = entry["sort_key"]
+            yield entry
+
+    def get_celebrities(self):
+        """
+        フォロワー数が上限を超え、送信用パーティションへ書き込んでいるユーザ名の一覧を取得する
+        上限以下に戻り、期限(expires_at)を過ぎたユーザはTTLで削除される前でも含めない
+        """
+        from boto3.dynamodb.conditions import Key
+        params = {"KeyConditionExpression": Key('owner_name').eq(TIMELINE_CELEBRITIES_PARTITION)}
+        now    = int(time.time())
+        items  = self.iter_query(params, projection=("sort_key", "expires_at"))
+        return [item["sort_key"] for item in items if "expires_at" not in item or item["expires_at"] > now]
+
+    #private method
+    def __demote_celebrity(self, user_name):
+        """
+        フォロワーが上限以下に戻ったユーザの#celebritiesの登録に期限を設定する
+
+        Returns
+        -------
+        is_celebrity : boolean
+            登録が期限内で、送信用パーティションがまだ読まれる場合はTrue
+        """
+        key        = {"owner_name": TIMELINE_CELEBRITIES_PARTITION, "sort_key": user_name}
+        membership = self.get_one_item(key)
+        if membership is None:
+            return False
+        now = int(time.time())
+        if "expires_at" not in membership:
+            logger.info("{} has no more than {} followers. Removing from celebrities after {} days".format(user_name, self.max_followers, self.ttl_days))
+            # 送信用パーティションのエントリは完了日からttl_daysで消えるため、同じ期間だけ登録を残す
+            self.put_one_item(dict(key, expires_at=now + self.ttl_days * 24 * 60 * 60))
+            return True
+        return membership["expires_at"] > now
+
+    def __iter_partition(self, partition, since_sort_key, before_sort_key, page_size):
+        from boto3.dynamodb.conditions import Key
+        key_condition = Key('owner_name').eq(partition)
+        if before_sort_key:
+            key_condition = key_condition & Key('sort_key').between(since_sort_key, before_sort_key)
+        else:
+            key_condition = key_condition & Key('sort_key').gte(since_sort_key)
+        params = {
+            "KeyConditionExpression": key_condition,
+            "ScanIndexForward": False
+        }
+        for entry in self.iter_query(params, page_size=page_size):
+            # BETWEENは上限を含むため、境界のエントリを除く
+            if before_sort_key and entry["sort_key"] >= before_sort_key:
+                continue
+            yield entry
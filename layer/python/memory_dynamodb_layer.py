@@ -0,0 +1,1503 @@
+"""
+プロセス内で動くDynamoDBの代替(インメモリのテーブルエンジン)
+
+AWSやDynamoDB Localに接続せずにハンドラのベンチマーク・負荷試験を行うため、
+このプロジェクトが利用するAPIのみをboto3のリソース/クライアントと同じ呼び出し方で実装する
+
+- Table: scan(FilterExpression, Segment/TotalSegments), query(テーブル・GSI・LSI), get_item, put_item,
+  update_item(SET/ADD/REMOVE/DELETE, ReturnValues), delete_item, ConditionExpression
+- リソース: batch_write_item, meta.client
+- クライアント: transact_write_items(低レベルの型付き形式), create_table, update_table(GSIの追加)
+- Limit / 1MBごとのページング(LastEvaluatedKey / ExclusiveStartKey)と消費キャパシティの概算
+- 往復時間の模擬(latency_ms)とスロットリングの模擬(throttle_rate, inject_error)
+
+dynamodb_registryへ組み込むと、DynamodbObjectを継承したクラスはそのままインメモリのテーブルを使う
+
+Usage
+-----
+# 環境変数で切り替える(プロセス内で1つのデータベースを共有する)
+DYNAMODB_BACKEND=memory MEMORY_DYNAMODB_LATENCY_MS=5 python ...
+
+# コードから組み込む
+from memory_dynamodb_layer import install_memory_dynamodb
+resource = install_memory_dynamodb(latency_ms=5, throttle_rate=0.01, seed=1)
+resource.load_items("Todos", todos)
+"""
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from decimal import Decimal
+from functools import lru_cache
+
+# boto3.dynamodb.*は読み込みが重いため、必要になった時に読み込む(コールドスタートの計測に含めない)
+from botocore.exceptions import ClientError, ParamValidationError
+
+#logger オブジェクト
+from logger_layer import ApplicationLogger
+logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
+
+# 1ページの上限(DynamoDBと同じく評価したアイテムの合計サイズで判定する)
+PAGE_SIZE_LIMIT_BYTES = 1024 * 1024
+# BatchWriteItem / TransactWriteItems の上限件数
+BATCH_WRITE_MAX_REQUESTS    = 25
+TRANSACT_WRITE_MAX_REQUESTS = 100
+# ClientRequestTokenを覚えておく件数(冪等性の確認用)
+TRANSACTION_TOKEN_HISTORY = 10000
+
+# 属性が存在しないことを表す値
+MISSING = object()
+
+
+class MemoryIndex():
+    """
+    テーブルのキー・インデックスのキー定義
+
+    Parameters
+    ----------
+    name : string
+        インデックス名(テーブルのキーの場合はNone)
+    hash_key : tuple
+        パーティションキーの(属性名, 型: S / N / B)
+    range_key : tuple
+        ソートキーの(属性名, 型)。ない場合はNone
+    local : bool
+        ローカルセカンダリインデックスの場合True
+    """
+    def __init__(self, name, hash_key, range_key=None, local=False):
+        self.name      = name
+        self.hash_key  = hash_key
+        self.range_key = range_key
+        self.local     = local
+
+    @property
+    def key_attributes(self):
+        return [key[0] for key in (self.hash_key, self.range_key) if key]
+
+
+class MemoryTableSchema():
+    """
+    テーブルの定義
+
+    Parameters
+    ----------
+    name : string
+        テーブル名
+    hash_key : tuple
+        パーティションキーの(属性名, 型)
+    range_key : tuple
+        ソートキーの(属性名, 型)
+    indexes : list
+        MemoryIndexの配列
+    """
+    def __init__(self, name, hash_key, range_key=None, indexes=()):
+        self.name    = name
+        self.key     = MemoryIndex(None, hash_key, range_key)
+        self.indexes = list(indexes)
+
+
+def default_table_schemas():
+    """
+    このプロジェクトのテーブル定義を返す
+    テーブル名は各クラスと同じ環境変数で切り替える
+    """
+    return [
+        MemoryTableSchema("Todos", ("id", "N"), indexes=[
+            MemoryIndex("UserNameCreatedGSIndex", ("user_name", "S"), ("created_at", "S")),
+            MemoryIndex("UserNameGSIndex", ("user_name", "S")),
+            MemoryIndex("ClearDateLSIndex", ("id", "N"), ("clear_date", "S"), local=True),
+            MemoryIndex("ClearDateBucketGSIndex", ("clear_date_bucket", "S"), ("clear_date", "S"))
+        ]),
+        MemoryTableSchema("MuscleAtomicCounter", ("table_name", "S")),
+        MemoryTableSchema("FollowRelation", ("follower_name", "S"), ("id", "N"), indexes=[
+            MemoryIndex("FollowingNameGSIndex", ("following_name", "S"))
+        ]),
+        MemoryTableSchema(os.getenv("TODO_AGGREGATES_TABLE", "TodoAggregates"), ("user_name", "S")),
+        MemoryTableSchema(os.getenv("TIMELINE_INBOX_TABLE", "TimelineInbox"), ("owner_name", "S"), ("sort_key", "S"))
+    ]
+
+
+def client_error(code, message, operation_name, **extra):
+    """
+    boto3と同じ形のClientErrorを生成する
+    """
+    error_response = {"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPStatusCode": 400}}
+    error_response.update(extra)
+    return ClientError(error_response, operation_name)
+
+
+def validation_error(message, operation_name="Unknown"):
+    return client_error("ValidationException", message, operation_name)
+
+
+# ---------------------------------------------------------------------------
+# 値の変換・サイズ
+# ---------------------------------------------------------------------------
+def _is_binary(value):
+    # Binaryはboto3.dynamodb.typesの読み込み後にしか生成されないため、未読み込みの場合は読み込まずに判定する
+    types = sys.modules.get("boto3.dynamodb.types")
+    return types is not None and isinstance(value, types.Binary)
+
+
+def to_dynamodb_value(value):
+    """
+    boto3のリソースと同じく、書き込む値をDynamoDBの型に揃える(int -> Decimal, floatは不可)
+    呼び出し元のオブジェクトと共有しないようにコンテナはコピーする
+    """
+    if isinstance(value, bool) or value is None or isinstance(value, (str, Decimal)):
+        return value
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, (bytes, bytearray)):
+        from boto3.dynamodb.types import Binary
+        return Binary(bytes(value))
+    if _is_binary(value):
+        return value
+    if isinstance(value, (set, frozenset)):
+        return {to_dynamodb_value(element) for element in value}
+    if isinstance(value, (list, tuple)):
+        return [to_dynamodb_value(element) for element in value]
+    if isinstance(value, dict):
+        return {name: to_dynamodb_value(element) for name, element in value.items()}
+    raise TypeError("Unsupported type \"{}\" for value \"{}\"".format(type(value), value))
+
+
+def to_dynamodb_item(item):
+    return {name: to_dynamodb_value(value) for name, value in item.items()}
+
+
+def copy_item(item):
+    # 読み込み結果を呼び出し元が書き換えても保存しているアイテムに影響しないようにする
+    return {name: (value if not isinstance(value, (dict, list, set)) else _copy_value(value)) for name, value in item.items()}
+
+
+def _copy_value(value):
+    if isinstance(value, dict):
+        return {name: _copy_value(element) for name, element in value.items()}
+    if isinstance(value, list):
+        return [_copy_value(element) for element in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
+def value_type(value):
+    """
+    DynamoDBの型名を返す
+    """
+    if isinstance(value, bool):
+        return "BOOL"
+    if isinstance(value, (int, Decimal)):
+        return "N"
+    if isinstance(value, str):
+        return "S"
+    if _is_binary(value):
+        return "B"
+    if value is None:
+        return "NULL"
+    if isinstance(value, (set, frozenset)):
+        element = next(iter(value), "")
+        return {"N": "NS", "B": "BS"}.get(value_type(element), "SS")
+    if isinstance(value, list):
+        return "L"
+    if isinstance(value, dict):
+        return "M"
+    return None
+
+
+def value_size(value):
+    """
+    DynamoDBのアイテムサイズの計算方法に近い概算(バイト)
+    """
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, Decimal)):
+        return (len(str(value)) + 1) // 2 + 1
+    if _is_binary(value):
+        return len(value.value)
+    if isinstance(value, (set, frozenset, list)):
+        return 3 + sum(value_size(element) + 1 for element in value)
+    if isinstance(value, dict):
+        return 3 + sum(len(name.encode("utf-8")) + value_size(element) + 1 for name, element in value.items())
+    return 0
+
+
+def item_size(item):
+    return sum(len(name.encode("utf-8")) + value_size(value) for name, value in item.items())
+
+
+def read_units(size, consistent_read=False):
+    units = max(1, math.ceil(size / 4096))
+    return float(units) if consistent_read else units / 2
+
+
+def write_units(size):
+    return float(max(1, math.ceil(size / 1024)))
+
+
+# ---------------------------------------------------------------------------
+# 式の解析
+# ---------------------------------------------------------------------------
+TOKEN_PATTERN  = re.compile(r"\s*(?:(<>|<=|>=|=|<|>)|([(),+\-])|([#:]?[A-Za-z0-9_]+))")
+CONDITION_KEYWORDS  = ("AND", "OR", "NOT", "BETWEEN", "IN")
+CONDITION_FUNCTIONS = ("attribute_exists", "attribute_not_exists", "attribute_type", "begins_with", "contains", "size")
+UPDATE_CLAUSES      = ("SET", "ADD", "REMOVE", "DELETE")
+
+
+def tokenize(expression):
+    tokens   = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if match is None or match.end() == position:
+            raise validation_error("Invalid expression: Syntax error; token: \"{}\"".format(expression[position:].strip()[:10]))
+        operator, punctuation, word = match.groups()
+        if operator:
+            tokens.append(("op", operator))
+        elif punctuation:
+            tokens.append(("punct", punctuation))
+        else:
+            tokens.append(("word", word))
+        position = match.end()
+    return tokens
+
+
+class ExpressionParser():
+    """
+    Condition / KeyCondition / Filter / Update / Projection 式を構文木(tuple)に変換する
+    """
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens     = tokenize(expression)
+        self.position   = 0
+
+    def parse_condition(self):
+        node = self.__parse_or()
+        self.__expect_end()
+        return node
+
+    def parse_update(self):
+        actions = []
+        while not self.__at_end():
+            kind, text = self.__next()
+            clause = text.upper()
+            if kind != "word" or clause not in UPDATE_CLAUSES:
+                raise self.__error(text)
+            while True:
+                path = self.__parse_path()
+                if clause == "SET":
+                    self.__expect("op", "=")
+                    actions.append((clause, path, self.__parse_set_value()))
+                elif clause == "REMOVE":
+                    actions.append((clause, path, None))
+                else:
+                    actions.append((clause, path, self.__parse_operand()))
+                if self.__peek() == ("punct", ","):
+                    self.__next()
+                    continue
+                break
+        if not actions:
+            raise validation_error("Invalid UpdateExpression: The expression can not be empty")
+        return actions
+
+    def parse_projection(self):
+        paths = [self.__parse_path()]
+        while self.__peek() == ("punct", ","):
+            self.__next()
+            paths.append(self.__parse_path())
+        self.__expect_end()
+        return paths
+
+    #private method
+    def __parse_or(self):
+        node = self.__parse_and()
+        while self.__peek_keyword("OR"):
+            self.__next()
+            node = ("or", node, self.__parse_and())
+        return node
+
+    def __parse_and(self):
+        node = self.__parse_not()
+        while self.__peek_keyword("AND"):
+            self.__next()
+            node = ("and", node, self.__parse_not())
+        return node
+
+    def __parse_not(self):
+        if self.__peek_keyword("NOT"):
+            self.__next()
+            return ("not", self.__parse_not())
+        return self.__parse_primary()
+
+    def __parse_primary(self):
+        if self.__peek() == ("punct", "("):
+            self.__next()
+            node = self.__parse_or()
+            self.__expect("punct", ")")
+            return node
+        kind, text = self.__peek()
+        if kind == "word" and text in CONDITION_FUNCTIONS and self.__peek(1) == ("punct", "(") and text != "size":
+            self.__next()
+            return ("func", text, self.__parse_arguments())
+        return self.__parse_comparison(self.__parse_operand())
+
+    def __parse_comparison(self, left):
+        kind, text = self.__peek()
+        if kind == "op":
+            self.__next()
+            return ("cmp", text, left, self.__parse_operand())
+        if self.__peek_keyword("BETWEEN"):
+            self.__next()
+            low = self.__parse_operand()
+            if not self.__peek_keyword("AND"):
+                raise self.__error(self.__peek()[1])
+            self.__next()
+            return ("between", left, low, self.__parse_operand())
+        if self.__peek_keyword("IN"):
+            self.__next()
+            return ("in", left, self.__parse_arguments())
+        raise self.__error(text)
+
+    def __parse_arguments(self):
+        self.__expect("punct", "(")
+        arguments = [self.__parse_operand()]
+        while self.__peek() == ("punct", ","):
+            self.__next()
+            arguments.append(self.__parse_operand())
+        self.__expect("punct", ")")
+        return arguments
+
+    def __parse_operand(self):
+        kind, text = self.__next()
+        if kind != "word" or text.upper() in CONDITION_KEYWORDS:
+            raise self.__error(text)
+        if text.startswith(":"):
+            return ("value", text)
+        if text == "size" and self.__peek() == ("punct", "("):
+            self.__next()
+            path = self.__parse_path()
+            self.__expect("punct", ")")
+            return ("size", path)
+        return ("path", text)
+
+    def __parse_path(self):
+        kind, text = self.__next()
+        if kind != "word" or text.startswith(":"):
+            raise self.__error(text)
+        return ("path", text)
+
+    def __parse_set_value(self):
+        left = self.__parse_set_operand()
+        if self.__peek() in (("punct", "+"), ("punct", "-")):
+            operator = self.__next()[1]
+            return ("arith", operator, left, self.__parse_set_operand())
+        return left
+
+    def __parse_set_operand(self):
+        kind, text = self.__peek()
+        if kind == "word" and text in ("if_not_exists", "list_append") and self.__peek(1) == ("punct", "("):
+            self.__next()
+            arguments = self.__parse_arguments()
+            if len(arguments) != 2:
+                raise validation_error("Invalid UpdateExpression: Incorrect number of operands for operator or function; operator or function: {}".format(text))
+            return (text, arguments[0], arguments[1])
+        return self.__parse_operand()
+
+    def __peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else ("end", "")
+
+    def __peek_keyword(self, keyword):
+        kind, text = self.__peek()
+        return kind == "word" and text.upper() == keyword
+
+    def __next(self):
+        token = self.__peek()
+        if token[0] == "end":
+            raise validation_error("Invalid expression: Syntax error; token: <EOF>, near: \"{}\"".format(self.expression))
+        self.position += 1
+        return token
+
+    def __expect(self, kind, text):
+        token = self.__next()
+        if token != (kind, text):
+            raise self.__error(token[1])
+
+    def __expect_end(self):
+        if not self.__at_end():
+            raise self.__error(self.__peek()[1])
+
+    def __at_end(self):
+        return self.position >= len(self.tokens)
+
+    def __error(self, token):
+        return validation_error("Invalid expression: Syntax error; token: \"{}\", near: \"{}\"".format(token, self.expression))
+
+
+@lru_cache(maxsize=1024)
+def compile_condition(expression):
+    """
+    条件式を(item, names, values) -> boolの関数に変換する(式の文字列ごとにキャッシュする)
+    """
+    tree = ExpressionParser(expression).parse_condition()
+    return tree, _compile_node(tree)
+
+
+@lru_cache(maxsize=1024)
+def parse_update_expression(expression):
+    return ExpressionParser(expression).parse_update()
+
+
+@lru_cache(maxsize=1024)
+def parse_projection_expression(expression):
+    return ExpressionParser(expression).parse_projection()
+
+
+def resolve_name(token, names):
+    if token.startswith("#"):
+        try:
+            return names[token]
+        except KeyError:
+            raise validation_error("An expression attribute name used in the document path is not defined; attribute name: {}".format(token))
+    return token
+
+
+def resolve_value(token, values):
+    try:
+        return values[token]
+    except KeyError:
+        raise validation_error("An expression attribute value used in expression is not defined; attribute value: {}".format(token))
+
+
+def _compile_operand(node):
+    kind = node[0]
+    if kind == "value":
+        token = node[1]
+        return lambda item, names, values: resolve_value(token, values)
+    if kind == "path":
+        token = node[1]
+        if token.startswith("#"):
+            return lambda item, names, values: item.get(resolve_name(token, names), MISSING)
+        return lambda item, names, values: item.get(token, MISSING)
+    if kind == "size":
+        path = _compile_operand(node[1])
+        return lambda item, names, values: _size_of(path(item, names, values))
+    raise validation_error("Unsupported operand: {}".format(kind))
+
+
+def _size_of(value):
+    if isinstance(value, str):
+        return Decimal(len(value))
+    if _is_binary(value):
+        return Decimal(len(value.value))
+    if isinstance(value, (set, frozenset, list, dict)):
+        return Decimal(len(value))
+    return MISSING
+
+
+def _equals(left, right):
+    return left is not MISSING and right is not MISSING and value_type(left) == value_type(right) and left == right
+
+
+def _ordered(left, right):
+    # 大小比較は同じスカラー型(N / S / B)同士のみ
+    if left is MISSING or right is MISSING:
+        return False
+    left_type = value_type(left)
+    return left_type in ("N", "S", "B") and left_type == value_type(right)
+
+
+def _sortable(value):
+    return value.value if _is_binary(value) else value
+
+
+COMPARATORS = {
+    "<":  lambda left, right: _ordered(left, right) and _sortable(left) < _sortable(right),
+    "<=": lambda left, right: _ordered(left, right) and _sortable(left) <= _sortable(right),
+    ">":  lambda left, right: _ordered(left, right) and _sortable(left) > _sortable(right),
+    ">=": lambda left, right: _ordered(left, right) and _sortable(left) >= _sortable(right)
+}
+
+
+def _compile_node(node):
+    kind = node[0]
+    if kind in ("and", "or"):
+        left, right = _compile_node(node[1]), _compile_node(node[2])
+        if kind == "and":
+            return lambda item, names, values: left(item, names, values) and right(item, names, values)
+        return lambda item, names, values: left(item, names, values) or right(item, names, values)
+    if kind == "not":
+        inner = _compile_node(node[1])
+        return lambda item, names, values: not inner(item, names, values)
+    if kind == "cmp":
+        operator, left, right = node[1], _compile_operand(node[2]), _compile_operand(node[3])
+        if operator == "=":
+            return lambda item, names, values: _equals(left(item, names, values), right(item, names, values))
+        if operator == "<>":
+            return lambda item, names, values: not _equals(left(item, names, values), right(item, names, values))
+        comparator = COMPARATORS[operator]
+        return lambda item, names, values: comparator(left(item, names, values), right(item, names, values))
+    if kind == "between":
+        target, low, high = _compile_operand(node[1]), _compile_operand(node[2]), _compile_operand(node[3])
+        def between(item, names, values):
+            value = target(item, names, values)
+            return COMPARATORS[">="](value, low(item, names, values)) and COMPARATORS["<="](value, high(item, names, values))
+        return between
+    if kind == "in":
+        target, candidates = _compile_operand(node[1]), [_compile_operand(candidate) for candidate in node[2]]
+        def is_in(item, names, values):
+            value = target(item, names, values)
+            return any(_equals(value, candidate(item, names, values)) for candidate in candidates)
+        return is_in
+    if kind == "func":
+        return _compile_function(node[1], [_compile_operand(argument) for argument in node[2]])
+    raise validation_error("Unsupported condition: {}".format(kind))
+
+
+def _compile_function(name, arguments):
+    expected = {"attribute_exists": 1, "attribute_not_exists": 1}.get(name, 2)
+    if len(arguments) != expected:
+        raise validation_error("Invalid expression: Incorrect number of operands for operator or function; operator or function: {}".format(name))
+    if name == "attribute_exists":
+        return lambda item, names, values: arguments[0](item, names, values) is not MISSING
+    if name == "attribute_not_exists":
+        return lambda item, names, values: arguments[0](item, names, values) is MISSING
+    if name == "attribute_type":
+        return lambda item, names, values: value_type(arguments[0](item, names, values)) == arguments[1](item, names, values)
+    if name == "begins_with":
+        def begins_with(item, names, values):
+            value, prefix = arguments[0](item, names, values), arguments[1](item, names, values)
+            if isinstance(value, str) and isinstance(prefix, str):
+                return value.startswith(prefix)
+            if _is_binary(value) and _is_binary(prefix):
+                return value.value.startswith(prefix.value)
+            return False
+        return begins_with
+    def contains(item, names, values):
+        value, operand = arguments[0](item, names, values), arguments[1](item, names, values)
+        if isinstance(value, str) and isinstance(operand, str):
+            return operand in value
+        if isinstance(value, (set, frozenset, list)):
+            return any(_equals(element, operand) for element in value)
+        return False
+    return contains
+
+
+def evaluate_condition(expression, item, names, values):
+    """
+    条件式を評価する。アイテムが存在しない場合は空のアイテムとして評価する
+    """
+    return compile_condition(expression)[1](item or {}, names, values)
+
+
+def find_key_equality(tree, attribute_name, names, values):
+    """
+    KeyConditionExpressionからパーティションキーの値(attribute = :value)を取り出す
+    """
+    if tree[0] == "and":
+        found = find_key_equality(tree[1], attribute_name, names, values)
+        return found if found is not MISSING else find_key_equality(tree[2], attribute_name, names, values)
+    if tree[0] == "cmp" and tree[1] == "=":
+        left, right = tree[2], tree[3]
+        if left[0] == "value":
+            left, right = right, left
+        if left[0] == "path" and right[0] == "value" and resolve_name(left[1], names) == attribute_name:
+            return resolve_value(right[1], values)
+    return MISSING
+
+
+# ---------------------------------------------------------------------------
+# テーブルのデータ
+# ---------------------------------------------------------------------------
+class _Partition():
+    """
+    パーティションキーが同じアイテム(主キー -> アイテム)。ソートキー順の配列は変更されるまで使い回す
+    """
+    __slots__ = ("items", "ordered", "orders")
+
+    def __init__(self):
+        self.items   = {}
+        self.ordered = None
+        self.orders  = None
+
+
+class MemoryTableData():
+    """
+    1テーブル分のアイテムとインデックス
+
+    Parameters
+    ----------
+    schema : MemoryTableSchema
+        テーブルの定義
+    """
+    def __init__(self, schema):
+        self.name        = schema.name
+        self.key         = schema.key
+        self.indexes     = {}
+        self.items       = {}
+        self.sizes       = {}
+        # キーまたはインデックス名 -> パーティションキーの値 -> _Partition
+        self.partitions  = {None: {}}
+        self.ttl_attribute = None
+        self.version     = 0
+        self.scan_order  = None
+        for index in schema.indexes:
+            self.add_index(index)
+
+    def add_index(self, index):
+        """
+        インデックスを追加し、既存のアイテムから作る
+        """
+        self.indexes[index.name]    = index
+        self.partitions[index.name] = {}
+        for primary_key, item in self.items.items():
+            self.__link(index, primary_key, item)
+
+    def get_index(self, index_name, operation_name):
+        if index_name is None:
+            return self.key
+        index = self.indexes.get(index_name)
+        if index is None:
+            raise validation_error("The table does not have the specified index: {}".format(index_name), operation_name)
+        return index
+
+    def primary_key(self, key, operation_name, exact=True):
+        """
+        Key(またはアイテム)から主キーのtupleを作る
+        """
+        values = []
+        for attribute in (self.key.hash_key, self.key.range_key):
+            if attribute is None:
+                continue
+            name, attribute_type = attribute
+            value = key.get(name, MISSING)
+            if value is MISSING or value_type(value) != attribute_type:
+                raise validation_error("The provided key element does not match the schema", operation_name)
+            values.append(value)
+        if exact and len(key) != len(values):
+            raise validation_error("The provided key element does not match the schema", operation_name)
+        return tuple(values)
+
+    def validate_item(self, item, operation_name):
+        # インデックスのキー属性は定義した型のみ書き込める(存在しない場合はインデックスに含めない)
+        for index in self.indexes.values():
+            for attribute in (index.hash_key, index.range_key):
+                if attribute is None:
+                    continue
+                value = item.get(attribute[0], MISSING)
+                if value is not MISSING and value_type(value) != attribute[1]:
+                    raise validation_error("One or more parameter values were invalid: Type mismatch for Index Key {} Expected: {} Actual: {} IndexName: {}".format(
+                        attribute[0], attribute[1], value_type(value), index.name), operation_name)
+                if isinstance(value, str) and value == "":
+                    raise validation_error("One or more parameter values are not valid. A value specified for a secondary index key is not supported. The AttributeValue for a key attribute cannot contain an empty string value. IndexName: {}".format(index.name), operation_name)
+
+    def write(self, primary_key, item):
+        """
+        アイテムを書き込む(itemがNoneの場合は削除する)。変更のあったインデックス名を返す
+        """
+        old_item = self.items.get(primary_key)
+        touched  = []
+        if old_item is not None:
+            for index in self.__all_indexes():
+                if self.__unlink(index, primary_key, old_item):
+                    touched.append(index.name)
+        if item is None:
+            if old_item is not None:
+                del self.items[primary_key]
+                del self.sizes[primary_key]
+                self.version   += 1
+                self.scan_order = None
+        else:
+            if old_item is None:
+                self.version   += 1
+                self.scan_order = None
+            self.items[primary_key] = item
+            self.sizes[primary_key] = item_size(item)
+            for index in self.__all_indexes():
+                if self.__link(index, primary_key, item) and index.name not in touched:
+                    touched.append(index.name)
+        return [name for name in touched if name is not None]
+
+    def get_scan_order(self):
+        """
+        Scanで辿る順の主キー・セグメント判定用のハッシュ(変更されるまで使い回す)
+        """
+        if self.scan_order is None:
+            keys   = sorted(self.items, key=_key_order)
+            hashes = [zlib.crc32(repr(primary_key[0]).encode("utf-8")) for primary_key in keys]
+            self.scan_order = (keys, hashes, [_key_order(primary_key) for primary_key in keys])
+        return self.scan_order
+
+    def get_partition_items(self, index, hash_value):
+        """
+        パーティションのアイテムと、並び順の値(entry_orderの値)の配列をソートキー順で返す
+        """
+        if index.name is None and index.range_key is None:
+            item = self.items.get((hash_value,))
+            return ([((hash_value,), item)], [_key_order((hash_value,))]) if item is not None else ([], [])
+        partition = self.partitions[index.name].get(hash_value)
+        if partition is None:
+            return [], []
+        if partition.ordered is None:
+            partition.ordered = sorted(partition.items.items(), key=lambda entry: self.entry_order(index, entry[0], entry[1]))
+            partition.orders  = [self.entry_order(index, primary_key, item) for primary_key, item in partition.ordered]
+        return partition.ordered, partition.orders
+
+    def entry_order(self, index, primary_key, item):
+        """
+        パーティション内の並び順の値(インデックスのソートキー, 主キー)を返す
+        ExclusiveStartKeyから作った値と比べることで、そのアイテムが削除されていても続きの位置が分かる
+        """
+        if index.range_key is None:
+            return _key_order(primary_key)
+        return (_sortable(item[index.range_key[0]]), _key_order(primary_key))
+
+    #private method
+    def __all_indexes(self):
+        if self.key.range_key is not None:
+            yield self.key
+        yield from self.indexes.values()
+
+    def __link(self, index, primary_key, item):
+        hash_value = item.get(index.hash_key[0], MISSING)
+        if hash_value is MISSING or (index.range_key and index.range_key[0] not in item):
+            return False
+        partition = self.partitions[index.name].get(hash_value)
+        if partition is None:
+            partition = self.partitions[index.name][hash_value] = _Partition()
+        partition.items[primary_key] = item
+        partition.ordered = None
+        partition.orders  = None
+        return True
+
+    def __unlink(self, index, primary_key, item):
+        hash_value = item.get(index.hash_key[0], MISSING)
+        partition  = self.partitions[index.name].get(hash_value) if hash_value is not MISSING else None
+        if partition is None or primary_key not in partition.items:
+            return False
+        del partition.items[primary_key]
+        partition.ordered = None
+        partition.orders  = None
+        if not partition.items:
+            del self.partitions[index.name][hash_value]
+        return True
+
+
+def _key_order(primary_key):
+    return tuple(_sortable(value) for value in primary_key)
+
+
+# ---------------------------------------------------------------------------
+# boto3互換のリソース・テーブル・クライアント
+# ---------------------------------------------------------------------------
+class _Meta():
+    def __init__(self, client):
+        self.client = client
+
+
+class MemoryDynamodbResource():
+    """
+    boto3のDynamoDBリソースの代わりに使うインメモリのデータベース
+    全てのスレッドで共有し、1つのロックで操作を直列化する(往復時間の模擬はロックの外で待つ)
+
+    Parameters
+    ----------
+    schemas : list
+        MemoryTableSchemaの配列。未指定の場合はdefault_table_schemas()
+    latency_ms : float
+        1リクエストあたりの往復時間(ミリ秒)
+    jitter_ms : float
+        往復時間に加える揺らぎの最大値(ミリ秒)
+    throttle_rate : float
+        リクエストがスロットリングされる確率
+    unprocessed_rate : float
+        BatchWriteItemのリクエストがUnprocessedItemsに残る確率
+    seed : int
+        揺らぎ・スロットリングの乱数のシード
+    """
+    def __init__(self, schemas=None, latency_ms=0.0, jitter_ms=0.0, throttle_rate=0.0, unprocessed_rate=0.0, seed=None):
+        self.latency_ms       = latency_ms
+        self.jitter_ms        = jitter_ms
+        self.throttle_rate    = throttle_rate
+        self.unprocessed_rate = unprocessed_rate
+        self.random           = random.Random(seed)
+        self.lock             = threading.RLock()
+        self.tables           = {}
+        self.request_counts   = Counter()
+        self.injected_errors  = deque()
+        self.transaction_tokens = deque(maxlen=TRANSACTION_TOKEN_HISTORY)
+        self.meta             = _Meta(MemoryDynamodbClient(self))
+        for schema in (default_table_schemas() if schemas is None else schemas):
+            self.add_table(schema)
+
+    def Table(self, name):
+        return MemoryTable(self, name)
+
+    def add_table(self, schema):
+        with self.lock:
+            if schema.name in self.tables:
+                raise client_error("ResourceInUseException", "Table already exists: {}".format(schema.name), "CreateTable")
+            self.tables[schema.name] = MemoryTableData(schema)
+
+    def load_items(self, table_name, items):
+        """
+        往復時間・スロットリングを模擬せずにアイテムをまとめて書き込む(ベンチマークのデータ投入用)
+
+        Returns
+        -------
+        count : int
+            書き込んだ件数
+        """
+        count = 0
+        with self.lock:
+            table = self.get_table_data(table_name, "BatchWriteItem")
+            for item in items:
+                item = to_dynamodb_item(item)
+                table.validate_item(item, "BatchWriteItem")
+                table.write(table.primary_key(item, "BatchWriteItem", exact=False), item)
+                count += 1
+        return count
+
+    def get_items(self, table_name):
+        """
+        テーブルの全アイテムのコピーを返す(検証用)
+        """
+        with self.lock:
+            return [copy_item(item) for item in self.get_table_data(table_name, "Scan").items.values()]
+
+    def inject_error(self, code, operation_name=None, count=1):
+        """
+        次のcount回のリクエスト(operation_nameを指定した場合はその操作のみ)を指定したエラーにする
+        """
+        with self.lock:
+            for _ in range(count):
+                self.injected_errors.append((code, operation_name))
+
+    def stats(self):
+        """
+        操作ごとのリクエスト数を返す
+        """
+        with self.lock:
+            return dict(self.request_counts)
+
+    def batch_write_item(self, RequestItems, ReturnConsumedCapacity="NONE", ReturnItemCollectionMetrics="NONE"):
+        operation_name = "BatchWriteItem"
+        self.begin_request(operation_name)
+        request_count = sum(len(requests) for requests in RequestItems.values())
+        if request_count == 0 or request_count > BATCH_WRITE_MAX_REQUESTS:
+            raise validation_error("Too many items requested for the BatchWriteItem call", operation_name)
+        unprocessed = {}
+        capacities  = []
+        with self.lock:
+            for table_name, requests in RequestItems.items():
+                table = self.get_table_data(table_name, operation_name)
+                units = 0.0
+                for request in requests:
+                    if self.unprocessed_rate and self.random.random() < self.unprocessed_rate:
+                        unprocessed.setdefault(table_name, []).append(request)
+                        continue
+                    if "PutRequest" in request:
+                        item = to_dynamodb_item(request["PutRequest"]["Item"])
+                        table.validate_item(item, operation_name)
+                        units += self.commit(table, table.primary_key(item, operation_name, exact=False), item)
+                    else:
+                        key = to_dynamodb_item(request["DeleteRequest"]["Key"])
+                        units += self.commit(table, table.primary_key(key, operation_name), None)
+                capacities.append({"TableName": table_name, "CapacityUnits": units})
+        response = {"UnprocessedItems": unprocessed, "ResponseMetadata": {"HTTPStatusCode": 200}}
+        if ReturnConsumedCapacity in ("TOTAL", "INDEXES"):
+            response["ConsumedCapacity"] = capacities
+        return response
+
+    # テーブル・クライアントから利用するメソッド
+    def get_table_data(self, table_name, operation_name):
+        table = self.tables.get(table_name)
+        if table is None:
+            raise client_error("ResourceNotFoundException", "Requested resource not found: Table: {} not found".format(table_name), operation_name)
+        return table
+
+    def begin_request(self, operation_name):
+        """
+        リクエスト数を数え、往復時間を待ち、エラー・スロットリングを模擬する
+        """
+        with self.lock:
+            self.request_counts[operation_name] += 1
+            delay_ms = self.latency_ms + (self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+            error_code = None
+            for position, (code, target_operation) in enumerate(self.injected_errors):
+                if target_operation in (None, operation_name):
+                    error_code = code
+                    del self.injected_errors[position]
+                    break
+            if error_code is None and self.throttle_rate and self.random.random() < self.throttle_rate:
+                error_code = "ProvisionedThroughputExceededException"
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+        if error_code is not None:
+            raise client_error(error_code, "Simulated {} by memory_dynamodb_layer".format(error_code), operation_name)
+
+    def commit(self, table, primary_key, item):
+        """
+        アイテムを書き込み、消費した書き込みキャパシティ(インデックス分を含む)を返す
+        """
+        old_size = table.sizes.get(primary_key, 0)
+        touched  = table.write(primary_key, item)
+        units    = write_units(max(old_size, item_size(item) if item is not None else 0))
+        return units * (1 + len(touched))
+
+
+class MemoryTable():
+    """
+    boto3のTableの代わりに使うオブジェクト
+
+    Parameters
+    ----------
+    resource : MemoryDynamodbResource
+        データベース
+    name : string
+        テーブル名
+    """
+    def __init__(self, resource, name):
+        self.resource   = resource
+        self.name       = name
+        self.table_name = name
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, ConsistentRead=False, ReturnConsumedCapacity="NONE"):
+        operation_name = "GetItem"
+        self.resource.begin_request(operation_name)
+        with self.resource.lock:
+            table = self.resource.get_table_data(self.name, operation_name)
+            primary_key = table.primary_key(to_dynamodb_item(Key), operation_name)
+            item = table.items.get(primary_key)
+            size = table.sizes.get(primary_key, 0)
+            response = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+            if item is not None:
+                response["Item"] = _project(item, ProjectionExpression, ExpressionAttributeNames or {})
+        return _with_capacity(response, ReturnConsumedCapacity, self.name, read_units(size, ConsistentRead))
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                 ReturnValues="NONE", ReturnConsumedCapacity="NONE", ReturnItemCollectionMetrics="NONE"):
+        operation_name = "PutItem"
+        self.resource.begin_request(operation_name)
+        request = _Request(operation_name, ExpressionAttributeNames, ExpressionAttributeValues, ConditionExpression=ConditionExpression)
+        with self.resource.lock:
+            table = self.resource.get_table_data(self.name, operation_name)
+            item  = to_dynamodb_item(Item)
+            table.validate_item(item, operation_name)
+            primary_key = table.primary_key(item, operation_name, exact=False)
+            old_item    = table.items.get(primary_key)
+            request.check_condition(old_item)
+            units = self.resource.commit(table, primary_key, item)
+        response = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+        if ReturnValues == "ALL_OLD" and old_item is not None:
+            response["Attributes"] = copy_item(old_item)
+        return _with_capacity(response, ReturnConsumedCapacity, self.name, units)
+
+    def update_item(self, Key, UpdateExpression=None, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues="NONE", ReturnConsumedCapacity="NONE", ReturnItemCollectionMetrics="NONE"):
+        operation_name = "UpdateItem"
+        self.resource.begin_request(operation_name)
+        if not UpdateExpression:
+            raise ParamValidationError(report="Missing required parameter: UpdateExpression (AttributeUpdates is not supported)")
+        request = _Request(operation_name, ExpressionAttributeNames, ExpressionAttributeValues, ConditionExpression=ConditionExpression)
+        with self.resource.lock:
+            table = self.resource.get_table_data(self.name, operation_name)
+            key   = to_dynamodb_item(Key)
+            primary_key = table.primary_key(key, operation_name)
+            old_item    = table.items.get(primary_key)
+            request.check_condition(old_item)
+            new_item, updated_names = request.apply_update(table, key, old_item, UpdateExpression)
+            table.validate_item(new_item, operation_name)
+            units = self.resource.commit(table, primary_key, new_item)
+        response = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+        attributes = _return_values(ReturnValues, old_item, new_item, updated_names)
+        if attributes is not None:
+            response["Attributes"] = attributes
+        return _with_capacity(response, ReturnConsumedCapacity, self.name, units)
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ReturnValues="NONE", ReturnConsumedCapacity="NONE", ReturnItemCollectionMetrics="NONE"):
+        operation_name = "DeleteItem"
+        self.resource.begin_request(operation_name)
+        request = _Request(operation_name, ExpressionAttributeNames, ExpressionAttributeValues, ConditionExpression=ConditionExpression)
+        with self.resource.lock:
+            table = self.resource.get_table_data(self.name, operation_name)
+            primary_key = table.primary_key(to_dynamodb_item(Key), operation_name)
+            old_item    = table.items.get(primary_key)
+            request.check_condition(old_item)
+            units = self.resource.commit(table, primary_key, None)
+        response = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+        if ReturnValues == "ALL_OLD" and old_item is not None:
+            response["Attributes"] = copy_item(old_item)
+        return _with_capacity(response, ReturnConsumedCapacity, self.name, units)
+
+    def query(self, KeyConditionExpression, IndexName=None, FilterExpression=None, ProjectionExpression=None,
+              ExpressionAttributeNames=None, ExpressionAttributeValues=None, ScanIndexForward=True, ExclusiveStartKey=None,
+              Limit=None, ConsistentRead=False, Select=None, ReturnConsumedCapacity="NONE"):
+        operation_name = "Query"
+        self.resource.begin_request(operation_name)
+        request = _Request(operation_name, ExpressionAttributeNames, ExpressionAttributeValues,
+                           KeyConditionExpression=KeyConditionExpression, FilterExpression=FilterExpression)
+        with self.resource.lock:
+            table = self.resource.get_table_data(self.name, operation_name)
+            index = table.get_index(IndexName, operation_name)
+            tree, key_condition = request.get_condition("KeyConditionExpression")
+            hash_value = find_key_equality(tree, index.hash_key[0], request.names, request.values)
+            if hash_value is MISSING:
+                raise validation_error("Query condition missed key schema element: {}".format(index.hash_key[0]), operation_name)
+            entries, orders = table.get_partition_items(index, hash_value)
+            start, end = 0, len(entries)
+            if ExclusiveStartKey:
+                # Scanと同じく、ExclusiveStartKeyの並び順の値から続きの位置を二分探索する(アイテムが削除されていてもよい)
+                start_key = to_dynamodb_item(ExclusiveStartKey)
+                if index.range_key is not None and index.range_key[0] not in start_key:
+                    raise validation_error("The provided starting key is invalid", operation_name)
+                start_order = table.entry_order(index, table.primary_key(start_key, operation_name, exact=False), start_key)
+                if ScanIndexForward:
+                    start = _bisect_right(orders, start_order)
+                else:
+                    end = _bisect_left(orders, start_order)
+            page_entries = (entries[position] for position in range(start, end)) if ScanIndexForward \
+                else (entries[position] for position in range(end - 1, start - 1, -1))
+            candidates = (entry for entry in page_entries if key_condition(entry[1], request.names, request.values))
+            response = self.__read_page(table, index, candidates, request, Limit, ProjectionExpression, Select)
+        return _with_capacity(response, ReturnConsumedCapacity, self.name,
+                              read_units(response.pop("_read_bytes"), ConsistentRead), index)
+
+    def scan(self, IndexName=None, FilterExpression=None, ProjectionExpression=None, ExpressionAttributeNames=None,
+             ExpressionAttributeValues=None, ExclusiveStartKey=None, Limit=None, ConsistentRead=False, Select=None,
+             Segment=None, TotalSegments=None, ReturnConsumedCapacity="NONE"):
+        operation_name = "Scan"
+        self.resource.begin_request(operation_name)
+        if (Segment is None) != (TotalSegments is None) or (TotalSegments is not None and not 0 <= Segment < TotalSegments):
+            raise validation_error("Segment must be less than TotalSegments and both must be specified together", operation_name)
+        request = _Request(operation_name, ExpressionAttributeNames, ExpressionAttributeValues, FilterExpression=FilterExpression)
+        with self.resource.lock:
+            table = self.resource.get_table_data(self.name, operation_name)
+            index = table.get_index(IndexName, operation_name)
+            keys, hashes, orders = table.get_scan_order()
+            start = 0
+            if ExclusiveStartKey:
+                start_order = _key_order(table.primary_key(to_dynamodb_item(ExclusiveStartKey), operation_name, exact=False))
+                start = _bisect_right(orders, start_order)
+            def iter_candidates():
+                for position in range(start, len(keys)):
+                    if TotalSegments is not None and hashes[position] % TotalSegments != Segment:
+                        continue
+                    primary_key = keys[position]
+                    item = table.items[primary_key]
+                    if index.name is not None and not all(name in item for name in index.key_attributes):
+                        continue
+                    yield primary_key, item
+            response = self.__read_page(table, index, iter_candidates(), request, Limit, ProjectionExpression, Select)
+        return _with_capacity(response, ReturnConsumedCapacity, self.name,
+                              read_units(response.pop("_read_bytes"), ConsistentRead), index)
+
+    #private method
+    def __read_page(self, table, index, candidates, request, limit, projection_expression, select):
+        # Limit件または1MB分を評価した時点でページを区切り、続きがある場合はLastEvaluatedKeyを返す
+        items       = []
+        scanned     = 0
+        read_bytes  = 0
+        last_entry  = None
+        exhausted   = True
+        filter_condition = request.get_condition("FilterExpression")
+        for entry in candidates:
+            if (limit is not None and scanned >= limit) or read_bytes >= PAGE_SIZE_LIMIT_BYTES:
+                exhausted = False
+                break
+            primary_key, item = entry
+            scanned    += 1
+            read_bytes += table.sizes[primary_key]
+            last_entry  = entry
+            if filter_condition is None or filter_condition[1](item, request.names, request.values):
+                items.append(item)
+        response = {"Count": len(items), "ScannedCount": scanned, "ResponseMetadata": {"HTTPStatusCode": 200}, "_read_bytes": read_bytes}
+        if select != "COUNT":
+            response["Items"] = [_project(item, projection_expression, request.names) for item in items]
+        if not exhausted and last_entry is not None:
+            key_names = table.key.key_attributes + [name for name in index.key_attributes if name not in table.key.key_attributes]
+            response["LastEvaluatedKey"] = {name: last_entry[1][name] for name in key_names}
+        return response
+
+
+class MemoryDynamodbClient():
+    """
+    boto3のDynamoDBクライアントの代わりに使うオブジェクト(低レベルAPIの型付き形式で受け取る)
+
+    Parameters
+    ----------
+    resource : MemoryDynamodbResource
+        データベース
+    """
+    def __init__(self, resource):
+        self.resource     = resource
+        self.deserializer = None
+
+    def transact_write_items(self, TransactItems, ClientRequestToken=None, ReturnConsumedCapacity="NONE", ReturnItemCollectionMetrics="NONE"):
+        """
+        全ての条件を確認してから全て書き込む。条件を満たさないものがあれば1件も書き込まない
+        """
+        operation_name = "TransactWriteItems"
+        self.resource.begin_request(operation_name)
+        if not 0 < len(TransactItems) <= TRANSACT_WRITE_MAX_REQUESTS:
+            raise validation_error("Member must have length less than or equal to {}".format(TRANSACT_WRITE_MAX_REQUESTS), operation_name)
+        with self.resource.lock:
+            if ClientRequestToken and ClientRequestToken in self.resource.transaction_tokens:
+                # 同じトークンの再送は書き込まずに成功として返す
+                return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+            writes  = []
+            reasons = []
+            seen    = set()
+            for transact_item in TransactItems:
+                (action, params), = transact_item.items()
+                table   = self.resource.get_table_data(params["TableName"], operation_name)
+                request = _Request(operation_name, params.get("ExpressionAttributeNames"),
+                                   self.__deserialize(params.get("ExpressionAttributeValues")),
+                                   ConditionExpression=params.get("ConditionExpression"))
+                if action == "Put":
+                    item = self.__deserialize(params["Item"])
+                    table.validate_item(item, operation_name)
+                    primary_key = table.primary_key(item, operation_name, exact=False)
+                else:
+                    key = self.__deserialize(params["Key"])
+                    primary_key = table.primary_key(key, operation_name)
+                if (table.name, primary_key) in seen:
+                    raise validation_error("Transaction request cannot include multiple operations on one item", operation_name)
+                seen.add((table.name, primary_key))
+                old_item = table.items.get(primary_key)
+                if not request.is_condition_satisfied(old_item):
+                    reasons.append({"Code": "ConditionalCheckFailed", "Message": "The conditional request failed"})
+                    continue
+                reasons.append({"Code": "None"})
+                if action == "Put":
+                    writes.append((table, primary_key, item))
+                elif action == "Update":
+                    new_item, _ = request.apply_update(table, key, old_item, params["UpdateExpression"])
+                    table.validate_item(new_item, operation_name)
+                    writes.append((table, primary_key, new_item))
+                elif action == "Delete":
+                    writes.append((table, primary_key, None))
+                elif action != "ConditionCheck":
+                    raise validation_error("Unsupported transaction action: {}".format(action), operation_name)
+            if any(reason["Code"] != "None" for reason in reasons):
+                raise client_error("TransactionCanceledException",
+                    "Transaction cancelled, please refer cancellation reasons for specific reasons [{}]".format(", ".join(reason["Code"] for reason in reasons)),
+                    operation_name, CancellationReasons=reasons)
+            capacities = {}
+            for table, primary_key, item in writes:
+                # トランザクションの書き込みは通常の2倍のキャパシティを消費する
+                capacities[table.name] = capacities.get(table.name, 0.0) + 2 * self.resource.commit(table, primary_key, item)
+            if ClientRequestToken:
+                self.resource.transaction_tokens.append(ClientRequestToken)
+        response = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+        if ReturnConsumedCapacity in ("TOTAL", "INDEXES"):
+            response["ConsumedCapacity"] = [{"TableName": name, "CapacityUnits": units} for name, units in capacities.items()]
+        return response
+
+    def create_table(self, TableName, KeySchema, AttributeDefinitions, GlobalSecondaryIndexes=(), LocalSecondaryIndexes=(), **params):
+        types = {definition["AttributeName"]: definition["AttributeType"] for definition in AttributeDefinitions}
+        hash_key, range_key = self.__key_schema(KeySchema, types)
+        indexes = [MemoryIndex(index["IndexName"], *self.__key_schema(index["KeySchema"], types))
+                   for index in GlobalSecondaryIndexes]
+        indexes += [MemoryIndex(index["IndexName"], *self.__key_schema(index["KeySchema"], types), local=True)
+                    for index in LocalSecondaryIndexes]
+        self.resource.add_table(MemoryTableSchema(TableName, hash_key, range_key, indexes))
+        return {"TableDescription": self.describe_table(TableName)["Table"]}
+
+    def update_table(self, TableName, AttributeDefinitions=(), GlobalSecondaryIndexUpdates=(), **params):
+        types = {definition["AttributeName"]: definition["AttributeType"] for definition in AttributeDefinitions}
+        with self.resource.lock:
+            table = self.resource.get_table_data(TableName, "UpdateTable")
+            for update in GlobalSecondaryIndexUpdates:
+                if "Create" in update:
+                    index = update["Create"]
+                    table.add_index(MemoryIndex(index["IndexName"], *self.__key_schema(index["KeySchema"], types)))
+                elif "Delete" in update:
+                    table.indexes.pop(update["Delete"]["IndexName"], None)
+                    table.partitions.pop(update["Delete"]["IndexName"], None)
+        return {"TableDescription": self.describe_table(TableName)["Table"]}
+
+    def update_time_to_live(self, TableName, TimeToLiveSpecification):
+        # 期限切れのアイテムの削除は模擬しない(属性名のみ記録する)
+        with self.resource.lock:
+            self.resource.get_table_data(TableName, "UpdateTimeToLive").ttl_attribute = TimeToLiveSpecification["AttributeName"]
+        return {"TimeToLiveSpecification": TimeToLiveSpecification}
+
+    def describe_table(self, TableName):
+        with self.resource.lock:
+            table = self.resource.get_table_data(TableName, "DescribeTable")
+            return {"Table": {
+                "TableName": table.name,
+                "TableStatus": "ACTIVE",
+                "ItemCount": len(table.items),
+                "TableSizeBytes": sum(table.sizes.values()),
+                "KeySchema": self.__describe_key(table.key),
+                "GlobalSecondaryIndexes": [{"IndexName": index.name, "IndexStatus": "ACTIVE", "KeySchema": self.__describe_key(index)}
+                                           for index in table.indexes.values() if not index.local],
+                "LocalSecondaryIndexes": [{"IndexName": index.name, "KeySchema": self.__describe_key(index)}
+                                          for index in table.indexes.values() if index.local]
+            }}
+
+    def get_waiter(self, waiter_name):
+        # テーブル・インデックスは即座にACTIVEになるため待たない
+        return _NoWaiter()
+
+    #private method
+    def __deserialize(self, typed_values):
+        if not typed_values:
+            return {}
+        if self.deserializer is None:
+            from boto3.dynamodb.types import TypeDeserializer
+            self.deserializer = TypeDeserializer()
+        return {name: self.deserializer.deserialize(value) for name, value in typed_values.items()}
+
+    def __key_schema(self, key_schema, types):
+        keys = {key["KeyType"]: (key["AttributeName"], types.get(key["AttributeName"], "S")) for key in key_schema}
+        return keys["HASH"], keys.get("RANGE")
+
+    def __describe_key(self, index):
+        return [{"AttributeName": key[0], "KeyType": key_type}
+                for key, key_type in ((index.hash_key, "HASH"), (index.range_key, "RANGE")) if key]
+
+
+class _NoWaiter():
+    def wait(self, **params):
+        return None
+
+
+class _Request():
+    """
+    1リクエスト分の式と置換値
+    boto3のConditionオブジェクト(Key / Attr)は、boto3と同じく1つのビルダーで文字列の式に変換する
+    """
+    def __init__(self, operation_name, names, values, **expressions):
+        self.operation_name = operation_name
+        self.names          = dict(names or {})
+        self.values         = to_dynamodb_item(values or {})
+        self.expressions    = {}
+        builder = None
+        for expression_name, expression in expressions.items():
+            if expression is None or expression == "":
+                continue
+            if not isinstance(expression, str):
+                # boto3のConditionオブジェクト(文字列以外)の場合のみ読み込む
+                from boto3.dynamodb.conditions import ConditionExpressionBuilder
+                builder = builder or ConditionExpressionBuilder()
+                built   = builder.build_expression(expression, is_key_condition=(expression_name == "KeyConditionExpression"))
+                self.names.update(built.attribute_name_placeholders)
+                self.values.update(to_dynamodb_item(built.attribute_value_placeholders))
+                expression = built.condition_expression
+            self.expressions[expression_name] = expression
+
+    def get_condition(self, expression_name):
+        expression = self.expressions.get(expression_name)
+        if expression is None:
+            return None
+        try:
+            return compile_condition(expression)
+        except ClientError as e:
+            raise client_error("ValidationException", "Invalid {}: {}".format(expression_name, e.response["Error"]["Message"]), self.operation_name)
+
+    def is_condition_satisfied(self, item):
+        condition = self.get_condition("ConditionExpression")
+        return condition is None or condition[1](item or {}, self.names, self.values)
+
+    def check_condition(self, item):
+        if not self.is_condition_satisfied(item):
+            raise client_error("ConditionalCheckFailedException", "The conditional request failed", self.operation_name)
+
+    def apply_update(self, table, key, old_item, update_expression):
+        """
+        UpdateExpressionを適用した新しいアイテムと、更新した属性名を返す
+        右辺は全て更新前のアイテムで評価する
+        """
+        base_item = old_item if old_item is not None else key
+        new_item  = dict(base_item)
+        updated_names = []
+        key_names = table.key.key_attributes
+        for clause, path, operand in parse_update_expression(update_expression):
+            name = resolve_name(path[1], self.names)
+            if name in key_names:
+                raise validation_error("One or more parameter values were invalid: Cannot update attribute {}. This attribute is part of the key".format(name), self.operation_name)
+            if name in updated_names:
+                raise validation_error("Invalid UpdateExpression: Two document paths overlap with each other; path one: [{0}], path two: [{0}]".format(name), self.operation_name)
+            updated_names.append(name)
+            current = base_item.get(name, MISSING)
+            if clause == "SET":
+                new_item[name] = self.__evaluate_set_value(operand, base_item)
+            elif clause == "REMOVE":
+                new_item.pop(name, None)
+            elif clause == "ADD":
+                new_item[name] = self.__add(current, resolve_value(operand[1], self.values), name)
+            else:
+                remaining = self.__delete(current, resolve_value(operand[1], self.values), name)
+                if remaining:
+                    new_item[name] = remaining
+                else:
+                    new_item.pop(name, None)
+        return new_item, updated_names
+
+    #private method
+    def __evaluate_set_value(self, node, item):
+        kind = node[0]
+        if kind == "value":
+            return _copy_value(resolve_value(node[1], self.values))
+        if kind == "path":
+            value = item.get(resolve_name(node[1], self.names), MISSING)
+            if value is MISSING:
+                raise validation_error("The provided expression refers to an attribute that does not exist in the item", self.operation_name)
+            return _copy_value(value)
+        if kind == "if_not_exists":
+            value = item.get(resolve_name(node[1][1], self.names), MISSING)
+            return _copy_value(value) if value is not MISSING else self.__evaluate_set_value(node[2], item)
+        if kind == "list_append":
+            left, right = self.__evaluate_set_value(node[1], item), self.__evaluate_set_value(node[2], item)
+            if not isinstance(left, list) or not isinstance(right, list):
+                raise validation_error("An operand in the update expression has an incorrect data type", self.operation_name)
+            return left + right
+        if kind == "arith":
+            left, right = self.__evaluate_set_value(node[2], item), self.__evaluate_set_value(node[3], item)
+            if value_type(left) != "N" or value_type(right) != "N":
+                raise validation_error("An operand in the update expression has an incorrect data type", self.operation_name)
+            return left + right if node[1] == "+" else left - right
+        raise validation_error("Invalid UpdateExpression: unsupported operand {}".format(kind), self.operation_name)
+
+    def __add(self, current, value, name):
+        if current is MISSING:
+            return _copy_value(value)
+        if value_type(current) == "N" and value_type(value) == "N":
+            return current + value
+        if isinstance(current, set) and isinstance(value, set) and value_type(current) == value_type(value):
+            return current | value
+        raise validation_error("An operand in the update expression has an incorrect data type; attribute: {}".format(name), self.operation_name)
+
+    def __delete(self, current, value, name):
+        if current is MISSING:
+            return None
+        if isinstance(current, set) and isinstance(value, set):
+            return current - value
+        raise validation_error("An operand in the update expression has an incorrect data type; attribute: {}".format(name), self.operation_name)
+
+
+def _project(item, projection_expression, names):
+    if not projection_expression:
+        return copy_item(item)
+    attribute_names = [resolve_name(path[1], names) for path in parse_projection_expression(projection_expression)]
+    return copy_item({name: item[name] for name in attribute_names if name in item})
+
+
+def _return_values(return_values, old_item, new_item, updated_names):
+    if return_values in (None, "NONE"):
+        return None
+    if return_values == "ALL_OLD":
+        return copy_item(old_item) if old_item is not None else None
+    if return_values == "ALL_NEW":
+        return copy_item(new_item)
+    source = old_item if return_values == "UPDATED_OLD" else new_item
+    if source is None:
+        return None
+    return copy_item({name: source[name] for name in updated_names if name in source})
+
+
+def _with_capacity(response, return_consumed_capacity, table_name, units, index=None):
+    if return_consumed_capacity in ("TOTAL", "INDEXES"):
+        capacity = {"TableName": table_name, "CapacityUnits": units}
+        if return_consumed_capacity == "INDEXES":
+            if index is None or index.name is None:
+                capacity["Table"] = {"CapacityUnits": units}
+            else:
+                section = "LocalSecondaryIndexes" if index.local else "GlobalSecondaryIndexes"
+                capacity[section] = {index.name: {"CapacityUnits": units}}
+        response["ConsumedCapacity"] = capacity
+    return response
+
+
+def _bisect_left(orders, order):
+    low, high = 0, len(orders)
+    while low < high:
+        middle = (low + high) // 2
+        if orders[middle] < order:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _bisect_right(orders, order):
+    low, high = 0, len(orders)
+    while low < high:
+        middle = (low + high) // 2
+        if order < orders[middle]:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+# ---------------------------------------------------------------------------
+# dynamodb_registryへの組み込み
+# ---------------------------------------------------------------------------
+_shared_resource      = None
+_shared_resource_lock = threading.Lock()
+
+def get_shared_memory_resource():
+    """
+    DYNAMODB_BACKEND=memoryの場合にプロセス内で共有するデータベースを取得する
+    往復時間・スロットリングは環境変数 MEMORY_DYNAMODB_LATENCY_MS / JITTER_MS / THROTTLE_RATE / SEED で指定する
+    """
+    global _shared_resource
+    with _shared_resource_lock:
+        if _shared_resource is None:
+            seed = os.getenv("MEMORY_DYNAMODB_SEED")
+            _shared_resource = MemoryDynamodbResource(
+                latency_ms    = float(os.getenv("MEMORY_DYNAMODB_LATENCY_MS", "0")),
+                jitter_ms     = float(os.getenv("MEMORY_DYNAMODB_JITTER_MS", "0")),
+                throttle_rate = float(os.getenv("MEMORY_DYNAMODB_THROTTLE_RATE", "0")),
+                seed          = int(seed) if seed else None
+            )
+            logger.info("Using in-memory DynamoDB")
+        return _shared_resource
+
+def set_shared_memory_resource(resource):
+    """
+    DYNAMODB_BACKEND=memoryの場合に共有するデータベースを差し替える
+    (ハンドラのモジュールを読み込み直しても、同じデータを参照させる場合に利用する)
+    """
+    global _shared_resource
+    with _shared_resource_lock:
+        _shared_resource = resource
+
+def install_memory_dynamodb(registry=None, resource=None, **options):
+    """
+    dynamodb_registryがインメモリのデータベースを返すようにする
+
+    Parameters
+    ----------
+    registry : DynamodbResourceRegistry
+        組み込むレジストリ。未指定の場合はdynamodb_layer.dynamodb_registry
+    resource : MemoryDynamodbResource
+        利用するデータベース。未指定の場合はoptionsから生成する
+    options : dict
+        MemoryDynamodbResourceのパラメータ
+
+    Returns
+    -------
+    resource : MemoryDynamodbResource
+        組み込んだデータベース
+    """
+    if registry is None:
+        from dynamodb_layer import dynamodb_registry as registry
+    resource = resource or MemoryDynamodbResource(**options)
+    registry.set_resource_factory(lambda: resource)
+    return resource
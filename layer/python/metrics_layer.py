@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import threading
+from functools import wraps
+
+#logger オブジェクト
+from logger_layer import ApplicationLogger
+logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
+
+# CloudWatch Embedded Metric Formatの名前空間
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "MuscleApplication")
+
+
+class InvocationMetrics():
+    """
+    1回のハンドラ呼び出しの間に実行したDynamoDB操作を集計するクラス
+    テーブル・インデックス・操作ごとに呼び出し回数、所要時間、件数、消費キャパシティを集計する
+
+    Lambdaのコンテナは同時に1つの呼び出しのみを処理するため、プロセスで1つのインスタンスを共有する
+    (並列Scanなどのワーカースレッドの操作も同じ呼び出しに集計される)
+    """
+    def __init__(self):
+        self._lock      = threading.Lock()
+        self._listeners = []
+        self.reset()
+
+    def reset(self, function_name="", context=None):
+        """
+        集計を初期化する。ハンドラの呼び出し開始時に呼ぶ
+
+        Parameters
+        ----------
+        function_name : string
+            Lambda関数名
+        context : LambdaContext
+            ハンドラが受け取ったcontext
+        """
+        with self._lock:
+            self.function_name = function_name
+            self.context       = context
+            self.started_at    = time.perf_counter()
+            self._operations   = {}
+            self._counters     = {}
+
+    def record_dynamodb_call(self, table_name, operation, elapsed_ms, response=None, index_name=None):
+        """
+        DynamoDB操作を1件記録する
+
+        Parameters
+        ----------
+        table_name : string
+            テーブル名
+        operation : string
+            操作名(scan, query, put_item など)
+        elapsed_ms : float
+            所要時間(ミリ秒)
+        response : dict
+            DynamoDBのレスポンス(Count, ScannedCount, ConsumedCapacityを集計する)
+        index_name : string
+            インデックス名
+        """
+        response = response or {}
+        call = {
+            "table": table_name,
+            "index": index_name,
+            "operation": operation,
+            "elapsed_ms": elapsed_ms,
+            "items": response.get("Count", 0),
+            "scanned": response.get("ScannedCount", 0),
+            "capacity": self.__sum_capacity(response.get("ConsumedCapacity"))
+        }
+        key = "{}/{}".format(table_name, index_name) if index_name else table_name
+        with self._lock:
+            operations = self._operations.setdefault(key, {})
+            summary    = operations.setdefault(operation, {
+                "calls": 0,
+                "elapsed_ms": 0.0,
+                "items": 0,
+                "scanned": 0,
+                "capacity": 0.0
+            })
+            summary["calls"]      += 1
+            summary["elapsed_ms"] += elapsed_ms
+            summary["items"]      += call["items"]
+            summary["scanned"]    += call["scanned"]
+            summary["capacity"]   += call["capacity"]
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(call)
+
+    def increment(self, counter_name, value=1):
+        """
+        任意のカウンタ(再試行回数など)を加算する
+        """
+        with self._lock:
+            self._counters[counter_name] = self._counters.get(counter_name, 0) + value
+
+    def get_counter(self, counter_name):
+        with self._lock:
+            return self._counters.get(counter_name, 0)
+
+    def snapshot(self):
+        """
+        現在の集計結果を返す
+        """
+        with self._lock:
+            operations = {key: {name: dict(summary) for name, summary in summaries.items()} for key, summaries in self._operations.items()}
+            counters   = dict(self._counters)
+        totals = {"calls": 0, "elapsed_ms": 0.0, "capacity": 0.0}
+        for summaries in operations.values():
+            for summary in summaries.values():
+                totals["calls"]      += summary["calls"]
+                totals["elapsed_ms"] += summary["elapsed_ms"]
+                totals["capacity"]   += summary["capacity"]
+        return {
+            "function": self.function_name,
+            "duration_ms": (time.perf_counter() - self.started_at) * 1000,
+            "dynamodb": totals,
+            "operations": operations,
+            "counters": counters
+        }
+
+    def emit(self):
+        """
+        集計結果をCloudWatch Embedded Metric Formatの1行のJSONとして標準出力へ出力する
+        """
+        metrics = self.snapshot()
+        metric_line = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["FunctionName"]],
+                    "Metrics": [
+                        {"Name": "DynamoDBCalls", "Unit": "Count"},
+                        {"Name": "DynamoDBElapsed", "Unit": "Milliseconds"},
+                        {"Name": "DynamoDBCapacityUnits", "Unit": "Count"},
+                        {"Name": "DynamoDBRetries", "Unit": "Count"}
+                    ]
+                }]
+            },
+            "FunctionName": metrics["function"],
+            "DynamoDBCalls": metrics["dynamodb"]["calls"],
+            "DynamoDBElapsed": round(metrics["dynamodb"]["elapsed_ms"], 3),
+            "DynamoDBCapacityUnits": metrics["dynamodb"]["capacity"],
+            "DynamoDBRetries": metrics["counters"].get("dynamodb_retries", 0),
+            "operations": metrics["operations"],
+            "counters": metrics["counters"]
+        }
+        print(json.dumps(metric_line, default=str))
+        return metrics
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self._listeners.remove(listener)
+
+    #private method
+    def __sum_capacity(self, consumed_capacity):
+        if not consumed_capacity:
+            return 0.0
+        if isinstance(consumed_capacity, dict):
+            consumed_capacity = [consumed_capacity]
+        return float(sum(capacity.get("CapacityUnits", 0) for capacity in consumed_capacity))
+
+
+# プロセスで共有する呼び出しごとの集計
+invocation_metrics = InvocationMetrics()
+
+
+def emit_invocation_metrics(handler):
+    """
+    lambda_handlerに付けるデコレータ
+    呼び出し開始時に集計を初期化し、終了時(例外時も含む)に集計結果を1行出力する
+    """
+    @wraps(handler)
+    def wrapper(event, context):
+        function_name = getattr(context, "function_name", None) or handler.__module__
+        invocation_metrics.reset(function_name, context)
+        try:
+            return handler(event, context)
+        finally:
+            try:
+                invocation_metrics.emit()
+            except Exception as e:
+                logger.warn("Failed emitting metrics")
+                logger.warn(e)
+    return wrapper
+
+
+class capture_dynamodb_calls():
+    """
+    ブロック内で実行したDynamoDB操作を記録するコンテキストマネージャ
+    テストで1リクエストあたりのDynamoDB呼び出し回数を検証するために使う
+
+    Parameters
+    ----------
+    expected : int
+        期待する呼び出し回数。指定した場合、ブロックを抜ける時に一致しなければAssertionErrorを送出する
+
+    Examples
+    --------
+    with capture_dynamodb_calls(expected=2) as calls:
+        app.lambda_handler(event, context)
+    assert calls.count_of("query") == 1
+    """
+    def __init__(self, expected=None):
+        self.expected = expected
+        self.calls    = []
+        self._lock    = threading.Lock()
+
+    @property
+    def count(self):
+        return len(self.calls)
+
+    def count_of(self, operation):
+        return len([call for call in self.calls if call["operation"] == operation])
+
+    def __enter__(self):
+        invocation_metrics.add_listener(self.__record)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        invocation_metrics.remove_listener(self.__record)
+        if exc_type is None and self.expected is not None and self.count != self.expected:
+            raise AssertionError("expected {} DynamoDB calls but {} were made: {}".format(
+                self.expected, self.count, [(call["table"], call["operation"]) for call in self.calls]))
+        return False
+
+    #private method
+    def __record(self, call):
+        with self._lock:
+            self.calls.append(call)
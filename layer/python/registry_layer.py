@@ -0,0 +1,116 @@
+import os
+import threading
+
+#logger オブジェクト
+from logger_layer import ApplicationLogger
+logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
+
+
+class ObjectRegistry():
+    """
+    ハンドラが使うオブジェクト(Todo, FollowRelationなど)を名前ごとに1つだけ生成し、ウォームスタート間で使い回すレジストリ
+    初回の取得時に生成し、2回目以降はロックを取らずに返す。生成はロックの中で1度だけ行う
+
+    DynamodbObjectはテーブルをdynamodb_registry(スレッドごとのリソース)から都度取得するため、
+    生成したオブジェクトは複数のスレッドから共有できる
+    """
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        # ファクトリの中から別のオブジェクトを取得できるようにRLockにする
+        self._lock      = threading.RLock()
+        self._counters  = {"created": 0}
+
+    def register(self, name, factory):
+        """
+        オブジェクトの生成方法を登録する。生成済みのオブジェクトは破棄する(テストでスタブに差し替える場合など)
+
+        Parameters
+        ----------
+        name : string
+            オブジェクトの名前
+        factory : function
+            引数なしでオブジェクトを生成する関数
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name):
+        """
+        オブジェクトを取得する。未生成の場合は生成する
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                if name not in self._factories:
+                    raise KeyError("{} is not registered".format(name))
+                logger.debug("Creating {}".format(name))
+                instance = self._factories[name]()
+                self._instances[name] = instance
+                self._counters["created"] += 1
+            return instance
+
+    def reset(self, name=None):
+        """
+        生成済みのオブジェクトを破棄する(nameを省略した場合は全て)。テストや環境変数の変更時に利用する
+        """
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def get_counters(self):
+        """
+        生成した回数などのカウンタを返す
+        """
+        with self._lock:
+            return dict(self._counters)
+
+
+def _create_todo():
+    from dynamodb_layer import Todo
+    return Todo()
+
+def _create_follow_relation():
+    from dynamodb_layer import FollowRelation
+    return FollowRelation()
+
+def _create_timeline_inbox():
+    from dynamodb_layer import TimelineInbox
+    return TimelineInbox()
+
+
+# プロセスで共有するレジストリ
+object_registry = ObjectRegistry()
+object_registry.register("todo", _create_todo)
+object_registry.register("follow_relation", _create_follow_relation)
+object_registry.register("timeline_inbox", _create_timeline_inbox)
+
+def get_todo():
+    """
+    プロセスで共有するTodoを取得する
+    """
+    return object_registry.get("todo")
+
+def get_follow_relation():
+    """
+    プロセスで共有するFollowRelationを取得する
+    """
+    return object_registry.get("follow_relation")
+
+def get_timeline_inbox():
+    """
+    プロセスで共有するTimelineInboxを取得する
+    """
+    return object_registry.get("timeline_inbox")
+
+def reset_registry():
+    """
+    生成済みのオブジェクトを全て破棄する(テスト用のフック)
+    """
+    object_registry.reset()
@@ -0,0 +1,269 @@
+import os
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+#logger オブジェクト
+from logger_layer import ApplicationLogger
+logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
+
+# タイムラインで返す属性(dynamodb_layer.TODO_PROJECTIONS["timeline"]と同じ)
+TIMELINE_ATTRIBUTES = ("id", "user_name", "name", "weight", "set", "clear_date", "comment")
+# この件数以上の場合にNumPyで集計する(0の場合は使わない)
+# DynamoDBのアイテム(dictの配列)から列を取り出して変換する時間が支配的なため、
+# 既定では100件〜100万件のいずれも純粋なPythonの方が速くメモリも少ない(tests/benchmark/bench_trend.py)
+NUMPY_MIN_ROWS = int(os.getenv("TREND_NUMPY_MIN_ROWS", "0"))
+_EPOCH = date(1970, 1, 1)
+
+
+def load_numpy():
+    """
+    NumPyを読み込む。インストールされていない場合はNoneを返す(純粋なPythonで集計する)
+    """
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def parse_date(value):
+    """
+    DynamoDBの日付の値をdatetime.dateに変換する
+
+    Parameters
+    ----------
+    value : string or Decimal
+        ISO形式の文字列(YYYY-MM-DD, YYYY-MM-DDTHH:MM:SS.ffffff)またはUNIX時間(秒)
+
+    Returns
+    -------
+    date : datetime.date
+        変換できない値(未完了の"0"・None)の場合はNone
+    """
+    if isinstance(value, str):
+        if len(value) < 10 or value[4] != "-" or value[7] != "-":
+            return None
+        try:
+            return date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+        except ValueError:
+            return None
+    if isinstance(value, (Decimal, int, float)) and not isinstance(value, bool) and value > 0:
+        return _EPOCH + timedelta(seconds=int(value))
+    return None
+
+
+def to_number(value):
+    """
+    集計する値を数値(Decimal)に変換する。文字列で保存された値("60"など)も数値として比較する
+
+    Returns
+    -------
+    number : Decimal
+        変換できない値の場合はNone
+    """
+    if isinstance(value, Decimal):
+        return None if value.is_nan() else value
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        number = Decimal(value) if isinstance(value, (int, str)) else Decimal(str(value))
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+    return None if number.is_nan() else number
+
+
+class ColumnFrame():
+    """
+    Todoを列ごとに保持するテーブル(TodoTrendObjectの.df)
+    pandas.DataFrameと同じく df["列名"] で列を取得・差し替えられる。列は初回の参照時にアイテムから取り出す
+
+    Parameters
+    ----------
+    items : list
+        DynamoDBから取得したアイテムの配列
+    """
+    def __init__(self, items):
+        self.items    = items
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, column):
+        return column in self._columns or any(column in item for item in self.items)
+
+    def __getitem__(self, column):
+        if column not in self._columns:
+            self._columns[column] = [item.get(column) for item in self.items]
+        return self._columns[column]
+
+    def get_values(self, column):
+        """
+        列の値を返す。df[列名]と異なり、取り出した列を保持しない(1度しか使わない列でメモリを使わないようにする)
+        """
+        if column in self._columns:
+            return self._columns[column]
+        return [item.get(column) for item in self.items]
+
+    def __setitem__(self, column, values):
+        if len(values) != len(self.items):
+            raise ValueError("Length of values ({}) does not match length of items ({})".format(len(values), len(self.items)))
+        self._columns[column] = values
+
+    @property
+    def columns(self):
+        names = list(self._columns)
+        for item in self.items:
+            names.extend(name for name in item if name not in names)
+        return names
+
+
+class TodoTrendObject():
+    """
+    Todoの推移(トレンド)とタイムラインを生成するクラス(pandas_layer.TodoPandasObjectの置き換え)
+
+    use_numpy、または件数がNUMPY_MIN_ROWS以上の場合は列をNumPyの配列にして集計し(NumPyがない場合は純粋なPython)、
+    それ以外は純粋なPythonで集計する。どちらでも結果は同じになる
+
+    Parameters
+    ----------
+    items : list
+        DynamoDBから取得したTodoの配列
+    use_numpy : bool
+        NumPyを使うか。Noneの場合は件数で判定する
+    """
+    def __init__(self, items, use_numpy=None):
+        self.df    = ColumnFrame(list(items))
+        self.numpy = None
+        if use_numpy or (use_numpy is None and NUMPY_MIN_ROWS > 0 and len(self.df) >= NUMPY_MIN_ROWS):
+            self.numpy = load_numpy()
+            if self.numpy is None:
+                logger.debug("NumPy is not installed. Using pure python")
+
+    def translate_to_datetime_from_decimal(self, column):
+        """
+        日付の列(ISO形式の文字列・UNIX時間)を日付に変換するメソッド
+
+        Parameters
+        ----------
+        column : string
+            列名
+
+        Returns
+        -------
+        dates : list or numpy.ndarray
+            NumPyを使う場合はdatetime64[D]の配列(変換できない値はNaT)、それ以外はdatetime.dateの配列(変換できない値はNone)
+        """
+        values = self.df.get_values(column)
+        if self.numpy is None:
+            return list(map(self.__date_converter(parse_date), values))
+        np         = self.numpy
+        not_a_time = np.iinfo(np.int64).min
+
+        def to_day_number(value):
+            parsed = parse_date(value)
+            return (parsed - _EPOCH).days if parsed is not None else not_a_time
+        day_numbers = np.fromiter(map(self.__date_converter(to_day_number), values), dtype=np.int64, count=len(values))
+        return day_numbers.view("datetime64[D]")
+
+    def get_trend_data(self, column, date_column="clear_date"):
+        """
+        完了日ごとの値の推移を生成するメソッド(同じ日に複数ある場合は最大値)
+
+        Parameters
+        ----------
+        column : string
+            集計する列名(weight, setなど)
+        date_column : string
+            日付の列名。translate_to_datetime_from_decimalで変換していない場合はここで変換する
+
+        Returns
+        -------
+        trend_data : dict
+            日付(YYYY-MM-DD) -> その日の最大値。日付の昇順。値はアイテムの値(Decimal)をそのまま返す
+        """
+        dates  = self.__get_dates(date_column)
+        values = self.df.get_values(column)
+        if self.numpy is None:
+            best = {}
+            for day, value in zip(dates, values):
+                # DynamoDBの数値(Decimal)はそのまま比較し、それ以外(文字列など)のみ変換する
+                number = value if isinstance(value, Decimal) else to_number(value)
+                if day is None or number is None:
+                    continue
+                if day not in best or number >= best[day][0]:
+                    best[day] = (number, value)
+            return {day.strftime("%Y-%m-%d"): best[day][1] for day in sorted(best)}
+        np      = self.numpy
+        numbers = self.__to_float_array(values)
+        valid   = np.flatnonzero(~np.isnat(dates) & ~np.isnan(numbers))
+        if len(valid) == 0:
+            return {}
+        # 日付・値の順に並べ、日付ごとの最後(最大値)の位置を取り出す
+        order       = valid[np.lexsort((numbers[valid], dates[valid]))]
+        sorted_days = dates[order]
+        last        = np.flatnonzero(np.append(sorted_days[1:] != sorted_days[:-1], True))
+        positions   = order[last]
+        return {str(day): values[position] for day, position in zip(sorted_days[last], positions.tolist())}
+
+    def create_timeline_data(self, following_datas):
+        """
+        フォローしているユーザのTodoのみを、返却用のデータ(clear_dateはYYYY-MM-DD)に変換するメソッド
+        並び順は受け取ったTodoの順(新しい順)のまま
+
+        Parameters
+        ----------
+        following_datas : list
+            FollowRelationのアイテム(following_nameを持つ)の配列
+
+        Returns
+        -------
+        timeline_datas : list
+            タイムラインの配列
+        """
+        following_names = {data["following_name"] for data in following_datas}
+        timeline_datas  = []
+        for todo in self.df.items:
+            if todo.get("user_name") not in following_names:
+                continue
+            timeline_data = {attribute: todo[attribute] for attribute in TIMELINE_ATTRIBUTES if attribute in todo}
+            timeline_data["clear_date"] = str(todo.get("clear_date", ""))[:10]
+            timeline_datas.append(timeline_data)
+        return timeline_datas
+
+    #private method
+    @staticmethod
+    def __date_converter(convert):
+        # 同じ日付の値が多いため、文字列の先頭10文字(YYYY-MM-DD)ごとに変換結果を使い回す
+        converted = {}
+
+        def convert_date(value):
+            key = value[:10] if value.__class__ is str else value
+            try:
+                return converted[key]
+            except KeyError:
+                result = converted[key] = convert(value)
+                return result
+        return convert_date
+
+    def __to_float_array(self, values):
+        np = self.numpy
+        try:
+            # Decimal・数値の文字列・NoneはNumPyが変換する(NoneはNaN)
+            return np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            numbers = (to_number(value) for value in values)
+            return np.fromiter((float(number) if number is not None else np.nan for number in numbers), dtype=np.float64, count=len(values))
+
+    def __get_dates(self, date_column):
+        dates = self.df.get_values(date_column)
+        if self.numpy is not None:
+            if isinstance(dates, self.numpy.ndarray) and dates.dtype.kind == "M":
+                return dates.astype("datetime64[D]")
+        elif all(day is None or isinstance(day, date) for day in dates):
+            return [day.date() if isinstance(day, datetime) else day for day in dates]
+        return self.translate_to_datetime_from_decimal(date_column)
+
+
+# pandas_layerからの置き換え用の別名
+TodoPandasObject = TodoTrendObject
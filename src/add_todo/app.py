@@ -4,20 +4,20 @@ from datetime import datetime
 from decimal import Decimal
 from itertools import groupby
 
-import boto3
-from botocore.client import Config
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key, Attr
 
 # 自作モジュール
 from logger_layer import ApplicationLogger
-from dynamodb_layer import Todo
+from metrics_layer import emit_invocation_metrics
+from dynamodb_layer import TODO_REQUIRED_PARAMETERS
+from registry_layer import get_todo
+from cognito_layer import CognitoObject, TokenVerificationError
 
 
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
 
 def is_exist_parameter(post_parameter):
-    param_key_list = ("user_name", "name", "weight", "set", "clear_plan")
+    param_key_list = TODO_REQUIRED_PARAMETERS
     for param_key in param_key_list:
         if param_key not in post_parameter:
             logger.info("{} is not exist in post parameter".format(param_key))
@@ -30,20 +30,37 @@ def decimal_default_proc(obj):
     raise TypeError
 
 def auth_request_user_is_valid(user_name,token):
+    """
+    Access Tokenをローカルで検証し、リクエストのユーザ名と一致するか確認するメソッド
+
+    Parameters
+    ----------
+    user_name : string
+        リクエストパラメータのユーザ名
+    token : string
+        Cognito Access Token
+
+    Returns
+    -------
+    True : boolean
+        トークンのユーザ名とリクエストのユーザ名が一致する場合
+    False : boolean
+        一致しない場合
+
+    Raises
+    ------
+    TokenVerificationError
+        トークンを検証できない場合(公開鍵が取得できない場合を含む)
+    """
     try:
-        aws_client = boto3.client('cognito-idp')
-        logger.debug(aws_client)
-        try:
-            logger.debug("Token: {}".format(token))
-            user = aws_client.get_user(AccessToken=token)
-            logger.debug("User info: {}".format(user))
-            if user_name == user["Username"]:
-                return True
-            else:
-                logger.warn("payload user_name is not same requested user. token is invalid")
-                return False
-        except Exception:
-            raise
+        logger.debug("Token: {}".format(token))
+        claims = CognitoObject.get_user_info_from_access_token(token)
+        logger.debug("User info: {}".format(claims))
+        if claims and user_name == claims.get("username"):
+            return True
+        else:
+            logger.warn("payload user_name is not same requested user. token is invalid")
+            return False
     except Exception as e:
         logger.error("Error is Occured")
         logger.error(e)
@@ -54,6 +71,7 @@ def convert_datetime_from_decimal(decimal_timestamp):
     dt              = datetime.fromtimestamp(float_timestamp)
     return dt.strftime("%Y-%m-%d")
 
+@emit_invocation_metrics
 def lambda_handler(event, context):
     logger.debug(event["headers"])
     post_parameter = json.loads(event["body"])
@@ -94,7 +112,7 @@ def lambda_handler(event, context):
             logger.debug("Development environment.")
         else:
             logger.debug("Production envrionment.")
-        todo_db = Todo()
+        todo_db = get_todo()
         ## 登録データの作成
         todo = {
             "user_name": post_parameter["user_name"],
@@ -117,6 +135,20 @@ def lambda_handler(event, context):
                 'item': register_todo
             })
         }
+    except TokenVerificationError as e:
+        logger.warn("Token is invalid. Return 401 Code")
+        logger.warn(e)
+        return {
+            'statusCode': 401,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                "message": 'Unauthorized',
+            })
+        }
     except ClientError as e:
         logger.debug(e)
         return {
@@ -0,0 +1,178 @@
+import os
+import json
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+# 自作モジュール
+from logger_layer import ApplicationLogger
+from metrics_layer import emit_invocation_metrics
+from registry_layer import get_todo
+from cognito_layer import CognitoObject, TokenVerificationError
+
+
+logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
+
+# 1リクエストで登録できるTodoの最大件数
+MAX_BULK_TODOS = 100
+
+def decimal_default_proc(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+def auth_request_user_is_valid(user_name,token):
+    """
+    Access Tokenをローカルで検証し、リクエストのユーザ名と一致するか確認するメソッド
+
+    Parameters
+    ----------
+    user_name : string
+        リクエストパラメータのユーザ名
+    token : string
+        Cognito Access Token
+
+    Returns
+    -------
+    True : boolean
+        トークンのユーザ名とリクエストのユーザ名が一致する場合
+    False : boolean
+        一致しない場合
+
+    Raises
+    ------
+    TokenVerificationError
+        トークンを検証できない場合(公開鍵が取得できない場合を含む)
+    """
+    try:
+        logger.debug("Token: {}".format(token))
+        claims = CognitoObject.get_user_info_from_access_token(token)
+        logger.debug("User info: {}".format(claims))
+        if claims and user_name == claims.get("username"):
+            return True
+        else:
+            logger.warn("payload user_name is not same requested user. token is invalid")
+            return False
+    except Exception as e:
+        logger.error("Error is Occured")
+        logger.error(e)
+        raise
+
+def is_valid_bulk_parameter(post_parameter):
+    """
+    一括登録のパラメータを検証するメソッド
+
+    Parameters
+    ----------
+    post_parameter : dict
+        POSTメソッドで送られたパラメータ
+
+    Returns
+    -------
+    True : boolean
+        todosが1件以上MAX_BULK_TODOS件以下の配列の場合
+    False : boolean
+        上記以外の場合
+    """
+    if "user_name" not in post_parameter or "todos" not in post_parameter:
+        logger.info("user_name or todos is not exist in post parameter")
+        return False
+    todos = post_parameter["todos"]
+    if not isinstance(todos, list) or not 0 < len(todos) <= MAX_BULK_TODOS:
+        logger.info("todos must be a list of 1 to {} items".format(MAX_BULK_TODOS))
+        return False
+    return True
+
+@emit_invocation_metrics
+def lambda_handler(event, context):
+    logger.debug(event["headers"])
+    post_parameter = json.loads(event["body"])
+    # ユーザの正当性を確認する
+    try:
+        user_name = post_parameter["user_name"] if "user_name" in post_parameter else ""
+        token     = post_parameter["access_token"]  if "access_token" in post_parameter else ""
+        is_user_valid = auth_request_user_is_valid(user_name, token)
+        if is_user_valid is not True:
+            logger.warn(is_user_valid)
+            return {
+                'statusCode': 403,
+                'headers': {
+                    "Access-Control-Allow-Origin": "*",
+                    "Access-Control-Allow-Credentials": True,
+                    "Access-Control-Allow-Headers": "*"
+                },
+                'body': json.dumps({
+                    "message": 'Access is Denied',
+                })
+            }
+        # parameterが不正な場合は失敗を返す
+        if is_valid_bulk_parameter(post_parameter) is False:
+            logger.info("parameter is in valid")
+            return {
+                'statusCode': 422,
+                'headers': {
+                    "Access-Control-Allow-Origin": "*",
+                    "Access-Control-Allow-Credentials": True,
+                    "Access-Control-Allow-Headers": "*"
+                },
+                'body': json.dumps({
+                    "message": "not set parameter.",
+                })
+            }
+        todo_db = get_todo()
+        ## 登録データの作成。ユーザ名はトークンで検証したものに揃える
+        todos = [dict(todo, user_name=user_name) if isinstance(todo, dict) else todo for todo in post_parameter["todos"]]
+        results = todo_db.put_todos(todos)
+        logger.debug("Bulk results: {}".format(results))
+        #結果をリターン
+        return {
+            'statusCode': 200,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                'items': results
+            }, default=decimal_default_proc)
+        }
+    except TokenVerificationError as e:
+        logger.warn("Token is invalid. Return 401 Code")
+        logger.warn(e)
+        return {
+            'statusCode': 401,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                "message": 'Unauthorized',
+            })
+        }
+    except ClientError as e:
+        logger.debug(e)
+        return {
+            'statusCode': 500,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "AllowHeaders": "Content-Type,X-Amz-Date,authorization,X-Api-Key,X-Amz-Security-Token"
+            },
+            'body': json.dumps({
+                "message": str(e),
+            })
+        }
+    except Exception as e:
+        logger.debug(e)
+        return {
+            'statusCode': 500,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "AllowHeaders": "Content-Type,X-Amz-Date,authorization,X-Api-Key,X-Amz-Security-Token"
+            },
+            'body': json.dumps({
+                'message': str(e),
+            })
+        }
@@ -3,16 +3,14 @@ import json
 from datetime import datetime
 from decimal import Decimal
 
-import boto3
-from botocore.client import Config
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key, Attr
 
 # 自作モジュール
 from logger_layer import ApplicationLogger
-from dynamodb_layer import Todo
-from cognito_layer import CognitoObject
-from pandas_layer import TodoPandasObject
+from metrics_layer import emit_invocation_metrics
+from registry_layer import get_todo
+from trend_layer import TodoTrendObject
+from cognito_layer import CognitoObject, TokenVerificationError
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
 
 
@@ -31,6 +29,7 @@ def get_user_name_from_id_token(id_token):
     else:
         return ""
 
+@emit_invocation_metrics
 def lambda_handler(event, context):
     logger.debug(event)
     post_parameters = json.loads(event["body"])
@@ -72,22 +71,22 @@ def lambda_handler(event, context):
             logger.debug("Development environment.")
         else:
             logger.debug("Production envrionment.")
-        todo_db = Todo()
+        todo_db = get_todo()
         ## 解析データの取得
         logger.debug("Gathering data from DB")
-        menu_dynamo_datas = todo_db.get_muscle_menu_data(user_name, menu_name)
+        menu_dynamo_datas = todo_db.get_muscle_menu_data(user_name, menu_name, projection="trend")
         logger.debug("Gathered data. {}".format(menu_dynamo_datas))
-        ## PandasObejct
-        pd_object = TodoPandasObject(menu_dynamo_datas)
+        ## TrendObject(件数が多い場合のみNumPyで集計する)
+        trend_object = TodoTrendObject(menu_dynamo_datas)
         #日付をフォーマット
-        pd_object.df["clear_plan"] = pd_object.translate_to_datetime_from_decimal("clear_plan")
-        pd_object.df["clear_date"] = pd_object.translate_to_datetime_from_decimal("clear_date")
+        trend_object.df["clear_plan"] = trend_object.translate_to_datetime_from_decimal("clear_plan")
+        trend_object.df["clear_date"] = trend_object.translate_to_datetime_from_decimal("clear_date")
         # Trend Dataを取得
         logger.debug("Getting trend data for weight")
-        weight_trend_data          = pd_object.get_trend_data("weight")
+        weight_trend_data          = trend_object.get_trend_data("weight")
         logger.debug("Completeing trend data for weight")
         logger.debug("Getting trend data for set")
-        set_trend_data             = pd_object.get_trend_data("set")
+        set_trend_data             = trend_object.get_trend_data("set")
         logger.debug("Completing trend data for set")
         return_data = {
             'weight': weight_trend_data,
@@ -105,6 +104,20 @@ def lambda_handler(event, context):
                 'item': return_data
             }, default=decimal_default_proc)
         }
+    except TokenVerificationError as e:
+        logger.warn("Token is invalid. Return 401 Code")
+        logger.warn(e)
+        return {
+            'statusCode': 401,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                "message": 'Unauthorized',
+            })
+        }
     except ClientError as e:
         logger.warn("Failed. ClientError is occured.")
         logger.warn(e)
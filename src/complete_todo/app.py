@@ -4,15 +4,14 @@ from datetime import datetime
 from decimal import Decimal
 from itertools import groupby
 
-import boto3
-from botocore.client import Config
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key, Attr
 
 # 自作モジュール
 from logger_layer import ApplicationLogger
-from dynamodb_layer import Todo
-from cognito_layer import CognitoObject
+from metrics_layer import emit_invocation_metrics
+from registry_layer import get_todo
+from dynamodb_layer import TodoNotFoundError
+from cognito_layer import CognitoObject, TokenVerificationError
 
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
 
@@ -43,6 +42,7 @@ def get_user_name_from_id_token(id_token):
     else:
         return ""
 
+@emit_invocation_metrics
 def lambda_handler(event, context):
     logger.debug(event)
     post_parameter = json.loads(event["body"])
@@ -83,12 +83,13 @@ def lambda_handler(event, context):
             logger.debug("Development environment.")
         else:
             logger.debug("Production envrionment.")
-        todo_db = Todo()
+        todo_db = get_todo()
         ## Todoの更新
         complete_info = {
             "id": post_parameter["id"],
             "clear_date": post_parameter["clear_date"],
-            "comment": post_parameter["comment"]
+            "comment": post_parameter["comment"],
+            "user_name": user_name
         }
         logger.debug("todo(id:{}) is complete. Changing status".format(complete_info["id"]))
         complete_resopnse = todo_db.complete_todo(complete_info)
@@ -111,6 +112,47 @@ def lambda_handler(event, context):
                 'item': return_data
             }, default=decimal_default_proc)
         }
+    except TokenVerificationError as e:
+        logger.warn("Token is invalid. Return 401 Code")
+        logger.warn(e)
+        return {
+            'statusCode': 401,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                "message": 'Unauthorized',
+            })
+        }
+    except TodoNotFoundError as e:
+        logger.info(e)
+        return {
+            'statusCode': 404,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                "message": str(e),
+            })
+        }
+    except ValueError as e:
+        # 完了日の形式が不正な場合
+        logger.info(e)
+        return {
+            'statusCode': 400,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                "message": "clear_date is invalid. Use YYYY-MM-DD",
+            })
+        }
     except ClientError as e:
         logger.warn("Failed changing status. ClientError is occured.")
         logger.warn(e)
@@ -2,69 +2,71 @@ import os
 import json
 from datetime import datetime
 from decimal import Decimal
-from itertools import groupby
 
-from botocore.client import Config
 from botocore.exceptions import ClientError
 
 # 自作モジュール
 from logger_layer import ApplicationLogger
-from dynamodb_layer import Todo
+from metrics_layer import emit_invocation_metrics
+from registry_layer import get_todo
+from aggregation_layer import count_by
 
-def create_datetime_from_time_stamp(time_stmap):
-    dt = datetime.fromtimestamp(time_stmap)
+logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
+
+def convert_datetime_from_iso_format_string(iso_string):
+    dt = datetime.strptime(iso_string, '%Y-%m-%dT%H:%M:%S.%f')
     return dt.strftime("%Y-%m-%d")
 
-def convert_decimal_in_data(items):
-    if len(items) == 0 :
-        return []
-    convert_items_list = []
-    for item in items:
-        clear_date = float(item["clear_date"])
-        convert_item = {
-            "name": item["name"],
-            "clear_date": create_datetime_from_time_stamp(clear_date)
-        }
-        convert_items_list.append(convert_item)
-    return convert_items_list
+def create_graph_data(clear_todos):
+    # メニュー名ごと・完了日ごとの件数を1度の走査で数える(キーの昇順)
+    graph_data = count_by(clear_todos, {
+        "pie": "name",
+        "line": lambda todo: convert_datetime_from_iso_format_string(todo["clear_date"])
+    })
+    return graph_data["pie"], graph_data["line"]
 
-def group_by_item(items, key_attribute):
-    group_item_map = {}
-    items.sort(key=lambda item: item[key_attribute])
-    group_by_item = groupby(items, key=lambda item: item[key_attribute])
-    for key, group in group_by_item:
-        group_list = list(group)
-        item_map = {
-            key: len(group_list)
-        }
-        group_item_map.update(item_map)
-    return group_item_map
-    
+def seed_aggregate(todo_db, user_name, clear_todos, aggregate_item):
+    """
+    次回から集計を1件読むだけで済むように、全件から数えた集計を書き込む
+    読み込んだ後に加算された場合は書き込まない。書き込めなくてもグラフは返す
+    """
+    try:
+        item = todo_db.aggregate.build_aggregate_item(user_name, clear_todos)
+        if todo_db.aggregate.put_built_item(item, aggregate_item):
+            logger.info("Aggregate of {} is built".format(user_name))
+    except ClientError as e:
+        logger.warn("Failed building aggregate")
+        logger.warn(e)
+
+@emit_invocation_metrics
 def lambda_handler(event, context):
     # table取得
     try:
         # リソース取得
         if os.getenv("AWS_SAM_LOCAL"):
             logger.debug("Development environment.")
-            todo_db = Todo("dev")
         else:
             logger.debug("Production envrionment.")
-            todo_db = Todo()
+        todo_db = get_todo()
         # response用
         pie_graph_datas  = []
         line_graph_datas = [] 
         # Access Token 取得
         user_name  = event["pathParameters"]["user_name"]
-        todo_table = dynamodb_resouse.Table('Todos')
-        # Item取得
-        db_response = todo_table.scan(
-            FilterExpression=Attr('user_name').eq(user_name) & Attr('is_cleared').eq(True)
-        )
-        # 円グラフデータの生成 トレーニングメニューでgroupby
-        items = convert_decimal_in_data(db_response["Items"])
-        if len(items) > 0:
-            pie_graph_datas  = group_by_item(items, "name")
-            line_graph_datas = group_by_item(items, "clear_date")
+        # 集計済みのアイテムを1件読み込む
+        aggregate_item = todo_db.aggregate.get_aggregate_item(user_name)
+        if todo_db.aggregate.is_built(aggregate_item):
+            chart_data       = todo_db.aggregate.convert_chart_data(aggregate_item)
+            pie_graph_datas  = chart_data["pie"]
+            line_graph_datas = chart_data["line"]
+        else:
+            # 集計が未作成・全件から作り直されていない場合は完了ずみTodoから集計する(グラフに必要なname, clear_dateのみ取得)
+            logger.info("Aggregate is not built. Grouping clear todos")
+            clear_todos = todo_db.get_clear_todos_for_chart(user_name)
+            # 円グラフ(トレーニングメニューごと)・折れ線グラフ(完了日ごと)のデータの生成
+            if len(clear_todos) > 0:
+                pie_graph_datas, line_graph_datas = create_graph_data(clear_todos)
+            seed_aggregate(todo_db, user_name, clear_todos, aggregate_item)
         return {
             'statusCode': 200,
             'headers': {
@@ -2,8 +2,6 @@ import os
 import json
 # 自作モジュール
 from logger_layer import ApplicationLogger
-from dynamodb_layer import Todo
-
 
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
 
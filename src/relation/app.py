@@ -2,15 +2,11 @@ import os
 import json
 from datetime import datetime
 
-import boto3
-from botocore.client import Config
-from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key, Attr
-
 # 自作モジュール
 from logger_layer import ApplicationLogger
-from cognito_layer import CognitoObject
-from dynamodb_layer import FollowRelation
+from metrics_layer import emit_invocation_metrics
+from cognito_layer import CognitoObject, TokenVerificationError
+from registry_layer import get_follow_relation
 
 
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
@@ -63,6 +59,7 @@ def get_user_name_from_id_token(id_token):
     else:
         return ""
 
+@emit_invocation_metrics
 def lambda_handler(event, context):
     logger.debug(event["headers"])
     post_parameter = json.loads(event["body"])
@@ -104,7 +101,7 @@ def lambda_handler(event, context):
             "follower_name": follower_name
         }
         logger.debug("Post Function is working.")
-        relation_db = FollowRelation()
+        relation_db = get_follow_relation()
         result      = relation_db.put_follow_relation(params)
         logger.debug("Success FollowRealtion")
         logger.debug(result)
@@ -120,6 +117,20 @@ def lambda_handler(event, context):
                 'item': result
             })
         }
+    except TokenVerificationError as e:
+        logger.warn("Token is invalid. Return 401 Code")
+        logger.warn(e)
+        return {
+            'statusCode': 401,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                "message": 'Unauthorized',
+            })
+        }
     except Exception as e:
         logger.warn(e)
         logger.warn("Failed. Lambda function.")
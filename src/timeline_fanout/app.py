@@ -0,0 +1,104 @@
+import os
+
+from botocore.exceptions import ClientError
+
+# 自作モジュール
+from logger_layer import ApplicationLogger
+from metrics_layer import emit_invocation_metrics
+from dynamodb_layer import TODO_PROJECTIONS
+from registry_layer import get_timeline_inbox
+
+logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
+
+# boto3.dynamodb.typesは読み込みが重いため、初回のレコード処理時に生成する
+deserializer = None
+
+def get_deserializer():
+    global deserializer
+    if deserializer is None:
+        from boto3.dynamodb.types import TypeDeserializer
+        deserializer = TypeDeserializer()
+    return deserializer
+
+def deserialize_image(image):
+    """
+    DynamoDB Streamsのイメージ(型つきの属性)をPythonの辞書に変換するメソッド
+
+    Parameters
+    ----------
+    image : dict
+        NewImage / OldImage
+
+    Returns
+    -------
+    item : dict
+        変換後のアイテム。イメージがない場合はNone
+    """
+    if not image:
+        return None
+    deserialize = get_deserializer().deserialize
+    return {name: deserialize(value) for name, value in image.items()}
+
+def is_cleared(todo):
+    return todo is not None and todo.get("clear_date", "0") != "0"
+
+def is_timeline_changed(old_todo, new_todo):
+    """
+    タイムラインに表示する属性が変わったか判定するメソッド
+    """
+    if not is_cleared(old_todo):
+        return True
+    return any(old_todo.get(attribute) != new_todo.get(attribute) for attribute in TODO_PROJECTIONS["timeline"])
+
+def process_record(timeline_inbox, record):
+    """
+    Todosテーブルの変更1件をフォロワーのタイムラインへ反映するメソッド
+
+    Parameters
+    ----------
+    timeline_inbox : TimelineInbox
+        タイムラインのテーブル
+    record : dict
+        DynamoDB Streamsのレコード
+
+    Returns
+    -------
+    action : string
+        fan_out / remove / skip
+    """
+    old_todo = deserialize_image(record["dynamodb"].get("OldImage"))
+    new_todo = deserialize_image(record["dynamodb"].get("NewImage"))
+    previous_sort_key = timeline_inbox.build_sort_key(old_todo["clear_date"], old_todo["id"]) if is_cleared(old_todo) else None
+    if is_cleared(new_todo):
+        if not is_timeline_changed(old_todo, new_todo):
+            return "skip"
+        entry = timeline_inbox.build_entry(new_todo)
+        owner_names = timeline_inbox.fan_out(entry, previous_sort_key)
+        logger.debug("todo(id:{}) is written to {} timelines".format(new_todo["id"], len(owner_names)))
+        return "fan_out"
+    if previous_sort_key:
+        # 削除・未完了に戻したTodoはタイムラインから除く
+        timeline_inbox.remove(old_todo["user_name"], previous_sort_key)
+        return "remove"
+    return "skip"
+
+@emit_invocation_metrics
+def lambda_handler(event, context):
+    """
+    TodosテーブルのDynamoDB Streams(NEW_AND_OLD_IMAGES)を受け取り、完了したTodoをフォロワーのタイムラインへ書き込む
+    失敗したレコードはbatchItemFailuresで返し、そのレコード以降を再実行させる(ReportBatchItemFailures)
+    """
+    timeline_inbox = get_timeline_inbox()
+    for record in event.get("Records", []):
+        try:
+            action = process_record(timeline_inbox, record)
+            logger.debug("{} {}".format(record["eventName"], action))
+        except ClientError as e:
+            logger.warn("Failed fan-out. ClientError is occured.")
+            logger.warn(e)
+            return {"batchItemFailures": [{"itemIdentifier": record["dynamodb"]["SequenceNumber"]}]}
+        except Exception as e:
+            logger.warn("Failed fan-out. Some Exception is occured")
+            logger.warn(e)
+            return {"batchItemFailures": [{"itemIdentifier": record["dynamodb"]["SequenceNumber"]}]}
+    return {"batchItemFailures": []}
@@ -1,20 +1,145 @@
 import os
 import json
-from datetime import datetime
+import base64
+from itertools import chain, islice
+from datetime import datetime, timedelta
 from decimal import Decimal
 
-import boto3
-from botocore.client import Config
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key, Attr
 
 # 自作モジュール
 from logger_layer import ApplicationLogger
-from dynamodb_layer import Todo, FollowRelation
-from cognito_layer import CognitoObject
-from pandas_layer import TodoPandasObject
+from metrics_layer import emit_invocation_metrics
+from dynamodb_layer import TODO_PROJECTIONS
+from registry_layer import get_todo, get_follow_relation, get_timeline_inbox
+from concurrency_layer import run_concurrently
+from cognito_layer import CognitoObject, TokenVerificationError
+from trend_layer import TodoTrendObject
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
 
+# タイムラインの期間(X日前まで)
+TIMELINE_AGO_DAYS = -14
+# 1ページの件数(既定値・最大値)
+DEFAULT_TIMELINE_LIMIT = 20
+MAX_TIMELINE_LIMIT     = 100
+
+def decimal_default_proc(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+def is_timeline_inbox_enabled():
+    """
+    フォロワーごとのタイムライン(TimelineInbox)から読み込むか判定するメソッド
+    timeline_fanout関数とテーブルを用意した環境でTIMELINE_INBOX_ENABLED=trueにする
+    """
+    return os.getenv("TIMELINE_INBOX_ENABLED", "false").lower() == "true"
+
+def encode_cursor(todo):
+    """
+    ページの最後のTodoの(clear_date, id)から次のページのカーソルを生成するメソッド
+    """
+    cursor_json = json.dumps({"clear_date": todo["clear_date"], "id": int(todo["id"])})
+    return base64.urlsafe_b64encode(cursor_json.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """
+    カーソルを(clear_date, id)に戻すメソッド
+
+    Raises
+    ------
+    ValueError
+        カーソルが不正な場合
+    """
+    try:
+        cursor_json = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        position    = json.loads(cursor_json)
+        return (str(position["clear_date"]), int(position["id"]))
+    except (TypeError, KeyError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("cursor is invalid. {}".format(e))
+
+def parse_page_parameter(query_parameters):
+    """
+    クエリパラメータからlimit, cursorを取得するメソッド
+
+    Returns
+    -------
+    limit : int
+        1ページの件数(1〜MAX_TIMELINE_LIMIT)
+    before : tuple
+        カーソルの(clear_date, id)。1ページ目の場合はNone
+
+    Raises
+    ------
+    ValueError
+        パラメータが不正な場合
+    """
+    query_parameters = query_parameters or {}
+    limit = int(query_parameters.get("limit") or DEFAULT_TIMELINE_LIMIT)
+    if not 0 < limit <= MAX_TIMELINE_LIMIT:
+        raise ValueError("limit must be 1 to {}".format(MAX_TIMELINE_LIMIT))
+    cursor = query_parameters.get("cursor")
+    return limit, decode_cursor(cursor) if cursor else None
+
+def get_timeline_page(user_name, limit, before=None):
+    """
+    フォローしているユーザの完了ずみTodoを新しい順に1ページ分取得するメソッド
+    フォローしているユーザの取得と、それに依存しないタイムラインの読み込みを並行に実行する。
+    フォローしているユーザで絞り込んでから数え、1ページ分(+次ページの有無の確認用に1件)を読んだ時点で読み込みをやめる
+
+    Parameters
+    ----------
+    user_name : string
+        ユーザ名
+    limit : int
+        1ページの件数
+    before : tuple
+        カーソルの(clear_date, id)
+
+    Returns
+    -------
+    following_datas : list
+        フォローしているユーザのデータ
+    page : list
+        タイムラインのTodo
+    next_cursor : string
+        次のページのカーソル。最後のページの場合はNone
+    """
+    follow_relation_db = get_follow_relation()
+    tasks = {
+        # フォローしているユーザを取得
+        "following": lambda: follow_relation_db.get_following_users_queried_by_user_name(user_name= user_name)
+    }
+    if is_timeline_inbox_enabled():
+        timeline_inbox     = get_timeline_inbox()
+        tasks["celebrities"] = timeline_inbox.get_celebrities
+        results            = run_concurrently(tasks)
+        following_names    = {data["following_name"] for data in results["following"]}
+        since              = (datetime.now() + timedelta(days = TIMELINE_AGO_DAYS)).isoformat(timespec='microseconds')
+        timeline           = timeline_inbox.iter_timeline(user_name, following_names, since_sort_key=since,
+                                before_sort_key=timeline_inbox.build_sort_key(*before) if before else None,
+                                page_size=limit + 1, celebrities=results["celebrities"])
+    else:
+        # 新しい順の読み込みはユーザに依存しないため、先頭を読み込みながらフォローしているユーザを取得する
+        todos              = get_todo().iter_clear_todos_newest_first(TIMELINE_AGO_DAYS, before, projection="timeline")
+        tasks["head"]      = lambda: list(islice(todos, limit + 1))
+        results            = run_concurrently(tasks)
+        following_names    = {data["following_name"] for data in results["following"]}
+        timeline           = (todo for todo in chain(results["head"], todos) if todo["user_name"] in following_names)
+    page        = list(islice(timeline, limit + 1))
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return results["following"], page[:limit], next_cursor
+
+def convert_timeline_data(todos):
+    """
+    タイムラインのTodoを返却用のデータ(clear_dateはYYYY-MM-DD)に変換するメソッド
+    """
+    timeline_datas = []
+    for todo in todos:
+        timeline_data = {attribute: todo[attribute] for attribute in TODO_PROJECTIONS["timeline"] if attribute in todo}
+        timeline_data["clear_date"] = todo["clear_date"][:10]
+        timeline_datas.append(timeline_data)
+    return timeline_datas
 
 
 def get_user_name_from_id_token(id_token):
@@ -41,6 +166,28 @@ def get_user_name_from_id_token(id_token):
     else:
         return ""
 
+def response_401():
+    """
+    401コードのレスポンスパラメータ(トークンを検証できない場合)
+
+    Returns
+    -------
+    unauthorized_response : dicstionary
+        レスポンスパラメータ
+    """
+    unauthorized_response = {
+                    'statusCode': 401,
+                    'headers': {
+                        "Access-Control-Allow-Origin": "*",
+                        "Access-Control-Allow-Credentials": True,
+                        "Access-Control-Allow-Headers": "*"
+                    },
+                    'body': json.dumps({
+                        "message": 'Unauthorized',
+                    })
+                }
+    return unauthorized_response
+
 def response_403():
     """
     403コードのレスポンスパラメータ
@@ -62,6 +209,7 @@ def response_403():
                     })
                 }
     return unauthorized_response
+@emit_invocation_metrics
 def lambda_handler(event, context):
     logger.debug(event)
     # todo name
@@ -77,17 +225,31 @@ def lambda_handler(event, context):
             logger.debug("Development environment.")
         else:
             logger.debug("Production envrionment.")
-        todo_db = Todo()
-        follow_relation_db = FollowRelation()
+        # ページの指定を取得
+        try:
+            limit, before = parse_page_parameter(event.get("queryStringParameters"))
+        except ValueError as e:
+            logger.info(e)
+            return {
+                'statusCode': 400,
+                'headers': {
+                    "Access-Control-Allow-Origin": "*",
+                    "Access-Control-Allow-Credentials": True,
+                    "Access-Control-Allow-Headers": "*"
+                },
+                'body': json.dumps({
+                    "message": str(e),
+                })
+            }
         ## 解析データの取得
         logger.debug("Getting timelines")
-        #　タイムラインの取得
-        timeline_datas  = todo_db.get_clear_todos_within_a_month(ago_days=-14)
-        # フォローしているユーザを取得
-        following_datas = follow_relation_db.get_following_users_queried_by_user_name(user_name= user_name)
-        # Pandas生成
-        pd_object     = TodoPandasObject(timeline_datas)
-        timeline_datas = pd_object.create_timeline_data(following_datas)
+        #　タイムラインを1ページ分取得
+        following_datas, timeline_todos, next_cursor = get_timeline_page(user_name, limit, before)
+        if is_timeline_inbox_enabled():
+            timeline_datas = convert_timeline_data(timeline_todos)
+        else:
+            trend_object   = TodoTrendObject(timeline_todos)
+            timeline_datas = trend_object.create_timeline_data(following_datas)
         logger.debug(type(timeline_datas))
         # Trend Dataを取得
         #結果をリターン
@@ -99,9 +261,14 @@ def lambda_handler(event, context):
                 "Access-Control-Allow-Headers": "*"
             },
             'body': json.dumps({
-                'item': timeline_datas
-            })
+                'item': timeline_datas,
+                'next_cursor': next_cursor
+            }, default=decimal_default_proc)
         }
+    except TokenVerificationError as e:
+        logger.warn("Token is invalid. Return 401 Code")
+        logger.warn(e)
+        return response_401()
     except ClientError as e:
         logger.warn("Failed. ClientError is occured.")
         logger.warn(e)
@@ -1,18 +1,17 @@
 import os
 import json
-import boto3
 
 from datetime import datetime
 from decimal import Decimal
-from itertools import groupby
 
-from botocore.client import Config
 from botocore.exceptions import ClientError
 
 # 自作モジュール
 from logger_layer import ApplicationLogger
-from dynamodb_layer import Todo
-from cognito_layer import CognitoObject
+from metrics_layer import emit_invocation_metrics
+from registry_layer import get_todo
+from cognito_layer import CognitoObject, TokenVerificationError
+from aggregation_layer import count_by
 
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
 
@@ -25,27 +24,12 @@ def convert_datetime_from_iso_format_string(iso_string):
     dt              = datetime.strptime(iso_string, '%Y-%m-%dT%H:%M:%S.%f')
     return dt.strftime('%Y-%m-%d')
 
-def group_by_item(items, key_attribute):
-    group_items_obj = {}
-    items.sort(key = lambda item: item[key_attribute])
-    gropuby_items = groupby(items, key=lambda item: item[key_attribute])
-    for key, group in gropuby_items:
-        # 要素数を出すためにlistへ変換
-        group_list = list(group)
-        group_data_obj = {
-            key: len(group_list)
-        }
-        group_items_obj.update(group_data_obj)
-    return group_items_obj
-
 def create_chart_data(clear_todos):
-    chart_data= [{"name":todo["name"],"clear_date": convert_datetime_from_iso_format_string(todo['clear_date'])} for todo in clear_todos]
-    pie_chart_data  = group_by_item(chart_data, "name")
-    line_chart_data = group_by_item(chart_data, "clear_date")
-    return {
-        "pie": pie_chart_data,
-        "line": line_chart_data
-    }
+    # メニュー名ごと・完了日ごとの件数を1度の走査で数える(キーの昇順)
+    return count_by(clear_todos, {
+        "pie": "name",
+        "line": lambda todo: convert_datetime_from_iso_format_string(todo["clear_date"])
+    })
 
 def get_user_name_from_id_token(id_token):
     logger.debug("id_token: {}".format(id_token))
@@ -54,6 +38,7 @@ def get_user_name_from_id_token(id_token):
     logger.debug(user_info)
     return user_info["cognito:username"]
 
+@emit_invocation_metrics
 def lambda_handler(event, context):
     logger.debug(event)
     # table取得
@@ -63,7 +48,7 @@ def lambda_handler(event, context):
             logger.debug("Development environment.")
         else:
             logger.debug("Production envrionment.")
-        todo_db = Todo()
+        todo_db = get_todo()
         # response用
         non_clear_todos = []
         clear_todos     = []
@@ -106,6 +91,20 @@ def lambda_handler(event, context):
                 },
             }, default=decimal_default_proc)
         }
+    except TokenVerificationError as e:
+        logger.warn("Token is invalid. Return 401 Code")
+        logger.warn(e)
+        return {
+            'statusCode': 401,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                "message": 'Unauthorized',
+            })
+        }
     except ClientError as e:
         logger.warn(e)
         return {
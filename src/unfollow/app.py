@@ -2,15 +2,11 @@ import os
 import json
 from datetime import datetime
 
-import boto3
-from botocore.client import Config
-from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key, Attr
-
 # 自作モジュール
 from logger_layer import ApplicationLogger
-from cognito_layer import CognitoObject
-from dynamodb_layer import FollowRelation
+from metrics_layer import emit_invocation_metrics
+from cognito_layer import CognitoObject, TokenVerificationError
+from registry_layer import get_follow_relation
 
 
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
@@ -38,6 +34,7 @@ def get_user_name_from_id_token(id_token):
         return user_info["cognito:username"]
     else:
         return ""
+@emit_invocation_metrics
 def lambda_handler(event, context):
     logger.debug(event)
     # ユーザの正当性を確認する
@@ -61,7 +58,7 @@ def lambda_handler(event, context):
         #relationを削除
         relation_id = event['pathParameters']['id']
         logger.debug("Delete Function is working.")
-        relation_db  = FollowRelation()
+        relation_db  = get_follow_relation()
         query_params = {
             'follower_name': follower_name,
             'relation_id': relation_id
@@ -79,6 +76,20 @@ def lambda_handler(event, context):
                 "message": "success unfollow"
             })
         }
+    except TokenVerificationError as e:
+        logger.warn("Token is invalid. Return 401 Code")
+        logger.warn(e)
+        return {
+            'statusCode': 401,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                "message": 'Unauthorized',
+            })
+        }
     except Exception as e:
         logger.warn(e)
         logger.warn("Failed. Lambda function.")
@@ -4,15 +4,13 @@ from datetime import datetime
 from decimal import Decimal
 from itertools import groupby
 
-import boto3
-from botocore.client import Config
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key, Attr
 
 # 自作モジュール
 from logger_layer import ApplicationLogger
-from dynamodb_layer import Todo
-from cognito_layer import CognitoObject
+from metrics_layer import emit_invocation_metrics
+from registry_layer import get_todo
+from cognito_layer import CognitoObject, TokenVerificationError
 
 logger = ApplicationLogger(name=__name__, env_info="dev") if os.getenv("AWS_SAM_LOCAL") else ApplicationLogger(name=__name__)
 
@@ -95,6 +93,7 @@ def is_user_name_invalid(token_user_name = "", param_user_name = ""):
     """
     return True if token_user_name == param_user_name else False
 
+@emit_invocation_metrics
 def lambda_handler(event, context):
     """
     Todoを更新するメソッド
@@ -146,14 +145,15 @@ def lambda_handler(event, context):
             logger.debug("Development environment.")
         else:
             logger.debug("Production envrionment.")
-        todo_db = Todo()
+        todo_db = get_todo()
         # 更新用のパラメータを生成
         update_params = {
             "id": post_parameter["id"],
             "name": post_parameter["name"],
             "set": post_parameter["set"],
             "weight": post_parameter["weight"],
-            "clear_plan": post_parameter["clear_plan"]
+            "clear_plan": post_parameter["clear_plan"],
+            "user_name": user_name
         }
         # Todoの更新
         logger.debug("todo(id:{}) is complete. Changing status".format(update_params["id"]))
@@ -171,6 +171,20 @@ def lambda_handler(event, context):
                 'item': response
             }, default=decimal_default_proc)
         }
+    except TokenVerificationError as e:
+        logger.warn("Token is invalid. Return 401 Code")
+        logger.warn(e)
+        return {
+            'statusCode': 401,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": True,
+                "Access-Control-Allow-Headers": "*"
+            },
+            'body': json.dumps({
+                "message": 'Unauthorized',
+            })
+        }
     except ClientError as e:
         logger.warn("Failed changing status. ClientError is occured.")
         logger.warn(e)
@@ -0,0 +1,101 @@
+"""
+add_todo の認証処理を GetUser 呼び出しからローカル検証へ置き換えた効果を計測するベンチマーク
+
+before: リクエストごとに cognito-idp クライアントを生成し GetUser を呼び出す(旧実装)
+        GetUser の応答は botocore の Stubber で返し、ネットワーク往復は --cognito-rtt-ms で模擬する
+after : CognitoObject.get_user_info_from_access_token によるローカル検証(現実装)
+
+DynamoDB への書き込みはスタブに置き換え、認証部分の差分のみを比較する
+
+Usage
+-----
+python tests/benchmark/bench_add_todo_auth.py --iterations 200 --cognito-rtt-ms 25
+"""
+import argparse
+import json
+import time
+
+import benchutil
+
+
+class StubTodo():
+    """
+    DynamoDBへ書き込まずに登録結果を返すTodo
+    """
+    def __init__(self, env_str=""):
+        pass
+
+    def put_todo(self, todo):
+        todo["id"] = 1
+        return todo
+
+
+def create_legacy_auth(app, cognito_rtt_ms):
+    """
+    旧実装(リクエストごとに cognito-idp クライアントを生成し GetUser を呼ぶ)を再現する
+    """
+    import boto3
+    from botocore.stub import Stubber
+
+    def legacy_auth_request_user_is_valid(user_name, token):
+        aws_client = boto3.client('cognito-idp')
+        with Stubber(aws_client) as stubber:
+            stubber.add_response("get_user", {"Username": user_name, "UserAttributes": []}, {"AccessToken": token})
+            time.sleep(cognito_rtt_ms / 1000)
+            user = aws_client.get_user(AccessToken=token)
+        return user_name == user["Username"]
+    return legacy_auth_request_user_is_valid
+
+
+def create_event(token, user_name):
+    return {
+        "headers": {},
+        "body": json.dumps({
+            "user_name": user_name,
+            "access_token": token,
+            "name": "ベンチプレス",
+            "weight": "60",
+            "set": "3",
+            "clear_plan": "2020-05-01"
+        })
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--cognito-rtt-ms", type=float, default=25.0)
+    args = parser.parse_args()
+
+    local_jwks = benchutil.LocalJwks()
+    local_jwks.install()
+    app = benchutil.load_handler("add_todo")
+    from registry_layer import object_registry
+    object_registry.register("todo", StubTodo)
+    event = create_event(local_jwks.mint_access_token("wara"), "wara")
+
+    def invoke():
+        response = app.lambda_handler(event, None)
+        assert response["statusCode"] == 200, response
+
+    current_auth = app.auth_request_user_is_valid
+    app.auth_request_user_is_valid = create_legacy_auth(app, args.cognito_rtt_ms)
+    before = benchutil.time_calls(invoke, args.iterations)
+
+    import cognito_layer
+    app.auth_request_user_is_valid = current_auth
+    cognito_layer.verified_claims_cache.clear()
+    first_call = benchutil.time_calls(invoke, 1)
+    after = benchutil.time_calls(invoke, args.iterations)
+
+    benchutil.print_summary_table([
+        ("before: GetUser (rtt {}ms)".format(args.cognito_rtt_ms), benchutil.summarize(before)),
+        ("after: local verify (first call)", benchutil.summarize(first_call)),
+        ("after: local verify (warm)", benchutil.summarize(after))
+    ])
+    print("claims cache: {}".format(cognito_layer.verified_claims_cache.get_counters()))
+    print("jwks store  : {}".format(cognito_layer.jwks_key_store.get_counters()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+グラフ用の件数の集計(aggregation_layer.count_by)のベンチマーク
+
+完了ずみTodoのメニュー名ごと・完了日ごとの件数について、次の3つの所要時間を比べる
+- groupby: 従来のキーごとのsort + itertools.groupby(キーごとに全件を並べ替え、グループをlistにして数える)
+- python : count_by(1度の走査で辞書に数える)
+- numpy  : count_by(use_numpy=True。キーごとに配列にしてnumpy.uniqueで数える)
+日付の変換(strptime)はどれも同じため含めず、YYYY-MM-DDの文字列を数える。結果が一致することも確認する
+
+Usage
+-----
+python tests/benchmark/bench_aggregation.py
+python tests/benchmark/bench_aggregation.py --rows 1000 100000 --menus 50
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from itertools import groupby
+
+import benchutil
+from aggregation_layer import count_by, load_numpy
+
+
+def generate_todos(rows, menus, seed=1):
+    rng   = random.Random(seed)
+    start = date(2020, 1, 1)
+    return [{
+        "name": "menu{:03d}".format(rng.randrange(menus)),
+        "clear_date": (start + timedelta(days=rng.randrange(365))).isoformat()
+    } for _ in range(rows)]
+
+
+def group_by_item(items, key_attribute):
+    """
+    置き換え前の集計(todo_query.group_by_itemなど)
+    """
+    group_items_obj = {}
+    items.sort(key=lambda item: item[key_attribute])
+    for key, group in groupby(items, key=lambda item: item[key_attribute]):
+        group_items_obj[key] = len(list(group))
+    return group_items_obj
+
+
+def run_groupby(todos):
+    # 従来はリクエストごとに変換したアイテムの配列を作ってから並べ替えていた
+    items = [dict(todo) for todo in todos]
+    return {"pie": group_by_item(items, "name"), "line": group_by_item(items, "clear_date")}
+
+
+def measure(function, repeat):
+    latencies = []
+    result    = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result  = function()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return benchutil.summarize(latencies)["p50"], result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 10000, 1000000])
+    parser.add_argument("--menus", type=int, default=30, help="メニュー名の種類数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    keys    = {"pie": "name", "line": "clear_date"}
+    engines = {
+        "groupby": run_groupby,
+        "python": lambda todos: count_by(todos, keys, use_numpy=False)
+    }
+    if load_numpy() is not None:
+        engines["numpy"] = lambda todos: count_by(todos, keys, use_numpy=True)
+    print("{:<10} {:<9} {:>12}".format("rows", "engine", "p50(ms)"))
+    for rows in args.rows:
+        todos   = generate_todos(rows, args.menus, seed=args.seed)
+        repeat  = args.repeat if rows <= 10000 else 1
+        results = {}
+        for engine_name, function in engines.items():
+            p50, results[engine_name] = measure(lambda: function(todos), repeat)
+            print("{:<10} {:<9} {:>12.3f}".format(rows, engine_name, p50))
+        for engine_name, result in results.items():
+            if result != results["groupby"] or list(result["line"]) != list(results["groupby"]["line"]):
+                print("MISMATCH rows={} {}: result differs from groupby".format(rows, engine_name))
+
+
+if __name__ == "__main__":
+    main()
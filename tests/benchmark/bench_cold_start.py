@@ -0,0 +1,231 @@
+"""
+Lambda関数ごとのコールドスタートを計測するベンチマーク
+
+関数ごとに新しいPythonプロセスを起動し、次の3つを別々に計測する
+- init: app.py(lambda_handler)の読み込み。Lambdaの初期化フェーズ(Init Duration)に相当する
+- first: 1回目のリクエスト。初回の利用時に読み込むモジュール(jwt, cryptographyなど)と公開鍵の読み込みを含む
+- sdk: boto3のDynamoDBリソースの生成(サービス定義の読み込み)のうち、1回目のリクエストで読み込まれていない分
+  DynamoDBはインメモリ(memory_dynamodb_layer)を使うため、実環境の1回目のリクエストではこの時間が加わる
+合計(total)を実環境のコールドスタートの目安とする。JWKSの取得やDynamoDBの往復などのネットワーク時間は含まない
+このスクリプト自身が読み込む標準ライブラリ(json, loggingなど)はinitに含まれないため、値は実環境より少し小さくなる
+
+リクエストのイベントとトークンは親プロセスで生成し、子プロセスは同じシードで同じデータセットを作ってから実行する。
+データセットの生成はinitの計測後・firstの計測前に行い、どちらにも含めない
+
+Usage
+-----
+python tests/benchmark/bench_cold_start.py
+python tests/benchmark/bench_cold_start.py --cases todo_query options_method --runs 10
+# ベースラインを保存し、比較する(劣化があれば終了コード1)
+python tests/benchmark/bench_cold_start.py --output cold_start.json
+python tests/benchmark/bench_cold_start.py --compare cold_start.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import benchutil
+
+# 比較の既定値: 中央値が(1 + tolerance)倍かつnoise_ms以上増えた場合に劣化とする
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_NOISE_MS  = 5.0
+PHASES = ("init_ms", "first_ms", "sdk_ms", "total_ms")
+
+
+def run_child(payload):
+    """
+    子プロセス: ハンドラを読み込み、1回目のリクエストを実行して計測結果を返す
+    """
+    os.environ.update(payload["env"])
+    function_name = payload["function_name"]
+    before = set(sys.modules)
+    try:
+        started = time.perf_counter()
+        module  = benchutil.load_handler(function_name)
+        init_ms = (time.perf_counter() - started) * 1000
+    except Exception as e:
+        return {"error": "{}: {}".format(type(e).__name__, e)}
+    init_modules  = set(sys.modules) - before
+    uses_dynamodb = "dynamodb_layer" in sys.modules
+
+    # 計測に含めない準備(データセットの読み込み・公開鍵の取得先の差し替え)
+    import handler_cases
+    dataset = handler_cases.HandlerDataset(payload["users"], seed=payload["seed"])
+    dataset.install()
+    if "cognito_layer" in sys.modules:
+        # 鍵は読み込まず、1回目のリクエストで取得・読み込みさせる
+        sys.modules["cognito_layer"].jwks_key_store.fetcher = lambda url: payload["jwks"]
+    loaded = set(sys.modules)
+
+    started  = time.perf_counter()
+    response = module.lambda_handler(payload["event"], handler_cases.LambdaContext(function_name))
+    first_ms = (time.perf_counter() - started) * 1000
+    lazy_modules = set(sys.modules) - loaded
+
+    sdk_ms = 0.0
+    if uses_dynamodb:
+        from dynamodb_layer import create_client_config
+        started = time.perf_counter()
+        import boto3
+        boto3.session.Session().resource("dynamodb", config=create_client_config())
+        sdk_ms = (time.perf_counter() - started) * 1000
+
+    is_success = handler_cases.is_stream_ok if "Records" in payload["event"] else handler_cases.is_status_ok
+    return {
+        "init_ms": init_ms,
+        "first_ms": first_ms,
+        "sdk_ms": sdk_ms,
+        "total_ms": init_ms + first_ms + sdk_ms,
+        "init_modules": len(init_modules),
+        # 拡張モジュールなどの内部のモジュール(_始まり)は除く
+        "lazy_packages": sorted({name.split(".", 1)[0] for name in lazy_modules if not name.startswith("_")}),
+        "success": is_success(response)
+    }
+
+
+def spawn_child(payload):
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], input=json.dumps(payload, default=str),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else "exit {}".format(completed.returncode)}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize_runs(runs):
+    """
+    1ケースの複数回の計測を集計する(フェーズごとの中央値・最大値)
+    """
+    errors = [run["error"] for run in runs if "error" in run]
+    runs   = [run for run in runs if "error" not in run]
+    if not runs:
+        return {"skipped": errors[0] if errors else "no runs"}
+    summary = {}
+    for phase in PHASES:
+        values = [run[phase] for run in runs]
+        summary[phase]          = statistics.median(values)
+        summary[phase + "_max"] = max(values)
+    summary["init_modules"]  = statistics.median(run["init_modules"] for run in runs)
+    summary["lazy_packages"] = sorted({package for run in runs for package in run["lazy_packages"]})
+    summary["error_rate"]    = sum(0 if run["success"] else 1 for run in runs) / len(runs)
+    return summary
+
+
+def run_suite(args):
+    import handler_cases
+    local_jwks = benchutil.LocalJwks()
+    local_jwks.install()
+    env = {name: os.environ[name] for name in ("COGNITO_ISSUER", "COGNITO_AUDIENCE", "COGNITO_CLIENT_ID")}
+    dataset = handler_cases.HandlerDataset(args.users, seed=args.seed)
+    dataset.install()
+    tokens  = handler_cases.TokenStore(local_jwks)
+    cases   = [case for case in handler_cases.build_cases(dataset, tokens) if not args.cases or case.name in args.cases]
+    results = {}
+    for case in cases:
+        rng  = handler_cases.new_rng(args.seed, case.name)
+        runs = []
+        for _ in range(args.runs):
+            runs.append(spawn_child({
+                "function_name": case.function_name,
+                "event": case.build_event(rng),
+                "users": args.users,
+                "seed": args.seed,
+                "jwks": local_jwks.jwks,
+                "env": env
+            }))
+        results[case.name] = summarize_runs(runs)
+        print("measured {} ({} runs)".format(case.name, len(runs)), file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "seed": args.seed,
+            "users": args.users,
+            "runs": args.runs,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "results": results
+    }
+
+
+def compare_results(baseline, current, tolerance=DEFAULT_TOLERANCE, noise_ms=DEFAULT_NOISE_MS):
+    """
+    ベースラインと比べて劣化した指標を返す
+
+    Returns
+    -------
+    regressions : list
+        (ケース, 指標, ベースラインの値, 今回の値)の配列
+    """
+    regressions = []
+    for case_name, summary in current["results"].items():
+        before = baseline.get("results", {}).get(case_name)
+        if not before or "skipped" in before or "skipped" in summary:
+            continue
+        for phase in ("init_ms", "total_ms"):
+            if summary[phase] > before[phase] * (1 + tolerance) and summary[phase] - before[phase] > noise_ms:
+                regressions.append((case_name, phase, before[phase], summary[phase]))
+    return regressions
+
+
+def print_results(report):
+    print("{:<22} {:>9} {:>9} {:>9} {:>10} {:>8} {:>7}  {}".format(
+        "case", "init(ms)", "first(ms)", "sdk(ms)", "total(ms)", "modules", "errors", "loaded on first use"))
+    for case_name, summary in report["results"].items():
+        if "skipped" in summary:
+            print("{:<22} skipped ({})".format(case_name, summary["skipped"]))
+            continue
+        print("{:<22} {:>9.1f} {:>9.1f} {:>9.1f} {:>10.1f} {:>8.0f} {:>6.0%}  {}".format(
+            case_name, summary["init_ms"], summary["first_ms"], summary["sdk_ms"], summary["total_ms"],
+            summary["init_modules"], summary["error_rate"], " ".join(summary["lazy_packages"][:8])))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", nargs="+", help="計測するケース名(未指定の場合は全て)")
+    parser.add_argument("--runs", type=int, default=5, help="ケースごとに起動するプロセス数")
+    parser.add_argument("--users", type=int, default=50, help="データセットのユーザ数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", help="比較するベースラインのJSONファイル")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--noise-ms", type=float, default=DEFAULT_NOISE_MS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        payload = json.loads(sys.stdin.read())
+        # ハンドラのデバッグログとEMFの出力を計測に含めない
+        logging.disable(logging.CRITICAL)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = run_child(payload)
+        print(json.dumps(result))
+        return
+
+    logging.disable(logging.CRITICAL)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        report = run_suite(args)
+    print_results(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print("Saved {}".format(args.output))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare_results(baseline, report, args.tolerance, args.noise_ms)
+        for case_name, phase, before, after in regressions:
+            print("REGRESSION {} {}: {:.1f} -> {:.1f}".format(case_name, phase, before, after))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {}".format(args.compare))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+timelinesのサブリクエストを順に実行した場合と、run_concurrentlyで並行に実行した場合のレイテンシを比較するベンチマーク
+
+before: フォローしているユーザのQuery → 完了日のパーティションのQuery(1ページ分) を順に実行
+after : 2つの読み込みを concurrency_layer.run_concurrently で並行に実行(timelines.get_timeline_pageと同じ構成)
+
+DynamoDBの代わりに、指定した往復時間だけ待ってから応答するテーブルを使う
+
+Usage
+-----
+python tests/benchmark/bench_concurrent_timeline.py --iterations 50 --rtt-ms 8
+"""
+import argparse
+import time
+from itertools import chain, islice
+
+import benchutil
+
+
+class LatencyTable():
+    """
+    FollowRelationのQueryとClearDateBucketGSIndexのQueryに、rtt_ms待ってから応答するテーブル
+    """
+    def __init__(self, rtt_ms, following_count, todos_per_day):
+        self.rtt_ms    = rtt_ms
+        self.following = [{"follower_name": "wara", "following_name": "user{:03d}".format(index), "id": index}
+                          for index in range(following_count)]
+        self.todos_per_day = todos_per_day
+
+    def query(self, **params):
+        time.sleep(self.rtt_ms / 1000)
+        if params.get("IndexName") != "ClearDateBucketGSIndex":
+            return {"Items": self.following, "Count": len(self.following)}
+        bucket = params["ExpressionAttributeValues"][":b"]
+        items  = [{"id": index, "user_name": "user{:03d}".format(index % 200), "name": "懸垂",
+                   "clear_date": bucket + "T00:00:00.000000"} for index in range(self.todos_per_day)]
+        return {"Items": items, "Count": len(items)}
+
+
+def sequential_page(limit):
+    from dynamodb_layer import Todo, FollowRelation
+    following_datas = FollowRelation().get_following_users_queried_by_user_name(user_name="wara")
+    following_names = {data["following_name"] for data in following_datas}
+    todos = Todo().iter_clear_todos_newest_first(-14, projection="timeline")
+    return list(islice((todo for todo in todos if todo["user_name"] in following_names), limit + 1))
+
+
+def concurrent_page(limit):
+    from concurrency_layer import run_concurrently
+    from dynamodb_layer import Todo, FollowRelation
+    follow_relation_db = FollowRelation()
+    todos   = Todo().iter_clear_todos_newest_first(-14, projection="timeline")
+    results = run_concurrently({
+        "following": lambda: follow_relation_db.get_following_users_queried_by_user_name(user_name="wara"),
+        "head": lambda: list(islice(todos, limit + 1))
+    })
+    following_names = {data["following_name"] for data in results["following"]}
+    return list(islice((todo for todo in chain(results["head"], todos) if todo["user_name"] in following_names), limit + 1))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=8.0, help="1リクエストあたりの往復時間")
+    parser.add_argument("--following", type=int, default=50, help="フォローしているユーザ数")
+    parser.add_argument("--todos-per-day", type=int, default=200, help="1日あたりの完了ずみTodo件数")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    import dynamodb_layer
+    table = LatencyTable(args.rtt_ms, args.following, args.todos_per_day)
+    dynamodb_layer.dynamodb_registry.get_resource = lambda: table
+    dynamodb_layer.dynamodb_registry.get_table    = lambda table_name: table
+
+    assert sequential_page(args.limit) == concurrent_page(args.limit)
+    rows = [
+        ("sequential (following -> timeline)", benchutil.summarize(benchutil.time_calls(lambda: sequential_page(args.limit), args.iterations))),
+        ("run_concurrently", benchutil.summarize(benchutil.time_calls(lambda: concurrent_page(args.limit), args.iterations)))
+    ]
+    benchutil.print_summary_table(rows)
+
+
+if __name__ == "__main__":
+    main()
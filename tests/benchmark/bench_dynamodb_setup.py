@@ -0,0 +1,59 @@
+"""
+ハンドラ1回あたりのDynamoDB初期化コストを計測するマイクロベンチマーク
+
+before: 呼び出しごとに boto3.resource("dynamodb") を生成する(旧実装。Todo() 1回で2つ生成していた)
+after : dynamodb_registry で共有したリソースを使う Todo() / FollowRelation() の生成
+registry: registry_layer で生成済みのオブジェクトを使い回す get_todo() / get_follow_relation()(ウォームスタートのハンドラ)
+
+ネットワークへの通信は発生しない(リソース・Tableオブジェクトの生成のみを計測する)
+
+Usage
+-----
+python tests/benchmark/bench_dynamodb_setup.py --iterations 50
+"""
+import argparse
+
+import benchutil
+
+
+def legacy_todo_setup():
+    import boto3
+    # Todo と TodoAtomicCounter がそれぞれリソースを生成していた
+    todo_table    = boto3.resource("dynamodb").Table("Todos")
+    counter_table = boto3.resource("dynamodb").Table("MuscleAtomicCounter")
+    return todo_table, counter_table
+
+
+def legacy_follow_relation_setup():
+    import boto3
+    relation_table = boto3.resource("dynamodb").Table("FollowRelation")
+    counter_table  = boto3.resource("dynamodb").Table("MuscleAtomicCounter")
+    return relation_table, counter_table
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    import dynamodb_layer
+    from dynamodb_layer import Todo, FollowRelation
+    from registry_layer import get_todo, get_follow_relation, reset_registry
+
+    dynamodb_layer.dynamodb_registry.reset()
+    reset_registry()
+    first_todo = benchutil.time_calls(Todo, 1)
+    rows = [
+        ("before: Todo()", benchutil.summarize(benchutil.time_calls(legacy_todo_setup, args.iterations))),
+        ("before: FollowRelation()", benchutil.summarize(benchutil.time_calls(legacy_follow_relation_setup, args.iterations))),
+        ("after: Todo() first call", benchutil.summarize(first_todo)),
+        ("after: Todo() warm", benchutil.summarize(benchutil.time_calls(Todo, args.iterations))),
+        ("after: FollowRelation() warm", benchutil.summarize(benchutil.time_calls(FollowRelation, args.iterations))),
+        ("registry: get_todo() warm", benchutil.summarize(benchutil.time_calls(get_todo, args.iterations))),
+        ("registry: get_follow_relation() warm", benchutil.summarize(benchutil.time_calls(get_follow_relation, args.iterations)))
+    ]
+    benchutil.print_summary_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+全てのlambda_handlerを、インメモリのDynamoDBとローカルJWKSに対して実行するベンチマーク
+
+データセットの大きさ(ユーザ数)ごとに合成データを読み込み、ハンドラごとに
+レイテンシ(p50/p95/p99)・1リクエストのピークメモリ(tracemalloc)・1リクエストあたりのDynamoDB呼び出し回数と消費キャパシティを計測する。
+結果はJSONのベースラインに保存でき、--compareでベースラインと比べて劣化したケースを報告する(劣化があれば終了コード1)
+
+Usage
+-----
+# ベースラインを保存する
+python tests/benchmark/bench_handlers.py --users 100 1000 --output baseline.json
+# ベースラインと比較する
+python tests/benchmark/bench_handlers.py --users 100 1000 --compare baseline.json
+# 一部のハンドラのみ・DynamoDBの往復時間を模擬して実行する
+python tests/benchmark/bench_handlers.py --cases todo_query timelines --latency-ms 5
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import benchutil
+import handler_cases
+
+# 比較の既定値: レイテンシはp95/p99が(1 + tolerance)倍かつnoise_ms以上増えた場合、メモリは(1 + tolerance)倍を超えた場合に劣化とする
+DEFAULT_LATENCY_TOLERANCE = 0.25
+DEFAULT_MEMORY_TOLERANCE  = 0.25
+DEFAULT_NOISE_MS          = 1.0
+
+
+def invoke(handler, case, rng):
+    """
+    1リクエストを実行し、(所要時間ms, 成功か, DynamoDB呼び出し回数, 消費キャパシティ)を返す
+    """
+    from metrics_layer import capture_dynamodb_calls
+    event   = case.build_event(rng)
+    context = handler_cases.LambdaContext(case.function_name)
+    with capture_dynamodb_calls() as calls:
+        started  = time.perf_counter()
+        response = handler(event, context)
+        elapsed  = (time.perf_counter() - started) * 1000
+    return elapsed, case.is_success(response), calls.count, sum(call["capacity"] for call in calls.calls)
+
+
+def measure_case(handler, case, seed, warmup, iterations, memory_iterations):
+    """
+    1ケースを計測する(ウォームアップ → レイテンシ → tracemallocを有効にしたメモリの順)
+    tracemallocは実行を遅くするため、レイテンシの計測とは別に実行する
+    """
+    rng = handler_cases.new_rng(seed, case.name)
+    for _ in range(warmup):
+        invoke(handler, case, rng)
+    latencies = []
+    calls     = []
+    capacity  = 0.0
+    errors    = 0
+    for _ in range(iterations):
+        elapsed, success, call_count, consumed = invoke(handler, case, rng)
+        latencies.append(elapsed)
+        calls.append(call_count)
+        capacity += consumed
+        errors   += 0 if success else 1
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(memory_iterations):
+            tracemalloc.reset_peak() if hasattr(tracemalloc, "reset_peak") else tracemalloc.clear_traces()
+            baseline = tracemalloc.get_traced_memory()[0]
+            invoke(handler, case, rng)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    summary = benchutil.summarize(latencies)
+    summary.update({
+        "peak_kb": max(peaks) / 1024 if peaks else 0.0,
+        "dynamodb_calls": sum(calls) / len(calls) if calls else 0.0,
+        "dynamodb_calls_max": max(calls) if calls else 0,
+        "capacity_units": capacity / iterations if iterations else 0.0,
+        "error_rate": errors / iterations if iterations else 0.0
+    })
+    return summary
+
+
+def run_suite(args):
+    local_jwks = benchutil.LocalJwks()
+    local_jwks.install()
+    results    = {}
+    for users in args.users:
+        started = time.perf_counter()
+        dataset = handler_cases.HandlerDataset(users, seed=args.seed, latency_ms=args.latency_ms)
+        dataset.install()
+        print("dataset users={} rows={} (loaded in {:.1f}s)".format(
+            users, dataset.row_counts, time.perf_counter() - started), file=sys.stderr)
+        tokens = handler_cases.TokenStore(local_jwks)
+        cases  = [case for case in handler_cases.build_cases(dataset, tokens) if not args.cases or case.name in args.cases]
+        handlers, unavailable = handler_cases.load_handlers(cases)
+        size_results = {}
+        for case in cases:
+            if case.function_name in unavailable:
+                size_results[case.name] = {"skipped": unavailable[case.function_name]}
+                continue
+            size_results[case.name] = measure_case(handlers[case.function_name], case, args.seed,
+                                                   args.warmup, args.iterations, args.memory_iterations)
+        results[str(users)] = size_results
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "latency_ms": args.latency_ms,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "results": results
+    }
+
+
+def compare_results(baseline, current, latency_tolerance=DEFAULT_LATENCY_TOLERANCE,
+                    memory_tolerance=DEFAULT_MEMORY_TOLERANCE, noise_ms=DEFAULT_NOISE_MS):
+    """
+    ベースラインと比べて劣化した指標を返す
+
+    Returns
+    -------
+    regressions : list
+        (データセット, ケース, 指標, ベースラインの値, 今回の値)の配列
+    """
+    regressions = []
+    for size, cases in current["results"].items():
+        for case_name, summary in cases.items():
+            before = baseline.get("results", {}).get(size, {}).get(case_name)
+            if not before or "skipped" in before or "skipped" in summary:
+                continue
+            for metric in ("p95", "p99"):
+                if summary[metric] > before[metric] * (1 + latency_tolerance) and summary[metric] - before[metric] > noise_ms:
+                    regressions.append((size, case_name, metric, before[metric], summary[metric]))
+            if summary["peak_kb"] > before["peak_kb"] * (1 + memory_tolerance):
+                regressions.append((size, case_name, "peak_kb", before["peak_kb"], summary["peak_kb"]))
+            # 呼び出し回数・エラー率は許容幅なしで増加を劣化とする
+            for metric in ("dynamodb_calls", "error_rate"):
+                if summary[metric] > before[metric] + 1e-9:
+                    regressions.append((size, case_name, metric, before[metric], summary[metric]))
+    return regressions
+
+
+def print_results(report):
+    print("{:<8} {:<22} {:>9} {:>9} {:>9} {:>10} {:>8} {:>8} {:>7}".format(
+        "users", "case", "p50(ms)", "p95(ms)", "p99(ms)", "peak(KB)", "calls", "RCU/WCU", "errors"))
+    for size, cases in report["results"].items():
+        for case_name, summary in cases.items():
+            if "skipped" in summary:
+                print("{:<8} {:<22} skipped ({})".format(size, case_name, summary["skipped"]))
+                continue
+            print("{:<8} {:<22} {:>9.3f} {:>9.3f} {:>9.3f} {:>10.1f} {:>8.1f} {:>8.1f} {:>6.1%}".format(
+                size, case_name, summary["p50"], summary["p95"], summary["p99"], summary["peak_kb"],
+                summary["dynamodb_calls"], summary["capacity_units"], summary["error_rate"]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000], help="データセットのユーザ数(複数指定可)")
+    parser.add_argument("--cases", nargs="+", help="計測するケース名(未指定の場合は全て)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--memory-iterations", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="DynamoDBの往復時間の模擬")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", help="比較するベースラインのJSONファイル")
+    parser.add_argument("--latency-tolerance", type=float, default=DEFAULT_LATENCY_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=DEFAULT_MEMORY_TOLERANCE)
+    parser.add_argument("--noise-ms", type=float, default=DEFAULT_NOISE_MS)
+    parser.add_argument("--verbose", action="store_true", help="ハンドラのログ・メトリクスを出力する")
+    args = parser.parse_args()
+
+    if args.verbose:
+        report = run_suite(args)
+    else:
+        # ハンドラのデバッグログとEMFの出力を計測に含めない
+        logging.disable(logging.CRITICAL)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            report = run_suite(args)
+    print_results(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print("Saved {}".format(args.output))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare_results(baseline, report, args.latency_tolerance, args.memory_tolerance, args.noise_ms)
+        for size, case_name, metric, before, after in regressions:
+            print("REGRESSION users={} {} {}: {:.3f} -> {:.3f}".format(size, case_name, metric, before, after))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {}".format(args.compare))
+
+
+if __name__ == "__main__":
+    main()
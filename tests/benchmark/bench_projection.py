@@ -0,0 +1,67 @@
+"""
+ProjectionExpressionによる応答サイズの削減量を計測するベンチマーク
+
+用途ごとの名前付きProjection(TODO_PROJECTIONS)で取得した場合と全属性を取得した場合について、
+DynamoDBの応答サイズ(アイテムサイズの合計)・JSONの応答バイト数・消費RCUを比較する
+
+DynamoDBのQuery / Scanは読み込んだアイテム全体のサイズで課金されるため、
+ProjectionExpressionでRCUは変わらない(削減されるのは転送量・デシリアライズ・Lambdaのメモリ)。
+RCUを下げるには、属性を絞ったインデックス(ProjectionType INCLUDE)を用意する必要がある
+
+Usage
+-----
+python tests/benchmark/bench_projection.py --todos 2000
+"""
+import argparse
+import json
+from datetime import datetime
+
+import benchutil
+from bench_timeline_index import iter_synthetic_todos
+
+
+def project(item, attributes):
+    return {attribute: item[attribute] for attribute in attributes if attribute in item}
+
+
+def measure(items, attributes):
+    projected = [project(item, attributes) for item in items] if attributes else items
+    item_sizes = [benchutil.estimate_item_size(item) for item in items]
+    read_units, pages = benchutil.estimate_read_units(item_sizes)
+    return {
+        "items": len(projected),
+        "response_bytes": sum(benchutil.estimate_item_size(item) for item in projected),
+        "json_bytes": len(json.dumps(projected, default=str, ensure_ascii=False).encode("utf-8")),
+        "rcu": read_units
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--todos", type=int, default=2000, help="1ユーザあたりのTodo件数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from dynamodb_layer import TODO_PROJECTIONS
+
+    now   = datetime.now()
+    todos = [dict(todo, user_name="wara") for todo in iter_synthetic_todos(args.todos, 365, 0.7, now, args.seed)]
+    clear_todos = [todo for todo in todos if todo["clear_date"] != "0"]
+    cases = [
+        ("chart", clear_todos),
+        ("timeline", clear_todos[-200:]),
+        ("trend", [todo for todo in clear_todos if todo["name"] == clear_todos[0]["name"]])
+    ]
+    print("{:<10} {:>7} {:>16} {:>16} {:>14} {:>14} {:>10}".format(
+        "use case", "items", "full bytes", "projected bytes", "full json", "projected json", "RCU"))
+    for projection_name, items in cases:
+        full      = measure(items, None)
+        projected = measure(items, TODO_PROJECTIONS[projection_name])
+        print("{:<10} {:>7} {:>16} {:>16} {:>14} {:>14} {:>10.1f}".format(
+            projection_name, full["items"], full["response_bytes"], projected["response_bytes"],
+            full["json_bytes"], projected["json_bytes"], projected["rcu"]))
+    print("RCU is the same with and without ProjectionExpression; only the response size shrinks.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+タイムライン取得の読み込みコストを、全件Scanと完了日パーティションへのQueryで比較するベンチマーク
+
+before: Todosテーブル全体を FilterExpression clear_date >= :T1 でScan(並列Scanのセグメント数で分割)
+after : ClearDateBucketGSIndex に対して直近15日分(今日 + 14日前まで)のQueryを並列実行
+
+合成したTodoのアイテムサイズからDynamoDBの課金ルールに沿ってRCUとページ数を算出し、
+レイテンシは「1リクエストの往復時間 + 転送量」のモデルで見積もる。
+Scanは読み込んだ全アイテム(フィルタ前)に課金され、Queryはパーティション内の該当アイテムのみに課金される
+
+Usage
+-----
+python tests/benchmark/bench_timeline_index.py --sizes 10000 100000 1000000
+"""
+import argparse
+import math
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import benchutil
+
+MENU_NAMES = ["ベンチプレス", "スクワット", "デッドリフト", "懸垂", "ショルダープレス", "レッグプレス"]
+
+
+def iter_synthetic_todos(count, history_days, clear_ratio, now, seed):
+    """
+    Todo.put_todo / complete_todo が書き込む形のアイテムを生成する
+    """
+    rand = random.Random(seed)
+    for todo_id in range(1, count + 1):
+        created_at = now - timedelta(days=rand.uniform(0, history_days))
+        clear_plan = created_at + timedelta(days=rand.randint(0, 7))
+        todo = {
+            "id": todo_id,
+            "user_name": "user{:05d}".format(rand.randint(1, max(1, count // 50))),
+            "name": rand.choice(MENU_NAMES),
+            "weight": rand.randint(20, 150),
+            "set": rand.randint(1, 5),
+            "clear_plan": clear_plan.isoformat(timespec='microseconds'),
+            "created_at": created_at.isoformat(timespec='microseconds'),
+            "is_cleared": False,
+            "clear_date": "0"
+        }
+        if rand.random() < clear_ratio:
+            clear_date = min(now, clear_plan.replace(hour=0, minute=0, second=0, microsecond=0))
+            todo["is_cleared"]        = True
+            todo["clear_date"]        = clear_date.isoformat(timespec='microseconds')
+            todo["clear_date_bucket"] = clear_date.strftime('%Y-%m-%d')
+            todo["comment"]           = "今日は調子が良かった" * rand.randint(0, 6)
+        yield todo
+
+
+def estimate_latency_ms(pages, read_bytes, rtt_ms, ms_per_kb):
+    return pages * rtt_ms + read_bytes / 1024 * ms_per_kb
+
+
+def run_case(count, args, now):
+    window_start = now - timedelta(days=args.window_days)
+    window_iso   = window_start.isoformat(timespec='microseconds')
+    scan_sizes    = []
+    bucket_sizes  = defaultdict(list)
+    matched_count = 0
+    for todo in iter_synthetic_todos(count, args.history_days, args.clear_ratio, now, args.seed):
+        item_size = benchutil.estimate_item_size(todo)
+        scan_sizes.append(item_size)
+        if todo["clear_date"] >= window_iso:
+            matched_count += 1
+            bucket_sizes[todo["clear_date_bucket"]].append(item_size)
+
+    # Scan: セグメントごとに独立してページングするため、セグメント単位で算出する
+    scan_read_units, scan_latency = 0.0, 0.0
+    for segment in range(args.segments):
+        segment_sizes = scan_sizes[segment::args.segments]
+        read_units, pages = benchutil.estimate_read_units(segment_sizes)
+        scan_read_units += read_units
+        scan_latency     = max(scan_latency, estimate_latency_ms(pages, sum(segment_sizes), args.rtt_ms, args.ms_per_kb))
+
+    # Query: 直近の日付ごとのQueryを args.workers 並列で実行する
+    query_read_units, bucket_latencies = 0.0, []
+    buckets = [(now - timedelta(days=day)).strftime('%Y-%m-%d') for day in range(args.window_days + 1)]
+    for bucket in buckets:
+        sizes = bucket_sizes.get(bucket, [])
+        read_units, pages = benchutil.estimate_read_units(sizes)
+        query_read_units += read_units
+        bucket_latencies.append(estimate_latency_ms(pages, sum(sizes), args.rtt_ms, args.ms_per_kb))
+    waves         = math.ceil(len(buckets) / args.workers)
+    query_latency = max(bucket_latencies) * waves
+
+    return {
+        "todos": count,
+        "matched": matched_count,
+        "scan_rcu": scan_read_units,
+        "scan_latency_ms": scan_latency,
+        "query_rcu": query_read_units,
+        "query_latency_ms": query_latency
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--history-days", type=int, default=365)
+    parser.add_argument("--window-days", type=int, default=14)
+    parser.add_argument("--clear-ratio", type=float, default=0.7)
+    parser.add_argument("--segments", type=int, default=4, help="並列Scanのセグメント数")
+    parser.add_argument("--workers", type=int, default=8, help="日付ごとのQueryの並列数")
+    parser.add_argument("--rtt-ms", type=float, default=6.0, help="1リクエストあたりの往復時間")
+    parser.add_argument("--ms-per-kb", type=float, default=0.03, help="1KBあたりの転送時間")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    now = datetime.now()
+    print("{:>9} {:>9} {:>12} {:>14} {:>12} {:>14} {:>9}".format(
+        "todos", "matched", "scan RCU", "scan ms", "query RCU", "query ms", "RCU x"))
+    for count in args.sizes:
+        result = run_case(count, args, now)
+        ratio  = result["scan_rcu"] / result["query_rcu"] if result["query_rcu"] else float("inf")
+        print("{:>9} {:>9} {:>12.1f} {:>14.1f} {:>12.1f} {:>14.1f} {:>9.1f}".format(
+            result["todos"], result["matched"], result["scan_rcu"], result["scan_latency_ms"],
+            result["query_rcu"], result["query_latency_ms"], ratio))
+
+
+if __name__ == "__main__":
+    main()
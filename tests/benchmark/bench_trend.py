@@ -0,0 +1,123 @@
+"""
+analize_muscle_menus / timelines の集計(trend_layer.TodoTrendObject)のベンチマーク
+
+件数ごとに合成したTodoに対して、次の処理を純粋なPython・NumPy・pandas_layer(読み込める場合のみ)で実行し、
+所要時間と処理中のピークメモリ(tracemalloc。入力のアイテムの配列は含まない)を比べる
+- trend   : 日付の変換(clear_plan, clear_date) → weight / set の推移(analize_muscle_menus)
+- timeline: フォローしているユーザのTodoの変換(timelines)
+純粋なPythonとNumPyの結果が一致することも確認する
+
+Usage
+-----
+python tests/benchmark/bench_trend.py
+python tests/benchmark/bench_trend.py --rows 100 10000 --repeat 10
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+from datetime import date, timedelta
+
+import benchutil
+
+
+def generate_items(rows, seed=1, users=200):
+    """
+    完了ずみのTodo(trend / timelineの射影に必要な属性)を生成する
+    """
+    rng   = random.Random(seed)
+    start = date(2020, 1, 1)
+    items = []
+    for todo_id in range(1, rows + 1):
+        clear_date = (start + timedelta(days=rng.randrange(365))).isoformat() + "T00:00:00.000000"
+        items.append({
+            "id": Decimal(todo_id),
+            "user_name": "user{:07d}".format(rng.randrange(users)),
+            "name": "ベンチプレス",
+            "weight": Decimal(rng.randint(20, 120)),
+            "set": Decimal(rng.randint(1, 5)),
+            "clear_plan": clear_date,
+            "clear_date": clear_date,
+            "comment": ""
+        })
+    return items
+
+
+def load_engines():
+    """
+    計測するエンジン(名前 -> itemsを受け取りオブジェクトを返す関数)を返す
+    """
+    from trend_layer import TodoTrendObject, load_numpy
+    engines = {"python": lambda items: TodoTrendObject(items, use_numpy=False)}
+    if load_numpy() is not None:
+        engines["numpy"] = lambda items: TodoTrendObject(items, use_numpy=True)
+    unavailable = {}
+    try:
+        from pandas_layer import TodoPandasObject
+        engines["pandas"] = TodoPandasObject
+    except ImportError as e:
+        unavailable["pandas"] = "{}: {}".format(type(e).__name__, e)
+    return engines, unavailable
+
+
+def run_trend(create, items):
+    trend_object = create(items)
+    trend_object.df["clear_plan"] = trend_object.translate_to_datetime_from_decimal("clear_plan")
+    trend_object.df["clear_date"] = trend_object.translate_to_datetime_from_decimal("clear_date")
+    return {"weight": trend_object.get_trend_data("weight"), "set": trend_object.get_trend_data("set")}
+
+
+def run_timeline(create, items, following_datas):
+    return create(items).create_timeline_data(following_datas)
+
+
+def measure(function, repeat):
+    """
+    (所要時間の中央値ms, ピークメモリKB, 結果)を返す
+    """
+    latencies = []
+    result    = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result  = function()
+        latencies.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        function()
+        peak_kb  = (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+    finally:
+        tracemalloc.stop()
+    return benchutil.summarize(latencies)["p50"], peak_kb, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 10000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5, help="1万件以下の繰り返し回数(それより多い場合は1回)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    engines, unavailable = load_engines()
+    for name, reason in unavailable.items():
+        print("{} is skipped ({})".format(name, reason))
+    following_datas = [{"following_name": "user{:07d}".format(index)} for index in range(0, 200, 2)]
+    print("{:<10} {:<10} {:<9} {:>12} {:>12}".format("rows", "operation", "engine", "p50(ms)", "peak(KB)"))
+    for rows in args.rows:
+        items   = generate_items(rows, seed=args.seed)
+        repeat  = args.repeat if rows <= 10000 else 1
+        results = {}
+        for operation, function in (("trend", run_trend), ("timeline", lambda create, items: run_timeline(create, items, following_datas))):
+            for engine_name, create in engines.items():
+                p50, peak_kb, result = measure(lambda: function(create, items), repeat)
+                results[(operation, engine_name)] = result
+                print("{:<10} {:<10} {:<9} {:>12.3f} {:>12.1f}".format(rows, operation, engine_name, p50, peak_kb))
+            if "numpy" in engines and results[(operation, "numpy")] != results[(operation, "python")]:
+                print("MISMATCH rows={} {}: numpy and python results differ".format(rows, operation))
+        # 次の件数の生成前に解放する
+        items = None
+
+
+if __name__ == "__main__":
+    main()
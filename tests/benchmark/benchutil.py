@@ -0,0 +1,203 @@
+"""
+ベンチマーク共通ユーティリティ
+
+layer/python と tools を import パスに追加し、各 Lambda 関数のハンドラ読み込み、
+ローカル JWKS によるトークン発行、レイテンシ集計を提供する
+"""
+import importlib.util
+import json
+import math
+import os
+import sys
+import time
+import uuid
+
+ROOT_DIR  = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+LAYER_DIR = os.path.join(ROOT_DIR, "layer", "python")
+SRC_DIR   = os.path.join(ROOT_DIR, "src")
+EVENT_DIR = os.path.join(ROOT_DIR, "event")
+TOOLS_DIR = os.path.join(ROOT_DIR, "tools")
+
+for import_dir in (TOOLS_DIR, LAYER_DIR):
+    if import_dir not in sys.path:
+        sys.path.insert(0, import_dir)
+
+# ローカル実行時もリージョンが必要になるため既定値を設定する
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+
+
+def load_handler(function_name):
+    """
+    src/<function_name>/app.py をモジュール名が衝突しないように読み込む
+
+    Parameters
+    ----------
+    function_name : string
+        src配下のディレクトリ名
+
+    Returns
+    -------
+    module : module
+        読み込んだ app モジュール
+    """
+    module_name = "{}_app".format(function_name)
+    path        = os.path.join(SRC_DIR, function_name, "app.py")
+    spec        = importlib.util.spec_from_file_location(module_name, path)
+    module      = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class LocalJwks():
+    """
+    ベンチマーク用のローカル鍵セット
+    RSA鍵を生成し、Cognitoと同じ形式のID Token / Access Tokenを発行する
+    """
+    def __init__(self, issuer="https://cognito-idp.local/local_pool", client_id="local-client-id", kid="local-kid"):
+        import jwt
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from jwt.algorithms import RSAAlgorithm
+        self.issuer      = issuer
+        self.client_id   = client_id
+        self.kid         = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk_key          = json.loads(RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        jwk_key.update({"kid": kid, "alg": "RS256", "use": "sig"})
+        self.jwks        = {"keys": [jwk_key]}
+        self._jwt        = jwt
+
+    def install(self, key_store=None):
+        """
+        環境変数を設定し、公開鍵ストアへ鍵セットを読み込む
+        """
+        os.environ["COGNITO_ISSUER"]    = self.issuer
+        os.environ["COGNITO_AUDIENCE"]  = self.client_id
+        os.environ["COGNITO_CLIENT_ID"] = self.client_id
+        if key_store is None:
+            import cognito_layer
+            key_store = cognito_layer.jwks_key_store
+        key_store.fetcher = lambda url: self.jwks
+        key_store.load_keys(self.jwks)
+        return key_store
+
+    def mint_id_token(self, user_name, ttl_seconds=3600):
+        now = int(time.time())
+        claims = {
+            "sub": str(uuid.uuid4()),
+            "aud": self.client_id,
+            "iss": self.issuer,
+            "token_use": "id",
+            "cognito:username": user_name,
+            "auth_time": now,
+            "iat": now,
+            "exp": now + ttl_seconds
+        }
+        return self.__sign(claims)
+
+    def mint_access_token(self, user_name, ttl_seconds=3600):
+        now = int(time.time())
+        claims = {
+            "sub": str(uuid.uuid4()),
+            "iss": self.issuer,
+            "client_id": self.client_id,
+            "token_use": "access",
+            "scope": "aws.cognito.signin.user.admin",
+            "username": user_name,
+            "auth_time": now,
+            "iat": now,
+            "exp": now + ttl_seconds,
+            "jti": str(uuid.uuid4())
+        }
+        return self.__sign(claims)
+
+    #private method
+    def __sign(self, claims):
+        return self._jwt.encode(claims, self.private_key, algorithm="RS256", headers={"kid": self.kid})
+
+
+def estimate_item_size(value):
+    """
+    DynamoDBのアイテムサイズ算出ルールに沿って、値のバイト数を概算する
+    (文字列はUTF-8のバイト数、数値は有効桁数、Map/Listはオーバーヘッド3バイト)
+    """
+    if isinstance(value, dict):
+        return 3 + sum(len(key.encode("utf-8")) + estimate_item_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(1 + estimate_item_size(item) for item in value)
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float)) or type(value).__name__ == "Decimal":
+        digits = len(str(value).replace("-", "").replace(".", "").lstrip("0")) or 1
+        return 1 + (digits + 1) // 2
+    if isinstance(value, bytes):
+        return len(value)
+    return len(str(value).encode("utf-8"))
+
+
+def estimate_read_units(item_sizes, page_bytes=1024 * 1024, consistent=False):
+    """
+    Scan / Queryで読み込んだアイテムのサイズから消費RCUとページ数を概算する
+    1ページ(最大1MB)ごとに合計サイズを4KB単位で切り上げ、結果整合性読み込みは0.5倍になる
+    """
+    read_units   = 0.0
+    pages        = 0
+    current_page = 0
+    for item_size in item_sizes:
+        if current_page + item_size > page_bytes:
+            read_units  += math.ceil(current_page / 4096)
+            pages       += 1
+            current_page = 0
+        current_page += item_size
+    if current_page or pages == 0:
+        read_units += math.ceil(current_page / 4096)
+        pages      += 1
+    return (read_units if consistent else read_units / 2), pages
+
+
+def percentile(sorted_values, ratio):
+    """
+    ソート済みの値から最近傍法でパーセンタイル値を求める
+    """
+    if not sorted_values:
+        return 0.0
+    index = max(0, int(math.ceil(ratio * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies_ms):
+    """
+    レイテンシ(ミリ秒)の配列から統計値を算出する
+    """
+    values = sorted(latencies_ms)
+    count  = len(values)
+    return {
+        "count": count,
+        "mean": sum(values) / count if count else 0.0,
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": values[-1] if values else 0.0
+    }
+
+
+def time_calls(function, iterations):
+    """
+    関数をiterations回呼び出し、1回ごとの所要時間(ミリ秒)を返す
+    """
+    latencies_ms = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        latencies_ms.append((time.perf_counter() - started) * 1000)
+    return latencies_ms
+
+
+def print_summary_table(rows):
+    """
+    (ラベル, summarize()の結果) の配列を表形式で出力する
+    """
+    print("{:<36} {:>7} {:>10} {:>10} {:>10} {:>10}".format("case", "count", "mean(ms)", "p50(ms)", "p95(ms)", "p99(ms)"))
+    for label, summary in rows:
+        print("{:<36} {:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+            label, summary["count"], summary["mean"], summary["p50"], summary["p95"], summary["p99"]))
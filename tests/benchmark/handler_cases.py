@@ -0,0 +1,302 @@
+"""
+ハンドラのベンチマーク・負荷試験で共有するデータセットとリクエストの定義
+
+- HandlerDataset: generate_workload.py の合成データをインメモリのDynamoDB(memory_dynamodb_layer)へ読み込み、
+  dynamodb_registryに組み込む。リクエストの生成に使うユーザ・Todo・フォローの一覧も保持する
+- build_cases: src/*/app.py の lambda_handler ごとに、API Gateway(またはDynamoDB Streams)のイベントを生成するケース
+"""
+import json
+import os
+import random
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime
+
+import benchutil
+
+from generate_workload import WorkloadGenerator, MENUS
+
+# ケース名, src配下の関数名, イベントを生成する関数(rng -> event), 成功か判定する関数(response -> bool)
+HandlerCase = namedtuple("HandlerCase", ["name", "function_name", "build_event", "is_success"])
+
+
+def is_status_ok(response):
+    return isinstance(response, dict) and response.get("statusCode") == 200
+
+
+def is_stream_ok(response):
+    return isinstance(response, dict) and response.get("batchItemFailures") == []
+
+
+class LambdaContext():
+    """
+    Lambdaのcontextの代わり(関数名と残り時間のみ)
+    """
+    def __init__(self, function_name, timeout_ms=30000):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self.deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+def api_gateway_event(method, path, body=None, headers=None, path_parameters=None, query_parameters=None):
+    """
+    API Gateway(REST API, Lambdaプロキシ統合)のイベントを生成する
+    """
+    return {
+        "resource": path,
+        "path": path,
+        "httpMethod": method,
+        "headers": dict(headers or {}),
+        "queryStringParameters": query_parameters,
+        "pathParameters": path_parameters,
+        "body": json.dumps(body, ensure_ascii=False) if body is not None else None,
+        "isBase64Encoded": False,
+        "requestContext": {
+            "resourcePath": path,
+            "httpMethod": method,
+            "requestId": str(uuid.uuid4()),
+            "stage": "Prod"
+        }
+    }
+
+
+def load_event_fixture(file_name):
+    with open(os.path.join(benchutil.EVENT_DIR, file_name), encoding="utf-8") as file:
+        return json.load(file)
+
+
+class HandlerDataset():
+    """
+    合成データを読み込んだインメモリのDynamoDB
+
+    Parameters
+    ----------
+    users : int
+        ユーザ数(Todoはユーザあたり平均todos_per_user件)
+    seed : int
+        データ生成の乱数のシード
+    latency_ms : float
+        DynamoDBの1リクエストあたりの往復時間の模擬
+    throttle_rate : float
+        スロットリングされる確率の模擬
+    todos_per_user / follows_per_user : float
+        WorkloadGeneratorのパラメータ
+    """
+    def __init__(self, users, seed=0, latency_ms=0.0, throttle_rate=0.0, todos_per_user=30.0, follows_per_user=20.0):
+        from memory_dynamodb_layer import MemoryDynamodbResource
+        self.users      = users
+        self.generator  = WorkloadGenerator(users=users, seed=seed, todos_per_user=todos_per_user, follows_per_user=follows_per_user)
+        self.resource   = MemoryDynamodbResource(latency_ms=latency_ms, throttle_rate=throttle_rate, seed=seed)
+        self.user_names = list(self.generator.iter_user_names())
+        # リクエストの対象: (user_name, id)
+        self.todos      = []
+        self.open_todos = []
+        self.relations  = []
+        self.row_counts = {}
+        self.__load()
+
+    def install(self):
+        """
+        dynamodb_registryがこのデータセットを返すようにし、ウォームスタート間で持ち越す状態(キャッシュ・採番)を初期化する
+        """
+        import cache_layer
+        import dynamodb_layer
+        import registry_layer
+        from memory_dynamodb_layer import install_memory_dynamodb
+        install_memory_dynamodb(resource=self.resource)
+        cache_layer.set_todo_cache(None)
+        dynamodb_layer._id_allocators.clear()
+        registry_layer.reset_registry()
+
+    def pick_user(self, rng):
+        return rng.choice(self.user_names)
+
+    def pick_todo(self, rng, open_only=False):
+        # 未完了のTodoは取り出して使い(同じTodoを何度も完了にしない)、なくなった場合は全Todoから選ぶ
+        if open_only and self.open_todos:
+            position = rng.randrange(len(self.open_todos))
+            self.open_todos[position], self.open_todos[-1] = self.open_todos[-1], self.open_todos[position]
+            return self.open_todos.pop()
+        return rng.choice(self.todos)
+
+    def pop_relation(self, rng):
+        if not self.relations:
+            return None
+        position = rng.randrange(len(self.relations))
+        self.relations[position], self.relations[-1] = self.relations[-1], self.relations[position]
+        return self.relations.pop()
+
+    #private method
+    def __load(self, chunk_size=5000):
+        chunks = {}
+        for table_name, item in self.generator.iter_rows():
+            if table_name == "Todos":
+                self.todos.append((item["user_name"], item["id"]))
+                if item["clear_date"] == "0":
+                    self.open_todos.append((item["user_name"], item["id"]))
+            elif table_name == "FollowRelation":
+                self.relations.append((item["follower_name"], item["id"]))
+            chunk = chunks.setdefault(table_name, [])
+            chunk.append(item)
+            self.row_counts[table_name] = self.row_counts.get(table_name, 0) + 1
+            if len(chunk) >= chunk_size:
+                self.resource.load_items(table_name, chunks.pop(table_name))
+        for table_name, chunk in chunks.items():
+            self.resource.load_items(table_name, chunk)
+
+
+class TokenStore():
+    """
+    ユーザごとのID Token / Access Tokenを1度だけ発行して使い回す(署名のコストを計測に含めない)
+    """
+    def __init__(self, local_jwks):
+        self.local_jwks = local_jwks
+        self.id_tokens     = {}
+        self.access_tokens = {}
+
+    def id_token(self, user_name):
+        if user_name not in self.id_tokens:
+            self.id_tokens[user_name] = self.local_jwks.mint_id_token(user_name)
+        return self.id_tokens[user_name]
+
+    def access_token(self, user_name):
+        if user_name not in self.access_tokens:
+            self.access_tokens[user_name] = self.local_jwks.mint_access_token(user_name)
+        return self.access_tokens[user_name]
+
+
+def build_stream_event(dataset, rng):
+    """
+    未完了のTodoを今日完了にしたMODIFYレコード(NEW_AND_OLD_IMAGES)を生成する
+    """
+    from boto3.dynamodb.types import TypeSerializer
+    serializer = TypeSerializer()
+    user_name, todo_id = dataset.pick_todo(rng, open_only=True)
+    old_image = dataset.resource.Table("Todos").get_item(Key={"id": todo_id})["Item"]
+    today     = datetime.now().strftime("%Y-%m-%d")
+    new_image = dict(old_image, is_cleared=True, comment="", clear_date=today + "T00:00:00.000000", clear_date_bucket=today)
+    sequence  = str(rng.randrange(10 ** 20))
+    return {"Records": [{
+        "eventID": str(uuid.uuid4()),
+        "eventName": "MODIFY",
+        "eventSource": "aws:dynamodb",
+        "dynamodb": {
+            "Keys": {"id": {"N": str(todo_id)}},
+            "OldImage": {name: serializer.serialize(value) for name, value in old_image.items()},
+            "NewImage": {name: serializer.serialize(value) for name, value in new_image.items()},
+            "SequenceNumber": sequence,
+            "StreamViewType": "NEW_AND_OLD_IMAGES"
+        }
+    }]}
+
+
+def build_cases(dataset, tokens):
+    """
+    lambda_handlerごとのケースを返す(イベントはrngから毎回生成する)
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    def auth_headers(user_name):
+        return {"Authorization": tokens.id_token(user_name)}
+
+    def todo_query_event(rng):
+        return api_gateway_event("GET", "/todos", headers=auth_headers(dataset.pick_user(rng)))
+
+    def add_todo_event(rng):
+        user_name = dataset.pick_user(rng)
+        return api_gateway_event("POST", "/todos", body={
+            "user_name": user_name, "access_token": tokens.access_token(user_name),
+            "name": rng.choice(MENUS)[0], "weight": str(rng.randint(10, 100)), "set": str(rng.randint(1, 5)), "clear_plan": today
+        })
+
+    def add_todos_event(rng):
+        user_name = dataset.pick_user(rng)
+        todos = [{"name": rng.choice(MENUS)[0], "weight": str(rng.randint(10, 100)), "set": str(rng.randint(1, 5)), "clear_plan": today}
+                 for _ in range(5)]
+        return api_gateway_event("POST", "/todos/batch", body={
+            "user_name": user_name, "access_token": tokens.access_token(user_name), "todos": todos
+        })
+
+    def complete_todo_event(rng):
+        user_name, todo_id = dataset.pick_todo(rng, open_only=True)
+        return api_gateway_event("POST", "/todos/complete", headers=auth_headers(user_name),
+                                 body={"id": todo_id, "clear_date": today, "comment": "benchmark"})
+
+    def update_todo_event(rng):
+        user_name, todo_id = dataset.pick_todo(rng)
+        return api_gateway_event("PUT", "/todos", headers=auth_headers(user_name), body={
+            "id": todo_id, "user_name": user_name, "name": rng.choice(MENUS)[0],
+            "set": rng.randint(1, 5), "weight": rng.randint(10, 100), "clear_plan": today
+        })
+
+    def get_graph_data_event(rng):
+        user_name = dataset.pick_user(rng)
+        return api_gateway_event("GET", "/graph/{user_name}", path_parameters={"user_name": user_name})
+
+    def analize_muscle_menus_event(rng):
+        return api_gateway_event("POST", "/analize", headers=auth_headers(dataset.pick_user(rng)), body={"name": rng.choice(MENUS)[0]})
+
+    def timelines_event(rng):
+        return api_gateway_event("GET", "/timelines", headers=auth_headers(dataset.pick_user(rng)), query_parameters={"limit": "20"})
+
+    def relation_event(rng):
+        follower_name, following_name = rng.sample(dataset.user_names, 2)
+        return api_gateway_event("POST", "/relation", headers=auth_headers(follower_name), body={"following_name": following_name})
+
+    def unfollow_event(rng):
+        relation = dataset.pop_relation(rng)
+        follower_name, relation_id = relation if relation else (dataset.pick_user(rng), 0)
+        return api_gateway_event("DELETE", "/relation/{id}", headers=auth_headers(follower_name), path_parameters={"id": str(relation_id)})
+
+    def options_event(rng):
+        return api_gateway_event("OPTIONS", "/todos")
+
+    stream_fixture = load_event_fixture("todo_stream_event.json")
+
+    def timeline_fanout_event(rng):
+        # 記録したイベント(event/todo_stream_event.json)と生成したイベントを交互に使う
+        return stream_fixture if rng.random() < 0.5 else build_stream_event(dataset, rng)
+
+    return [
+        HandlerCase("todo_query", "todo_query", todo_query_event, is_status_ok),
+        HandlerCase("add_todo", "add_todo", add_todo_event, is_status_ok),
+        HandlerCase("add_todos", "add_todos", add_todos_event, is_status_ok),
+        HandlerCase("complete_todo", "complete_todo", complete_todo_event, is_status_ok),
+        HandlerCase("update_todo", "update_todo", update_todo_event, is_status_ok),
+        HandlerCase("get_graph_data", "get_graph_data", get_graph_data_event, is_status_ok),
+        HandlerCase("analize_muscle_menus", "analize_muscle_menus", analize_muscle_menus_event, is_status_ok),
+        HandlerCase("timelines", "timelines", timelines_event, is_status_ok),
+        HandlerCase("relation", "relation", relation_event, is_status_ok),
+        HandlerCase("unfollow", "unfollow", unfollow_event, is_status_ok),
+        HandlerCase("options_method", "options_method", options_event, is_status_ok),
+        HandlerCase("timeline_fanout", "timeline_fanout", timeline_fanout_event, is_stream_ok)
+    ]
+
+
+def load_handlers(cases):
+    """
+    ケースのハンドラを読み込む。読み込めない関数(依存パッケージがないなど)は理由を返す
+
+    Returns
+    -------
+    handlers : dict
+        関数名 -> lambda_handler
+    unavailable : dict
+        関数名 -> 読み込めなかった理由
+    """
+    handlers    = {}
+    unavailable = {}
+    for function_name in sorted({case.function_name for case in cases}):
+        try:
+            handlers[function_name] = benchutil.load_handler(function_name).lambda_handler
+        except Exception as e:
+            unavailable[function_name] = "{}: {}".format(type(e).__name__, e)
+    return handlers, unavailable
+
+
+def new_rng(seed, name):
+    return random.Random("{}:{}".format(seed, name))
@@ -0,0 +1,364 @@
+"""
+API Gatewayのイベントを目標のリクエストレートでハンドラへ送り込む負荷試験ハーネス
+
+- 一覧・登録・完了・フォロー・タイムライン・分析などのイベントを、重みつきの組み合わせ(--mix)で生成する
+- 到着時刻はあらかじめ決め(一定間隔またはポアソン到着)、ワーカー数(--workers)のスレッドプールで実行する。
+  応答時間は予定の到着時刻から測るため、処理が追いつかない場合は待ち時間として現れる
+- Lambdaのコンテナを模擬する: コンテナは1度に1リクエストのみ処理し、空いているコンテナがなければ新しく起動する。
+  起動時(コールドスタート)はハンドラと layer/python のモジュールを読み込み直し、その時間を応答時間に含める。
+  初回のリクエストで読み込まれるモジュール(registry_layerが生成するdynamodb_layerのオブジェクト)も起動時に生成する。
+  --idle-timeout / --recycle-rate でコンテナを破棄してコールドスタートを発生させる
+- --rps に複数の値を指定すると段階的に負荷を上げ、スループット・p99・エラー率から飽和点を報告する
+
+DynamoDBはインメモリの代替(--latency-ms で往復時間を模擬)、CognitoはローカルJWKSを使う。
+1プロセス内のスレッドで実行するため、CPUを使う処理はGILで直列化される(I/O待ちは重なる)
+
+Usage
+-----
+python tests/benchmark/load_replay.py --users 1000 --rps 50 100 200 400 --duration 10 --workers 16 --latency-ms 5
+python tests/benchmark/load_replay.py --mix todo_query=5,complete_todo=1 --rps 100 --recycle-rate 0.05 --output replay.json
+"""
+import argparse
+import bisect
+import contextlib
+import glob
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import accumulate
+
+import benchutil
+import handler_cases
+
+# 既定のリクエストの組み合わせ(ケース名 -> 重み)
+DEFAULT_MIX = {
+    "todo_query": 30,
+    "timelines": 20,
+    "get_graph_data": 10,
+    "add_todo": 10,
+    "complete_todo": 10,
+    "update_todo": 5,
+    "analize_muscle_menus": 5,
+    "relation": 4,
+    "add_todos": 3,
+    "unfollow": 3
+}
+# ヒストグラムの区切り(ミリ秒)
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+# コンテナ間で共有するモジュール(読み込み直さない)。データベースは全てのコンテナで共有する
+SHARED_MODULES = ("memory_dynamodb_layer", "logger_layer")
+
+
+def get_project_modules():
+    return [os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(benchutil.LAYER_DIR, "*.py"))
+            if os.path.splitext(os.path.basename(path))[0] not in SHARED_MODULES]
+
+
+class Container():
+    """
+    Lambdaのコンテナ。起動時にハンドラとlayerのモジュールを読み込み直す
+
+    Parameters
+    ----------
+    function_name : string
+        src配下の関数名
+    container_id : int
+        コンテナの番号(モジュール名の重複を避けるために使う)
+    local_jwks : benchutil.LocalJwks
+        読み込み直したcognito_layerへ登録する鍵セット
+    """
+    import_lock     = threading.Lock()
+    project_modules = None
+
+    def __init__(self, function_name, container_id, local_jwks):
+        self.function_name = function_name
+        self.invocations   = 0
+        started = time.perf_counter()
+        self.handler = self.__import_handler(container_id, local_jwks)
+        self.init_ms = (time.perf_counter() - started) * 1000
+        self.last_used = time.monotonic()
+
+    #private method
+    def __import_handler(self, container_id, local_jwks):
+        # モジュールの読み込みはプロセスで直列に行う(他のコンテナは読み込み済みのモジュールを参照し続ける)
+        with Container.import_lock:
+            if Container.project_modules is None:
+                Container.project_modules = get_project_modules()
+            for module_name in Container.project_modules:
+                sys.modules.pop(module_name, None)
+            path   = os.path.join(benchutil.SRC_DIR, self.function_name, "app.py")
+            spec   = importlib.util.spec_from_file_location("{}_app_{}".format(self.function_name, container_id), path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            cognito_layer = sys.modules.get("cognito_layer")
+            if cognito_layer is not None:
+                local_jwks.install(cognito_layer.jwks_key_store)
+            self.__preload_lazy_modules()
+        return module.lambda_handler
+
+    def __preload_lazy_modules(self):
+        # registry_layerは初回の取得時にdynamodb_layerを読み込むため、ロックの外(リクエスト中)で読み込むと
+        # 他のコンテナが読み込んだモジュールを参照してしまう。ロックの中で生成し、このコンテナのモジュールに結びつける
+        registry_layer = sys.modules.get("registry_layer")
+        if registry_layer is None:
+            return
+        for getter in (registry_layer.get_todo, registry_layer.get_follow_relation, registry_layer.get_timeline_inbox):
+            getter()
+
+
+class ContainerPool():
+    """
+    関数ごとのコンテナの管理。空いているコンテナがなければ起動する
+
+    Parameters
+    ----------
+    idle_timeout : float
+        この秒数使われなかったコンテナは破棄する
+    recycle_rate : float
+        リクエストの後にコンテナを破棄する確率(スケールイン・デプロイの模擬)
+    """
+    def __init__(self, function_name, local_jwks, idle_timeout, recycle_rate, rng):
+        self.function_name = function_name
+        self.local_jwks    = local_jwks
+        self.idle_timeout  = idle_timeout
+        self.recycle_rate  = recycle_rate
+        self.rng           = rng
+        self.lock          = threading.Lock()
+        self.idle          = []
+        self.next_id       = 0
+        self.started       = 0
+
+    def acquire(self):
+        """
+        (コンテナ, コールドスタートか)を返す
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.idle = [container for container in self.idle if now - container.last_used < self.idle_timeout]
+            if self.idle:
+                return self.idle.pop(), False
+            self.next_id += 1
+            self.started += 1
+            container_id = self.next_id
+        return Container(self.function_name, container_id, self.local_jwks), True
+
+    def release(self, container):
+        container.last_used = time.monotonic()
+        with self.lock:
+            if self.recycle_rate and self.rng.random() < self.recycle_rate:
+                return
+            self.idle.append(container)
+
+
+def run_request(pool, case, event, scheduled_at):
+    """
+    1リクエストを実行し、記録を返す
+    """
+    container, cold = pool.acquire()
+    started = time.perf_counter()
+    record  = {"endpoint": case.name, "cold": cold, "init_ms": container.init_ms if cold else 0.0, "error": None}
+    try:
+        response = container.handler(event, handler_cases.LambdaContext(case.function_name))
+        record["ok"] = case.is_success(response)
+        if not record["ok"]:
+            record["error"] = "status {}".format(response.get("statusCode") if isinstance(response, dict) else response)
+    except Exception as e:
+        record["ok"]    = False
+        record["error"] = "{}: {}".format(type(e).__name__, e)
+    finally:
+        pool.release(container)
+    finished = time.perf_counter()
+    container.invocations += 1
+    record["service_ms"]  = (finished - started) * 1000
+    record["response_ms"] = (finished - scheduled_at) * 1000
+    return record
+
+
+def replay_step(rps, duration, cases, weights, pools, executor, rng, arrival):
+    """
+    目標のレートで duration 秒分のリクエストを送り、全ての応答を待つ
+    """
+    cumulative = list(accumulate(weights))
+    futures    = []
+    started_at = time.perf_counter()
+    scheduled  = started_at
+    while True:
+        scheduled += rng.expovariate(rps) if arrival == "poisson" else 1.0 / rps
+        if scheduled - started_at >= duration:
+            break
+        case  = cases[bisect.bisect_right(cumulative, rng.random() * cumulative[-1])]
+        event = case.build_event(rng)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        futures.append(executor.submit(run_request, pools[case.function_name], case, event, scheduled))
+    wait(futures)
+    records = [future.result() for future in futures]
+    return records, time.perf_counter() - started_at
+
+
+def histogram(values_ms):
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for value in values_ms:
+        counts[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, value)] += 1
+    return counts
+
+
+def summarize_records(records, elapsed):
+    """
+    エンドポイントごと・全体のスループット、応答時間、エラー率、コールドスタートを集計する
+    """
+    groups = {"ALL": records}
+    for record in records:
+        groups.setdefault(record["endpoint"], []).append(record)
+    summary = {}
+    for endpoint, group in groups.items():
+        response_ms = [record["response_ms"] for record in group]
+        errors      = [record for record in group if not record["ok"]]
+        entry = benchutil.summarize(response_ms)
+        entry.update({
+            "throughput": len(group) / elapsed if elapsed else 0.0,
+            "error_rate": len(errors) / len(group) if group else 0.0,
+            "cold_starts": sum(1 for record in group if record["cold"]),
+            "init_ms": benchutil.summarize([record["init_ms"] for record in group if record["cold"]]),
+            "service_p50": benchutil.summarize([record["service_ms"] for record in group])["p50"],
+            "histogram": histogram(response_ms),
+            "errors": sorted({record["error"] for record in errors})[:5]
+        })
+        summary[endpoint] = entry
+    return summary
+
+
+def is_saturated(target_rps, summary, slo_ms, max_error_rate):
+    total = summary["ALL"]
+    return total["throughput"] < target_rps * 0.9 or total["p99"] > slo_ms or total["error_rate"] > max_error_rate
+
+
+def print_step(target_rps, summary):
+    print("\n== target {} rps: achieved {:.1f} rps".format(target_rps, summary["ALL"]["throughput"]))
+    print("{:<22} {:>7} {:>8} {:>9} {:>9} {:>9} {:>9} {:>6} {:>7}".format(
+        "endpoint", "count", "rps", "p50(ms)", "p95(ms)", "p99(ms)", "svc p50", "cold", "errors"))
+    for endpoint, entry in sorted(summary.items(), key=lambda pair: (pair[0] != "ALL", pair[0])):
+        print("{:<22} {:>7} {:>8.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>6} {:>6.1%}".format(
+            endpoint, entry["count"], entry["throughput"], entry["p50"], entry["p95"], entry["p99"],
+            entry["service_p50"], entry["cold_starts"], entry["error_rate"]))
+    init_ms = summary["ALL"]["init_ms"]
+    if init_ms["count"]:
+        print("cold start init: {} starts, p50 {:.2f}ms, max {:.2f}ms".format(init_ms["count"], init_ms["p50"], init_ms["max"]))
+    print_histogram(summary["ALL"]["histogram"])
+    for endpoint, entry in summary.items():
+        for error in entry["errors"]:
+            print("  {} error: {}".format(endpoint, error))
+
+
+def print_histogram(counts, width=40):
+    labels = ["<{}ms".format(bound) for bound in HISTOGRAM_BOUNDS_MS] + [">={}ms".format(HISTOGRAM_BOUNDS_MS[-1])]
+    peak   = max(counts) or 1
+    for label, count in zip(labels, counts):
+        if count:
+            print("  {:>9} {:>7} {}".format(label, count, "#" * max(1, int(count / peak * width))))
+
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def run(args):
+    from memory_dynamodb_layer import set_shared_memory_resource
+    local_jwks = benchutil.LocalJwks()
+    local_jwks.install()
+    dataset = handler_cases.HandlerDataset(args.users, seed=args.seed, latency_ms=args.latency_ms, throttle_rate=args.throttle_rate)
+    # 読み込み直したdynamodb_layerも同じデータベースを使う
+    os.environ["DYNAMODB_BACKEND"] = "memory"
+    set_shared_memory_resource(dataset.resource)
+    tokens = handler_cases.TokenStore(local_jwks)
+    for user_name in dataset.user_names[:args.token_users]:
+        tokens.id_token(user_name)
+        tokens.access_token(user_name)
+    dataset.user_names = dataset.user_names[:args.token_users]
+
+    mix   = parse_mix(args.mix)
+    rng   = handler_cases.new_rng(args.seed, "replay")
+    pools = {}
+    cases, weights, skipped = [], [], {}
+    for case in handler_cases.build_cases(dataset, tokens):
+        if case.name not in mix:
+            continue
+        pool = pools.get(case.function_name) or ContainerPool(case.function_name, local_jwks, args.idle_timeout, args.recycle_rate, rng)
+        try:
+            # 起動できるか確認し、そのコンテナを待機させておく
+            container, _ = pool.acquire()
+            pool.release(container)
+        except Exception as e:
+            skipped[case.name] = "{}: {}".format(type(e).__name__, e)
+            continue
+        pools[case.function_name] = pool
+        cases.append(case)
+        weights.append(mix[case.name])
+    for name, reason in skipped.items():
+        print("skipped {} ({})".format(name, reason), file=sys.stderr)
+    if not cases:
+        raise SystemExit("No endpoints to replay")
+
+    steps = []
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="replay") as executor:
+        for target_rps in args.rps:
+            records, elapsed = replay_step(target_rps, args.duration, cases, weights, pools, executor, rng, args.arrival)
+            summary = summarize_records(records, elapsed)
+            steps.append({"target_rps": target_rps, "elapsed": elapsed, "summary": summary,
+                          "saturated": is_saturated(target_rps, summary, args.slo_ms, args.max_error_rate)})
+    return {"skipped": skipped, "steps": steps}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--token-users", type=int, default=200, help="リクエストを送るユーザ数(トークンは事前に発行する)")
+    parser.add_argument("--rps", type=float, nargs="+", default=[50.0], help="目標のリクエストレート(複数指定で段階的に上げる)")
+    parser.add_argument("--duration", type=float, default=10.0, help="1段階あたりの秒数")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--arrival", choices=("poisson", "constant"), default="poisson")
+    parser.add_argument("--mix", help="ケース名=重み をカンマ区切りで指定(例: todo_query=5,add_todo=1)")
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="コンテナを破棄するまでの待機秒数")
+    parser.add_argument("--recycle-rate", type=float, default=0.0, help="リクエスト後にコンテナを破棄する確率")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="DynamoDBの往復時間の模擬")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="DynamoDBのスロットリングの模擬")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="飽和と判定するp99")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    parser.add_argument("--verbose", action="store_true", help="ハンドラのログ・メトリクスを出力する")
+    args = parser.parse_args()
+
+    if args.verbose:
+        report = run(args)
+    else:
+        logging.disable(logging.CRITICAL)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            report = run(args)
+    for step in report["steps"]:
+        print_step(step["target_rps"], step["summary"])
+    sustainable = [step["target_rps"] for step in report["steps"] if not step["saturated"]]
+    saturated   = [step["target_rps"] for step in report["steps"] if step["saturated"]]
+    print("\nmax sustainable rate: {}".format("{} rps".format(max(sustainable)) if sustainable else "none of the steps"))
+    if saturated:
+        print("saturated from: {} rps".format(min(saturated)))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print("Saved {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
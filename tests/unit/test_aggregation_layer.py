@@ -0,0 +1,40 @@
+import pytest
+
+from aggregation_layer import count_by, order_counts, load_numpy, ORDER_COUNT, ORDER_FIRST
+
+
+TODOS = [
+    {"name": "squat", "clear_date": "2020-05-02T10:00:00.000000"},
+    {"name": "bench", "clear_date": "2020-05-01T10:00:00.000000"},
+    {"name": "squat", "clear_date": "2020-05-01T12:00:00.000000"},
+    {"name": "deadlift", "clear_date": "2020-05-03T09:00:00.000000"},
+    {"name": "squat", "clear_date": "2020-05-03T11:00:00.000000"},
+]
+KEYS = {"pie": "name", "line": lambda todo: todo["clear_date"][:10]}
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_counts_every_key_in_one_pass_in_key_order(use_numpy):
+    if use_numpy and load_numpy() is None:
+        pytest.skip("numpy is not installed")
+    counts = count_by(iter(TODOS), KEYS, use_numpy=use_numpy)
+
+    assert counts["pie"] == {"bench": 1, "deadlift": 1, "squat": 3}
+    assert list(counts["pie"]) == ["bench", "deadlift", "squat"]
+    assert list(counts["line"].items()) == [("2020-05-01", 2), ("2020-05-02", 1), ("2020-05-03", 2)]
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_count_and_first_seen_order_with_top(use_numpy):
+    if use_numpy and load_numpy() is None:
+        pytest.skip("numpy is not installed")
+    by_count = count_by(TODOS, KEYS, order=ORDER_COUNT, top=2, use_numpy=use_numpy)
+    assert list(by_count["pie"].items()) == [("squat", 3), ("bench", 1)]
+    assert list(by_count["line"].items()) == [("2020-05-01", 2), ("2020-05-03", 2)]
+
+    first_seen = count_by(TODOS, KEYS, order=ORDER_FIRST, use_numpy=use_numpy)
+    assert list(first_seen["pie"]) == ["squat", "bench", "deadlift"]
+
+    assert count_by([{"id": 7}, {"id": 3}, {"id": 7}], {"id": "id"}, use_numpy=use_numpy) == {"id": {3: 1, 7: 2}}
+    with pytest.raises(ValueError):
+        order_counts({"a": 1}, order="unknown")
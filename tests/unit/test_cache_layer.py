@@ -0,0 +1,91 @@
+import sys
+import types
+from decimal import Decimal
+
+import pytest
+
+from cache_layer import InMemoryKeyValueStore, KeyValueCacheBackend, LruTtlCacheBackend, NullTodoCache, TodoCache, create_todo_cache
+
+
+@pytest.fixture(params=["memory", "key_value"])
+def todo_cache(request):
+    if request.param == "memory":
+        return TodoCache(LruTtlCacheBackend(max_size=16, default_ttl=60))
+    return TodoCache(KeyValueCacheBackend(InMemoryKeyValueStore(), default_ttl=60))
+
+
+def test_reads_are_cached_until_user_writes(todo_cache):
+    loads = []
+    def loader():
+        loads.append(1)
+        return [{"id": Decimal(len(loads)), "name": "ベンチプレス"}]
+
+    first = todo_cache.get_or_load("wara", "all", loader)
+    second = todo_cache.get_or_load("wara", "all", loader)
+    todo_cache.invalidate("wara")
+    third = todo_cache.get_or_load("wara", "all", loader)
+
+    assert first == second == [{"id": Decimal(1), "name": "ベンチプレス"}]
+    assert third[0]["id"] == Decimal(2)
+    assert todo_cache.get_counters() == {"hit": 1, "miss": 2, "invalidate": 1}
+
+
+def test_cached_value_is_not_shared_with_caller(todo_cache):
+    todo_cache.get_or_load("wara", "all", lambda: [{"clear_plan": "2020-05-01T00:00:00.000000"}])[0]["clear_plan"] = "2020-05-01"
+
+    assert todo_cache.get_or_load("wara", "all", lambda: []) == [{"clear_plan": "2020-05-01T00:00:00.000000"}]
+
+
+def test_lost_version_never_revives_old_entries():
+    backend = LruTtlCacheBackend(max_size=16, default_ttl=60)
+    todo_cache = TodoCache(backend)
+    todo_cache.get_or_load("wara", "all", lambda: ["old"])
+    backend.delete("todo-version:wara")
+
+    assert todo_cache.get_or_load("wara", "all", lambda: ["new"]) == ["new"]
+
+
+def test_process_local_backend_cannot_be_configured(monkeypatch):
+    # Writers and readers run in different containers, so only a shared store keeps reads fresh
+    monkeypatch.setenv("TODO_CACHE_BACKEND", "memory")
+    assert isinstance(create_todo_cache(), NullTodoCache)
+
+
+def test_loads_right_after_a_write_are_not_cached():
+    # Loads query a GSI, which may still return rows from before the write
+    todo_cache = TodoCache(KeyValueCacheBackend(InMemoryKeyValueStore(), default_ttl=60), settle_seconds=60)
+    assert todo_cache.get_or_load("wara", "all", lambda: ["before"]) == ["before"]
+    assert todo_cache.get_or_load("wara", "all", lambda: ["unused"]) == ["before"]
+
+    todo_cache.invalidate("wara")
+    assert todo_cache.get_or_load("wara", "all", lambda: ["lagging"]) == ["lagging"]
+    assert todo_cache.get_or_load("wara", "all", lambda: ["after"]) == ["after"]
+
+    todo_cache.settle_seconds = 0
+    assert todo_cache.get_or_load("wara", "all", lambda: ["after"]) == ["after"]
+    assert todo_cache.get_or_load("wara", "all", lambda: ["unused"]) == ["after"]
+
+
+def test_unreachable_redis_times_out_and_falls_back_to_loader(monkeypatch):
+    class RedisError(Exception):
+        pass
+
+    class DownClient():
+        def get(self, key):
+            raise RedisError("Timeout reading from socket")
+
+        def set(self, key, value, ex=None, nx=False):
+            raise RedisError("Timeout writing to socket")
+
+    connections = []
+    def from_url(url, **options):
+        connections.append(options)
+        return DownClient()
+
+    monkeypatch.setitem(sys.modules, "redis", types.SimpleNamespace(RedisError=RedisError, Redis=types.SimpleNamespace(from_url=from_url)))
+    monkeypatch.setenv("TODO_CACHE_BACKEND", "redis")
+    monkeypatch.setenv("TODO_CACHE_URL", "redis://cache:6379")
+    todo_cache = create_todo_cache()
+
+    assert connections == [{"socket_timeout": 0.2, "socket_connect_timeout": 0.2}]
+    assert todo_cache.get_or_load("wara", "all", lambda: ["loaded"]) == ["loaded"]
@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+
+import pytest
+
+jwt = pytest.importorskip("jwt")
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+import cognito_layer
+from cognito_layer import CognitoObject, JwksKeyStore, VerifiedClaimsCache, TokenVerificationError
+
+
+@pytest.fixture()
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture()
+def jwks(private_key):
+    """ Generates local JWKS"""
+    jwk_key = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk_key.update({"kid": "local-kid", "alg": "RS256", "use": "sig"})
+    return {"keys": [jwk_key]}
+
+
+@pytest.fixture()
+def local_cognito(jwks, monkeypatch):
+    monkeypatch.setenv("COGNITO_ISSUER", "https://cognito-idp.local/pool")
+    monkeypatch.setenv("COGNITO_CLIENT_ID", "client")
+    monkeypatch.setattr(cognito_layer, "jwks_key_store", JwksKeyStore(fetcher=lambda url: jwks))
+    monkeypatch.setattr(cognito_layer, "verified_claims_cache", VerifiedClaimsCache())
+
+
+def create_token(private_key, **claims):
+    payload = {"iss": "https://cognito-idp.local/pool", "exp": int(time.time()) + 60}
+    payload.update(claims)
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": "local-kid"})
+
+
+def test_known_kid_is_served_without_refetch(jwks):
+    calls = []
+    store = JwksKeyStore(fetcher=lambda url: calls.append(url) or jwks)
+
+    assert store.get_public_key("local-kid") is not None
+    assert store.get_public_key("local-kid") is not None
+    counters = store.get_counters()
+    assert len(calls) == 1
+    assert counters["hit"] == 1
+    assert counters["miss"] == 1
+    assert counters["refresh"] == 1
+
+
+def test_unknown_kid_refresh_is_rate_limited(jwks):
+    calls = []
+    store = JwksKeyStore(fetcher=lambda url: calls.append(url) or jwks, min_refresh_interval=60)
+
+    assert store.get_public_key("local-kid") is not None
+    assert store.get_public_key("unknown-kid") is None
+    assert len(calls) == 1
+
+
+def test_stale_keys_are_served_when_refresh_fails(jwks):
+    responses = [jwks]
+    def fetcher(url):
+        if responses:
+            return responses.pop()
+        raise IOError("jwks endpoint is down")
+    store = JwksKeyStore(fetcher=fetcher, ttl_seconds=0, min_refresh_interval=0)
+
+    assert store.get_public_key("local-kid") is not None
+    assert store.get_public_key("local-kid") is not None
+    counters = store.get_counters()
+    assert counters["refresh_failure"] == 1
+    assert counters["stale"] >= 1
+
+
+def test_concurrent_refreshes_collapse_into_one(jwks):
+    calls = []
+    started = threading.Event()
+    def fetcher(url):
+        calls.append(url)
+        started.wait(1)
+        return jwks
+    store = JwksKeyStore(fetcher=fetcher, min_refresh_interval=0)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get_public_key("local-kid"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    started.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(key is not None for key in results)
+
+
+def test_claims_cache_returns_claims_until_exp():
+    cache = VerifiedClaimsCache(max_size=4)
+    cache.put("token-a", {"cognito:username": "wara", "exp": time.time() + 60})
+    cache.put("token-b", {"cognito:username": "miki", "exp": time.time() - 1})
+
+    assert cache.get("token-a")["cognito:username"] == "wara"
+    assert cache.get("token-b") is None
+    assert cache.get_counters()["expired"] == 1
+
+
+def test_claims_cache_evicts_least_recently_used():
+    cache = VerifiedClaimsCache(max_size=2)
+    exp = time.time() + 60
+    cache.put("token-a", {"exp": exp})
+    cache.put("token-b", {"exp": exp})
+    cache.get("token-a")
+    cache.put("token-c", {"exp": exp})
+
+    assert cache.get("token-a") is not None
+    assert cache.get("token-b") is None
+    assert cache.get("token-c") is not None
+    assert cache.get_counters()["evicted"] == 1
+
+
+def test_access_token_is_verified_locally(private_key, local_cognito):
+    token = create_token(private_key, token_use="access", client_id="client", username="wara")
+
+    claims = CognitoObject.get_user_info_from_access_token(token)
+    assert claims["username"] == "wara"
+    assert cognito_layer.verified_claims_cache.get(token, token_use="access") is not None
+
+
+@pytest.mark.parametrize("claims", [
+    {"token_use": "id", "client_id": "client", "username": "wara"},
+    {"token_use": "access", "client_id": "other", "username": "wara"},
+])
+def test_access_token_with_invalid_claims_is_rejected(private_key, local_cognito, claims):
+    token = create_token(private_key, **claims)
+
+    with pytest.raises(TokenVerificationError):
+        CognitoObject.get_user_info_from_access_token(token)
+
+
+def test_unknown_kid_raises_verification_error(private_key, local_cognito):
+    token = jwt.encode({"iss": "https://cognito-idp.local/pool", "exp": int(time.time()) + 60, "cognito:username": "wara"},
+                       private_key, algorithm="RS256", headers={"kid": "rotated-kid"})
+
+    with pytest.raises(TokenVerificationError):
+        CognitoObject.get_user_info_from_id_token(token)
+    with pytest.raises(TokenVerificationError):
+        CognitoObject.get_user_info_from_id_token("not-a-token")
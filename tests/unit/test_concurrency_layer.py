@@ -0,0 +1,28 @@
+import threading
+import time
+
+import pytest
+
+from concurrency_layer import TaskTimeoutError, get_executor, run_concurrently
+
+
+def test_independent_tasks_run_in_parallel_on_a_shared_pool():
+    barrier = threading.Barrier(2, timeout=2)
+    def wait_for_other_task(value):
+        barrier.wait()
+        return value
+
+    results = run_concurrently({"following": lambda: wait_for_other_task(1), "timeline": lambda: wait_for_other_task(2)})
+    assert results == {"following": 1, "timeline": 2}
+    assert get_executor() is get_executor()
+
+
+def test_slow_task_raises_timeout_and_nested_calls_run_inline():
+    with pytest.raises(TaskTimeoutError) as error:
+        run_concurrently({"fast": lambda: 1, "slow": (lambda: time.sleep(0.5), 0.05)})
+    assert error.value.task_name == "slow"
+
+    def nested():
+        return run_concurrently({"a": lambda: threading.current_thread().name, "b": lambda: threading.current_thread().name})
+    outer = run_concurrently({"nested": nested, "other": lambda: None})
+    assert outer["nested"]["a"] == outer["nested"]["b"]
@@ -0,0 +1,406 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("boto3")
+
+import dynamodb_layer
+from dynamodb_layer import DynamodbObject
+
+
+class PagedTable():
+    """ Returns items page by page like DynamoDB"""
+    def __init__(self, items, page_size=3):
+        self.items = items
+        self.page_size = page_size
+        self.requests = []
+
+    def scan(self, **params):
+        self.requests.append(params)
+        start = params.get("ExclusiveStartKey", {}).get("id", 0)
+        size = min(self.page_size, params.get("Limit", self.page_size))
+        page = self.items[start:start + size]
+        response = {"Items": page, "Count": len(page), "ScannedCount": len(page)}
+        if start + size < len(self.items):
+            response["LastEvaluatedKey"] = {"id": start + size}
+        return response
+
+    query = scan
+
+
+@pytest.fixture()
+def paged_table(monkeypatch):
+    table = PagedTable([{"id": number} for number in range(10)])
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_resource", lambda: None)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_table", lambda table_name: table)
+    return table
+
+
+def test_iter_scan_follows_last_evaluated_key(paged_table):
+    db = DynamodbObject()
+    db.set_table("Todos")
+
+    assert [item["id"] for item in db.iter_scan()] == list(range(10))
+    assert len(paged_table.requests) == 4
+
+
+def test_iter_query_stops_reading_pages_at_limit(paged_table):
+    db = DynamodbObject()
+    db.set_table("Todos")
+
+    items = list(db.iter_query({"KeyConditionExpression": "#UN = :un", "FilterExpression": ""}, limit=4))
+    assert [item["id"] for item in items] == [0, 1, 2, 3]
+    assert len(paged_table.requests) == 2
+    assert "FilterExpression" not in paged_table.requests[0]
+
+
+class SegmentedTable():
+    """ Splits items by Segment and throttles the first request of each segment"""
+    def __init__(self, items):
+        self.items = items
+        self.throttled = set()
+
+    def scan(self, **params):
+        from botocore.exceptions import ClientError
+        segment = params["Segment"]
+        if segment not in self.throttled:
+            self.throttled.add(segment)
+            raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "throttled"}}, "Scan")
+        segment_items = [item for item in self.items if item["id"] % params["TotalSegments"] == segment]
+        start = params.get("ExclusiveStartKey", {}).get("index", 0)
+        page = segment_items[start:start + 2]
+        response = {"Items": page}
+        if start + 2 < len(segment_items):
+            response["LastEvaluatedKey"] = {"index": start + 2}
+        return response
+
+
+def test_parallel_scan_merges_segments_and_retries_throttling(monkeypatch):
+    table = SegmentedTable([{"id": number} for number in range(25)])
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_resource", lambda: None)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_table", lambda table_name: table)
+    monkeypatch.setattr(dynamodb_layer.time, "sleep", lambda seconds: None)
+    db = DynamodbObject()
+    db.set_table("FollowRelation")
+
+    items = list(db.parallel_scan(total_segments=4, max_workers=2))
+    assert sorted(item["id"] for item in items) == list(range(25))
+    assert table.throttled == {0, 1, 2, 3}
+
+
+def test_timeline_reads_one_query_per_clear_date_bucket(paged_table):
+    from datetime import datetime
+    todo_db = dynamodb_layer.Todo()
+
+    buckets = todo_db.get_clear_date_buckets(datetime(2020, 4, 28, 12), datetime(2020, 5, 1, 9))
+    assert buckets == ["2020-05-01", "2020-04-30", "2020-04-29", "2020-04-28"]
+
+    paged_table.items = [{"id": number, "clear_date": "2020-05-01T00:00:00.000000"} for number in range(10)]
+    list(todo_db.iter_clear_todos_newest_first(-14))
+    first_pages = [request for request in paged_table.requests if "ExclusiveStartKey" not in request]
+    assert len(first_pages) == 15
+    assert all(request["IndexName"] == "ClearDateBucketGSIndex" for request in paged_table.requests)
+
+
+class RemainingTimeContext():
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def test_retry_policy_stops_at_invocation_budget_and_remaining_time(monkeypatch):
+    from botocore.exceptions import ClientError
+    from metrics_layer import invocation_metrics
+    monkeypatch.setattr(dynamodb_layer.time, "sleep", lambda seconds: None)
+    throttled = ClientError({"Error": {"Code": "ThrottlingException", "Message": "throttled"}}, "Query")
+    calls = []
+    def throttled_call():
+        calls.append(1)
+        raise throttled
+    policy = dynamodb_layer.RetryPolicy(max_retries=5, base_delay=0.01, invocation_budget=3, time_margin_ms=100)
+
+    invocation_metrics.reset("test", RemainingTimeContext(10000))
+    with pytest.raises(ClientError):
+        policy.call(throttled_call)
+    assert len(calls) == 4
+    assert invocation_metrics.get_counter("dynamodb_retries") == 3
+    assert invocation_metrics.get_counter("dynamodb_retries_exhausted") == 1
+
+    invocation_metrics.reset("test", RemainingTimeContext(50))
+    assert policy.get_delay(0) is None
+    assert policy.call(lambda: "ok") == "ok"
+    assert not policy.is_retryable(ClientError({"Error": {"Code": "ValidationException", "Message": ""}}, "Query"))
+    invocation_metrics.reset()
+
+
+class CounterStub():
+    """ Emulates UpdateItem ADD on the atomic counter item"""
+    def __init__(self):
+        self.current_number = 0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, block_size):
+        with self.lock:
+            self.calls += 1
+            self.current_number += block_size
+            return self.current_number
+
+
+def test_id_allocator_hands_out_unique_ids_across_containers():
+    counter = CounterStub()
+    containers = [dynamodb_layer.IdBlockAllocator(counter.reserve, min_block_size=5, max_block_size=5) for _ in range(3)]
+    ids = []
+    def allocate(allocator):
+        for _ in range(50):
+            ids.append(allocator.allocate_one())
+    threads = [threading.Thread(target=allocate, args=(allocator,)) for allocator in containers for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(ids) == len(set(ids)) == 300
+    assert counter.calls == 60
+
+
+def test_id_allocator_grows_block_size_with_write_rate():
+    counter = CounterStub()
+    allocator = dynamodb_layer.IdBlockAllocator(counter.reserve, min_block_size=1, max_block_size=50, target_block_seconds=10)
+
+    assert allocator.allocate(30) == list(range(1, 31))
+    assert allocator.allocate(3) == [31, 32, 33]
+    assert allocator.block_size == 50
+    assert counter.current_number == 80
+
+
+class BatchResource():
+    """ Leaves the last item unprocessed on the first BatchWriteItem"""
+    def __init__(self):
+        self.batches = []
+        self.current_number = 0
+
+    def batch_write_item(self, RequestItems, **params):
+        requests = RequestItems["Todos"]
+        self.batches.append(len(requests))
+        if len(self.batches) == 1:
+            return {"UnprocessedItems": {"Todos": requests[-1:]}}
+        return {"UnprocessedItems": {}}
+
+    def update_item(self, **params):
+        self.current_number += params["ExpressionAttributeValues"][":increment"]
+        return {"Attributes": {"current_number": self.current_number}}
+
+
+def test_put_todos_validates_then_batch_writes_in_chunks(monkeypatch):
+    resource = BatchResource()
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_resource", lambda: resource)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_table", lambda table_name: resource)
+    monkeypatch.setattr(dynamodb_layer, "_id_allocators", {})
+    monkeypatch.setattr(dynamodb_layer.time, "sleep", lambda seconds: None)
+    todo = {"user_name": "wara", "name": "ベンチプレス", "weight": "60", "set": "3", "clear_plan": "2020-05-01"}
+    todos = [dict(todo) for _ in range(30)] + [{"user_name": "wara"}, dict(todo, clear_plan="05/01")]
+
+    results = dynamodb_layer.Todo().put_todos(todos)
+    assert [result["status"] for result in results] == ["created"] * 30 + ["invalid"] * 2
+    assert sorted(result["item"]["id"] for result in results[:30]) == list(range(1, 31))
+    assert results[0]["item"]["weight"] == 60
+    assert resource.batches == [25, 1, 5]
+    assert resource.current_number == 30
+
+
+def test_named_projection_is_added_with_placeholders(paged_table):
+    todo_db = dynamodb_layer.Todo()
+    params = {"KeyConditionExpression": "#UN = :un", "ExpressionAttributeNames": {"#UN": "user_name"}}
+
+    list(todo_db.iter_query(params, projection="chart"))
+    request = paged_table.requests[0]
+    assert request["ProjectionExpression"] == "#proj0, #proj1"
+    assert request["ExpressionAttributeNames"] == {"#UN": "user_name", "#proj0": "name", "#proj1": "clear_date"}
+    assert params["ExpressionAttributeNames"] == {"#UN": "user_name"}
+
+
+class TransactionStub():
+    """ Serves GetItem for one todo and records TransactWriteItems"""
+    def __init__(self, todo):
+        self.todo = todo
+        self.transactions = []
+        self.meta = self
+        self.client = self
+
+    def get_item(self, **params):
+        return {"Item": dict(self.todo)}
+
+    def transact_write_items(self, **params):
+        self.transactions.append(params["TransactItems"])
+        return {}
+
+
+def test_complete_todo_adds_aggregate_counts_in_the_same_transaction(monkeypatch):
+    stub = TransactionStub({"user_name": "wara", "name": "懸垂", "clear_date": "0"})
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_resource", lambda: stub)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_table", lambda table_name: stub)
+    todo_db = dynamodb_layer.Todo()
+
+    response = todo_db.complete_todo({"id": 7, "clear_date": "2020-05-01", "comment": ""})
+    assert response["Attributes"]["clear_date"] == "2020-05-01T00:00:00.000000"
+    todo_update, aggregate_update = [item["Update"] for item in stub.transactions[0]]
+    assert todo_update["ExpressionAttributeValues"][":old_c"] == {"S": "0"}
+    assert aggregate_update["TableName"] == "TodoAggregates"
+    assert aggregate_update["UpdateExpression"] == "ADD #a0 :a0, #a1 :a1, #ver :one SET #upd = :upd"
+    assert aggregate_update["ExpressionAttributeNames"] == {
+        "#a0": "day#2020-05-01", "#a1": "menu#懸垂", "#ver": "version", "#upd": "updated_at"
+    }
+
+    # re-completing moves the day count and leaves the menu count alone
+    stub.todo["clear_date"] = "2020-04-30T00:00:00.000000"
+    todo_db.complete_todo({"id": 7, "clear_date": "2020-05-01", "comment": ""})
+    aggregate_update = stub.transactions[1][1]["Update"]
+    assert aggregate_update["ExpressionAttributeNames"]["#a0"] == "day#2020-04-30"
+    assert aggregate_update["ExpressionAttributeNames"]["#a1"] == "day#2020-05-01"
+    assert aggregate_update["ExpressionAttributeValues"][":a0"] == {"N": "-1"}
+    assert aggregate_update["ExpressionAttributeValues"][":a1"] == {"N": "1"}
+
+    chart_data = todo_db.aggregate.convert_chart_data({"user_name": "wara", "menu#懸垂": 2, "day#2020-04-30": 0, "day#2020-05-01": 2})
+    assert chart_data == {"pie": {"懸垂": 2}, "line": {"2020-05-01": 2}}
+
+
+class BucketTable():
+    """ Serves ClearDateBucketGSIndex queries from items grouped by clear_date_bucket"""
+    def __init__(self, items):
+        self.items = items
+        self.buckets = []
+
+    def query(self, **params):
+        bucket = params["ExpressionAttributeValues"][":b"]
+        self.buckets.append(bucket)
+        page = [item for item in self.items if item["clear_date"][:10] == bucket]
+        return {"Items": page, "Count": len(page)}
+
+
+def test_newest_first_iteration_pages_with_a_cursor_and_stops_early(monkeypatch):
+    from datetime import datetime, timedelta
+    from itertools import islice
+    days = [(datetime.now() - timedelta(days=day)).strftime('%Y-%m-%d') for day in range(3)]
+    items = [{"id": todo_id, "clear_date": days[todo_id % 3] + "T00:00:00.000000"} for todo_id in range(1, 10)]
+    table = BucketTable(items)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_resource", lambda: table)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_table", lambda table_name: table)
+    todo_db = dynamodb_layer.Todo()
+
+    first_page = list(islice(todo_db.iter_clear_todos_newest_first(-14), 4))
+    assert [item["id"] for item in first_page] == [9, 6, 3, 7]
+    # today alone, then the next two days read ahead together
+    assert sorted(table.buckets, reverse=True) == days[:3]
+
+    last = first_page[-1]
+    second_page = list(todo_db.iter_clear_todos_newest_first(-14, before=(last["clear_date"], last["id"])))
+    assert [item["id"] for item in second_page] == [4, 1, 8, 5, 2]
+
+
+class SlowBucketTable(BucketTable):
+    """ Tracks how many bucket queries are in flight at once"""
+    def __init__(self, items):
+        super().__init__(items)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def query(self, **params):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.02)
+        try:
+            return super().query(**params)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def test_bucket_queries_run_concurrently_in_newest_first_order(monkeypatch):
+    from datetime import datetime, timedelta
+    days = [(datetime.now() - timedelta(days=day)).strftime('%Y-%m-%d') for day in range(15)]
+    items = [{"id": todo_id, "clear_date": days[todo_id % 15] + "T00:00:00.000000"} for todo_id in range(1, 31)]
+    table = SlowBucketTable(items)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_resource", lambda: table)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_table", lambda table_name: table)
+    todo_db = dynamodb_layer.Todo()
+
+    todos = list(todo_db.iter_clear_todos_newest_first(-14, concurrency=4))
+    assert [(todo["clear_date"], todo["id"]) for todo in todos] == sorted(((item["clear_date"], item["id"]) for item in items), reverse=True)
+    assert len(table.buckets) == 15
+    assert 1 < table.max_in_flight <= 4
+
+
+def test_registry_shares_one_session_across_pool_workers(monkeypatch):
+    import boto3
+    from concurrency_layer import get_executor
+
+    sessions = []
+    original_session = boto3.session.Session
+
+    def counting_session(*args, **kwargs):
+        sessions.append(original_session(*args, region_name="ap-northeast-1", **kwargs))
+        return sessions[-1]
+
+    monkeypatch.setattr(boto3.session, "Session", counting_session)
+    monkeypatch.delenv("AWS_SAM_LOCAL", raising=False)
+    monkeypatch.delenv("DYNAMODB_BACKEND", raising=False)
+    registry = dynamodb_layer.DynamodbResourceRegistry()
+    barrier = threading.Barrier(4)
+
+    def use_registry():
+        # Hold every worker until all of them are running so that each one builds its own resource
+        barrier.wait(timeout=5)
+        return registry.get_resource(), registry.get_table("Todos")
+
+    results = [future.result() for future in [get_executor("dynamodb").submit(use_registry) for _ in range(4)]]
+
+    assert len(sessions) == 1
+    assert len({id(resource.meta.client) for resource, _ in results}) == 1
+    assert len({id(resource) for resource, _ in results}) == 4
+    assert all(table.meta.client is results[0][0].meta.client for _, table in results)
+
+
+def test_registry_calls_resource_factory_once_across_threads():
+    created = []
+    registry = dynamodb_layer.DynamodbResourceRegistry()
+    registry.set_resource_factory(lambda: created.append(object()) or created[-1])
+    threads = [threading.Thread(target=registry.get_resource) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert registry.get_resource() is created[0]
+
+
+class FailingBatchResource(BatchResource):
+    """ Fails the second BatchWriteItem chunk with a non-retryable error"""
+    def batch_write_item(self, RequestItems, **params):
+        from botocore.exceptions import ClientError
+        self.batches.append(len(RequestItems["Todos"]))
+        if len(self.batches) == 2:
+            raise ClientError({"Error": {"Code": "ValidationException", "Message": "bad chunk"}}, "BatchWriteItem")
+        return {"UnprocessedItems": {}}
+
+
+def test_put_todos_reports_partial_writes_and_invalidates_cache(monkeypatch):
+    resource = FailingBatchResource()
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_resource", lambda: resource)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_table", lambda table_name: resource)
+    monkeypatch.setattr(dynamodb_layer, "_id_allocators", {})
+    invalidated = []
+    monkeypatch.setattr(dynamodb_layer, "get_todo_cache", lambda: type("Cache", (), {"invalidate": lambda self, user_name: invalidated.append(user_name)})())
+    todo = {"user_name": "wara", "name": "ベンチプレス", "weight": "60", "set": "3", "clear_plan": "2020-05-01"}
+
+    results = dynamodb_layer.Todo().put_todos([dict(todo) for _ in range(30)])
+    assert [result["status"] for result in results] == ["created"] * 25 + ["failed"] * 5
+    assert "bad chunk" in results[-1]["message"]
+    assert resource.batches == [25, 5]
+    assert invalidated == ["wara"]
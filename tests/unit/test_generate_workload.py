@@ -0,0 +1,44 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("boto3")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "tools"))
+
+from generate_workload import WorkloadGenerator, write_jsonl, read_jsonl
+
+
+def generate(seed):
+    return list(WorkloadGenerator(users=50, seed=seed, now=datetime(2020, 6, 1)).iter_rows())
+
+
+def test_rows_are_reproducible_and_match_written_shapes():
+    rows = generate(seed=7)
+    assert rows == generate(seed=7)
+    assert rows != generate(seed=8)
+
+    todos = [item for table_name, item in rows if table_name == "Todos"]
+    assert [todo["id"] for todo in todos] == list(range(1, len(todos) + 1))
+    open_todo  = next(todo for todo in todos if todo["clear_date"] == "0")
+    clear_todo = next(todo for todo in todos if todo["clear_date"] != "0")
+    assert set(open_todo) == {"user_name", "name", "clear_plan", "set", "weight", "id", "created_at", "clear_date"}
+    assert set(clear_todo) - set(open_todo) == {"is_cleared", "comment", "clear_date_bucket"}
+    assert clear_todo["clear_date"][:10] == clear_todo["clear_date_bucket"] <= "2020-06-01"
+
+    aggregates = {item["user_name"]: item for table_name, item in rows if table_name == "TodoAggregates"}
+    assert sum(aggregates[clear_todo["user_name"]].get("menu#" + name, 0) for name in {todo["name"] for todo in todos}) == \
+        sum(1 for todo in todos if todo["user_name"] == clear_todo["user_name"] and todo["clear_date"] != "0")
+    relations = [item for table_name, item in rows if table_name == "FollowRelation"]
+    assert all(relation["follower_name"] != relation["following_name"] for relation in relations)
+    counters = {item["table_name"]: item["current_number"] for table_name, item in rows if table_name == "MuscleAtomicCounter"}
+    assert counters == {"Todos": len(todos), "FollowRelation": len(relations)}
+
+
+def test_jsonl_round_trip(tmp_path):
+    rows = generate(seed=1)
+    counts = write_jsonl(iter(rows), str(tmp_path))
+    assert counts["Todos"] == sum(1 for table_name, _ in rows if table_name == "Todos")
+    assert list(read_jsonl(str(tmp_path / "FollowRelation.jsonl"))) == [item for table_name, item in rows if table_name == "FollowRelation"]
@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "tools"))
+
+from import_profiler import parse_importtime, extract_module_records, summarize_records
+
+IMPORTTIME_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 | _io
+import time:       300 |        500 |   encodings.aliases
+import time:       200 |        700 | site
+import time:        50 |         50 |     botocore.vendored
+import time:       400 |        450 |   botocore
+import time:      1000 |       1000 |   cognito_layer
+import time:       200 |       1650 | app
+"""
+
+
+def test_importtime_output_is_scoped_to_the_target_module():
+    records = parse_importtime(IMPORTTIME_OUTPUT)
+    assert [(record.name, record.depth) for record in records[:3]] == [("_io", 0), ("encodings.aliases", 1), ("site", 0)]
+
+    scoped = extract_module_records(records, "app")
+    assert [record.name for record in scoped] == ["botocore.vendored", "botocore", "cognito_layer", "app"]
+    assert extract_module_records(records, "missing") == []
+
+
+def test_summary_takes_the_fastest_run_per_module():
+    fast = extract_module_records(parse_importtime(IMPORTTIME_OUTPUT), "app")
+    slow = extract_module_records(parse_importtime(IMPORTTIME_OUTPUT.replace("1650 | app", "3000 | app")), "app")
+    summary = summarize_records([slow, fast], "app", top=2)
+
+    assert summary["total_ms"] == 1.65
+    assert summary["module_count"] == 4
+    assert summary["direct"] == [("cognito_layer", 1.0), ("botocore", 0.45)]
+    assert summary["top"] == [("cognito_layer", 1.0), ("botocore", 0.45)]
+    assert summary["packages"] == [("cognito_layer", 1.0), ("botocore", 0.45)]
@@ -0,0 +1,155 @@
+import json
+from datetime import date
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+import cache_layer
+import dynamodb_layer
+import registry_layer
+from metrics_layer import invocation_metrics
+from memory_dynamodb_layer import MemoryDynamodbResource, install_memory_dynamodb
+
+
+@pytest.fixture
+def memory_resource(monkeypatch):
+    """ Routes dynamodb_registry to a fresh in-memory database"""
+    monkeypatch.setattr(dynamodb_layer, "_id_allocators", {})
+    monkeypatch.setattr(dynamodb_layer.time, "sleep", lambda seconds: None)
+    cache_layer.set_todo_cache(cache_layer.NullTodoCache())
+    resource = install_memory_dynamodb(seed=1)
+    yield resource
+    dynamodb_layer.dynamodb_registry.set_resource_factory(None)
+    cache_layer.set_todo_cache(None)
+
+
+def test_todo_lifecycle_runs_on_memory_backend(memory_resource):
+    todo_db = dynamodb_layer.Todo()
+    for name in ("懸垂", "腕立て", "懸垂"):
+        todo_db.put_todo({"user_name": "wara", "name": name, "clear_plan": "2020-05-01", "set": 3, "weight": 10})
+    today = date.today().isoformat()
+    todo_db.complete_todo({"id": 1, "clear_date": today, "comment": "ok"})
+    todo_db.complete_todo({"id": 3, "clear_date": today, "comment": "ok"})
+
+    # Completions before a rebuild only create a partial aggregate, so the chart must fall back to a full read
+    assert todo_db.aggregate.get_chart_data("wara") is None
+    clear_todos = todo_db.get_clear_todos_for_chart("wara")
+    todo_db.aggregate.batch_put_items([todo_db.aggregate.build_aggregate_item("wara", clear_todos)])
+    todo_db.complete_todo({"id": 2, "clear_date": today, "comment": "ok"})
+    assert todo_db.aggregate.get_chart_data("wara") == {"pie": {"懸垂": 2, "腕立て": 1}, "line": {today: 3}}
+    assert [todo["id"] for todo in todo_db.iter_clear_todos_newest_first(-1)] == [3, 2, 1]
+    assert len(todo_db.get_all_todos("wara")) == 3
+    with pytest.raises(dynamodb_layer.TodoNotFoundError):
+        todo_db.complete_todo({"id": 99, "clear_date": today, "comment": ""})
+
+
+
+def test_rebuild_does_not_overwrite_a_concurrent_completion(memory_resource):
+    todo_db = dynamodb_layer.Todo()
+    aggregate = todo_db.aggregate
+    aggregate.settle_seconds = 0
+    for name in ("懸垂", "腕立て"):
+        todo_db.put_todo({"user_name": "wara", "name": name, "clear_plan": "2020-05-01", "set": 3, "weight": 10})
+    today = date.today().isoformat()
+    todo_db.complete_todo({"id": 1, "clear_date": today, "comment": "ok"})
+
+    current_item = aggregate.get_aggregate_item("wara", consistent_read=True)
+    rebuilt_item = aggregate.build_aggregate_item("wara", todo_db.get_clear_todos_for_chart("wara"))
+    # A completion lands between the read and the write
+    todo_db.complete_todo({"id": 2, "clear_date": today, "comment": "ok"})
+    assert not aggregate.put_built_item(rebuilt_item, current_item)
+
+    assert aggregate.rebuild("wara", todo_db.get_clear_todos_for_chart) is not None
+    assert aggregate.get_chart_data("wara") == {"pie": {"懸垂": 1, "腕立て": 1}, "line": {today: 2}}
+
+    # Completions within settle_seconds may not be visible through the GSI yet
+    todo_db.put_todo({"user_name": "wara", "name": "懸垂", "clear_plan": "2020-05-01", "set": 3, "weight": 10})
+    todo_db.complete_todo({"id": 3, "clear_date": today, "comment": "ok"})
+    aggregate.settle_seconds = 60
+    current_item = aggregate.get_aggregate_item("wara", consistent_read=True)
+    rebuilt_item = aggregate.build_aggregate_item("wara", todo_db.get_clear_todos_for_chart("wara"))
+    assert not aggregate.put_built_item(rebuilt_item, current_item)
+    assert aggregate.get_chart_data("wara")["pie"] == {"懸垂": 2, "腕立て": 1}
+
+
+def test_graph_fallback_builds_the_aggregate_for_the_next_read(memory_resource, monkeypatch):
+    from get_graph_data import app as get_graph_data_app
+    monkeypatch.setenv("TODO_AGGREGATE_SETTLE_SECONDS", "0")
+    registry_layer.reset_registry()
+    todo_db = registry_layer.get_todo()
+    todo_db.put_todo({"user_name": "wara", "name": "懸垂", "clear_plan": "2020-05-01", "set": 3, "weight": 10})
+    today = date.today().isoformat()
+    # The first completion after the last rebuild creates an aggregate without built_at
+    todo_db.complete_todo({"id": 1, "clear_date": today, "comment": "ok"})
+    assert todo_db.aggregate.get_chart_data("wara") is None
+
+    response = get_graph_data_app.lambda_handler({"pathParameters": {"user_name": "wara"}}, None)
+    assert json.loads(response["body"])["data"] == {"pie_data": {"懸垂": 1}, "line_data": {today: 1}}
+    assert todo_db.aggregate.get_chart_data("wara") == {"pie": {"懸垂": 1}, "line": {today: 1}}
+    registry_layer.reset_registry()
+
+def test_query_pages_filters_and_updates_like_dynamodb():
+    resource = MemoryDynamodbResource()
+    resource.load_items("Todos", [{"id": index, "user_name": "wara", "created_at": "2020-05-{:02d}".format(index),
+                                   "clear_date": "0" if index % 2 else "2020-06-01"} for index in range(1, 21)])
+    table = resource.Table("Todos")
+    params = {"IndexName": "UserNameCreatedGSIndex", "KeyConditionExpression": Key("user_name").eq("wara") & Key("created_at").gte("2020-05-05"),
+              "FilterExpression": "clear_date > :zero", "ExpressionAttributeValues": {":zero": "0"}, "ScanIndexForward": False, "Limit": 5}
+
+    pages = []
+    while True:
+        response = table.query(**params)
+        pages.append(response)
+        if "LastEvaluatedKey" not in response:
+            break
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    assert [page["ScannedCount"] for page in pages] == [5, 5, 5, 1]
+    assert [item["id"] for page in pages for item in page["Items"]] == list(range(20, 4, -2))
+    assert set(pages[0]["LastEvaluatedKey"]) == {"id", "user_name", "created_at"}
+
+    response = table.update_item(Key={"id": 1}, UpdateExpression="SET #C = :c ADD done_count :one",
+                                 ExpressionAttributeNames={"#C": "comment"}, ExpressionAttributeValues={":c": "ok", ":one": 1},
+                                 ReturnValues="UPDATED_NEW")
+    assert response["Attributes"] == {"comment": "ok", "done_count": 1}
+    with pytest.raises(ClientError) as error:
+        table.put_item(Item={"id": 1}, ConditionExpression="attribute_not_exists(id)")
+    assert error.value.response["Error"]["Code"] == "ConditionalCheckFailedException"
+    with pytest.raises(TypeError):
+        table.put_item(Item={"id": 21, "weight": 1.5})
+
+
+def test_injected_throttling_is_retried_by_the_retry_policy(memory_resource):
+    memory_resource.load_items("Todos", [{"id": 1, "user_name": "wara"}])
+    memory_resource.inject_error("ProvisionedThroughputExceededException", "GetItem", count=2)
+    invocation_metrics.reset("test")
+
+    assert dynamodb_layer.Todo().get_one_item({"id": 1}) == {"id": 1, "user_name": "wara"}
+    assert invocation_metrics.get_counter("dynamodb_retries") == 2
+    assert memory_resource.stats()["GetItem"] == 3
+
+
+@pytest.mark.parametrize("forward", [True, False])
+def test_query_resumes_after_deleted_start_key(forward):
+    resource = MemoryDynamodbResource()
+    resource.load_items("Todos", [{"id": index, "user_name": "wara", "created_at": "2020-05-{:02d}".format(index)} for index in range(1, 9)])
+    table = resource.Table("Todos")
+    params = {"IndexName": "UserNameCreatedGSIndex", "KeyConditionExpression": Key("user_name").eq("wara"),
+              "ScanIndexForward": forward, "Limit": 3}
+
+    first = table.query(**params)
+    # Deleting the boundary item must not restart the pagination
+    table.delete_item(Key={"id": first["LastEvaluatedKey"]["id"]})
+    rest = []
+    params["ExclusiveStartKey"] = first["LastEvaluatedKey"]
+    while True:
+        response = table.query(**params)
+        rest.extend(item["id"] for item in response["Items"])
+        if "LastEvaluatedKey" not in response:
+            break
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    assert [item["id"] for item in first["Items"]] == ([1, 2, 3] if forward else [8, 7, 6])
+    assert rest == ([4, 5, 6, 7, 8] if forward else [5, 4, 3, 2, 1])
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+pytest.importorskip("boto3")
+
+import dynamodb_layer
+import metrics_layer
+from metrics_layer import capture_dynamodb_calls, emit_invocation_metrics
+
+
+class CapacityTable():
+    """ Returns one page with ConsumedCapacity like DynamoDB"""
+    def __init__(self):
+        self.requests = []
+
+    def query(self, **params):
+        self.requests.append(params)
+        return {"Items": [{"id": 1}, {"id": 2}], "Count": 2, "ScannedCount": 5,
+                "ConsumedCapacity": {"TableName": "Todos", "CapacityUnits": 1.5}}
+
+    def put_item(self, **params):
+        self.requests.append(params)
+        return {"ConsumedCapacity": {"TableName": "Todos", "CapacityUnits": 1.0}}
+
+
+class LambdaContext():
+    function_name = "TodoQueryFunction"
+
+
+@pytest.fixture()
+def capacity_table(monkeypatch):
+    table = CapacityTable()
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_resource", lambda: None)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_table", lambda table_name: table)
+    return table
+
+
+def test_capture_counts_calls_and_requests_consumed_capacity(capacity_table):
+    db = dynamodb_layer.DynamodbObject()
+    db.set_table("Todos")
+
+    with capture_dynamodb_calls(expected=2) as calls:
+        list(db.iter_query({"IndexName": "UserNameCreatedGSIndex", "KeyConditionExpression": "#UN = :un"}))
+        db.put_one_item({"id": 3})
+    assert calls.count_of("query") == 1
+    assert calls.calls[0]["index"] == "UserNameCreatedGSIndex"
+    assert all(request["ReturnConsumedCapacity"] == "INDEXES" for request in capacity_table.requests)
+
+    with pytest.raises(AssertionError):
+        with capture_dynamodb_calls(expected=0):
+            db.put_one_item({"id": 4})
+
+
+def test_lambda_decorator_emits_one_metrics_line(capacity_table, capsys):
+    db = dynamodb_layer.DynamodbObject()
+    db.set_table("Todos")
+
+    @emit_invocation_metrics
+    def lambda_handler(event, context):
+        list(db.iter_query({"KeyConditionExpression": "#UN = :un"}))
+        db.put_one_item({"id": 3})
+        return {"statusCode": 200}
+
+    assert lambda_handler({}, LambdaContext()) == {"statusCode": 200}
+    lines = capsys.readouterr().out.strip().splitlines()
+    assert len(lines) == 1
+    metrics = json.loads(lines[0])
+    assert metrics["FunctionName"] == "TodoQueryFunction"
+    assert metrics["DynamoDBCalls"] == 2
+    assert metrics["DynamoDBCapacityUnits"] == 2.5
+    assert metrics["operations"]["Todos"]["query"]["scanned"] == 5
+    assert metrics_layer.invocation_metrics.context.function_name == "TodoQueryFunction"
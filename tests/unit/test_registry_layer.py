@@ -0,0 +1,45 @@
+import threading
+import time
+
+from registry_layer import ObjectRegistry
+
+
+def test_object_is_created_once_across_threads():
+    registry = ObjectRegistry()
+    created = []
+
+    def factory():
+        time.sleep(0.01)
+        created.append(object())
+        return created[-1]
+
+    registry.register("todo", factory)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("todo"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(result is created[0] for result in results)
+    assert registry.get_counters() == {"created": 1}
+
+
+def test_reset_and_register_replace_instances():
+    registry = ObjectRegistry()
+    registry.register("todo", object)
+    first = registry.get("todo")
+    assert registry.get("todo") is first
+
+    registry.reset()
+    second = registry.get("todo")
+    assert second is not first
+
+    registry.register("todo", dict)
+    assert registry.get("todo") == {}
+    try:
+        registry.get("missing")
+        assert False, "unregistered name must raise"
+    except KeyError:
+        pass
@@ -0,0 +1,124 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("boto3")
+
+import dynamodb_layer
+import registry_layer
+from timeline_fanout import app
+
+EVENT_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "event", "todo_stream_event.json")
+
+
+class InboxTable():
+    """ Serves TimelineInbox queries by owner_name / sort_key and records writes"""
+    def __init__(self, entries=()):
+        self.entries = list(entries)
+        self.writes = []
+        self.puts = []
+
+    def query(self, **params):
+        expression = params["KeyConditionExpression"].get_expression()
+        since = ""
+        partition_condition = params["KeyConditionExpression"]
+        if expression["operator"] == "AND":
+            partition_condition, sort_condition = expression["values"]
+            since = sort_condition.get_expression()["values"][1]
+        owner_name = partition_condition.get_expression()["values"][1]
+        items = [entry for entry in self.entries if entry["owner_name"] == owner_name and entry["sort_key"] >= since]
+        items.sort(key=lambda entry: entry["sort_key"], reverse=not params.get("ScanIndexForward", True))
+        return {"Items": items, "Count": len(items)}
+
+    def batch_write_item(self, RequestItems, **params):
+        for requests in RequestItems.values():
+            self.writes.extend(requests)
+        return {}
+
+    def get_item(self, Key, **params):
+        for entry in self.entries:
+            if entry["owner_name"] == Key["owner_name"] and entry["sort_key"] == Key["sort_key"]:
+                return {"Item": entry}
+        return {}
+
+    def put_item(self, **params):
+        self.puts.append(params["Item"])
+        self.entries = [entry for entry in self.entries
+                        if (entry["owner_name"], entry["sort_key"]) != (params["Item"]["owner_name"], params["Item"]["sort_key"])]
+        self.entries.append(params["Item"])
+        return {}
+
+
+@pytest.fixture()
+def inbox_table(monkeypatch):
+    table = InboxTable()
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_resource", lambda: table)
+    monkeypatch.setattr(dynamodb_layer.dynamodb_registry, "get_table", lambda table_name: table)
+    # TimelineInboxは環境変数を生成時に読み込むため、テストごとに作り直す
+    registry_layer.reset_registry()
+    yield table
+    registry_layer.reset_registry()
+
+
+def test_recorded_stream_event_is_fanned_out_to_followers(inbox_table, monkeypatch):
+    followers = {"wara": ["miki", "taro"], "miki": ["wara"]}
+    monkeypatch.setattr(dynamodb_layer.FollowRelation, "get_follower_names", lambda self, user_name, limit=None: followers[user_name])
+    with open(EVENT_PATH) as event_file:
+        event = json.load(event_file)
+
+    assert app.lambda_handler(event, None) == {"batchItemFailures": []}
+    puts = [write["PutRequest"]["Item"] for write in inbox_table.writes if "PutRequest" in write]
+    deletes = [write["DeleteRequest"]["Key"] for write in inbox_table.writes if "DeleteRequest" in write]
+    assert [(item["owner_name"], item["sort_key"]) for item in puts] == [
+        ("miki", "2020-05-01T00:00:00.000000#000000000101"),
+        ("taro", "2020-05-01T00:00:00.000000#000000000101"),
+        ("wara", "2020-05-02T00:00:00.000000#000000000102")
+    ]
+    assert puts[0]["comment"] == "自己ベスト更新"
+    assert deletes == [
+        {"owner_name": "wara", "sort_key": "2020-04-30T00:00:00.000000#000000000102"},
+        {"owner_name": "miki", "sort_key": "2020-04-29T00:00:00.000000#000000000104"},
+        {"owner_name": "taro", "sort_key": "2020-04-29T00:00:00.000000#000000000104"}
+    ]
+
+
+def test_users_over_the_follower_cap_write_once_and_merge_at_read_time(inbox_table, monkeypatch):
+    monkeypatch.setenv("TIMELINE_FANOUT_MAX_FOLLOWERS", "2")
+    monkeypatch.setattr(dynamodb_layer.FollowRelation, "get_follower_names", lambda self, user_name, limit=None: ["a", "b", "c"][:limit])
+    timeline_inbox = dynamodb_layer.TimelineInbox()
+    todo = {"id": 5, "user_name": "star", "name": "懸垂", "weight": 0, "set": 3, "clear_date": "2020-05-02T00:00:00.000000"}
+
+    assert timeline_inbox.fan_out(timeline_inbox.build_entry(todo)) == ["#outbox#star"]
+    assert inbox_table.puts == [{"owner_name": "#celebrities", "sort_key": "star"}]
+
+    inbox_table.entries = [
+        {"owner_name": "#celebrities", "sort_key": "star"},
+        {"owner_name": "#outbox#star", "sort_key": "2020-05-02T00:00:00.000000#000000000005", "user_name": "star"},
+        {"owner_name": "wara", "sort_key": "2020-05-03T00:00:00.000000#000000000007", "user_name": "miki"},
+        {"owner_name": "wara", "sort_key": "2020-05-01T00:00:00.000000#000000000003", "user_name": "unfollowed"},
+        {"owner_name": "wara", "sort_key": "2020-04-01T00:00:00.000000#000000000001", "user_name": "miki"}
+    ]
+    timeline = list(timeline_inbox.iter_timeline("wara", {"miki", "star"}, since_sort_key="2020-04-18"))
+    assert [entry["sort_key"][-2:] for entry in timeline] == ["07", "05"]
+
+
+def test_users_back_under_the_cap_leave_celebrities_after_the_outbox_expires(inbox_table, monkeypatch):
+    monkeypatch.setenv("TIMELINE_FANOUT_MAX_FOLLOWERS", "2")
+    followers = ["a", "b", "c"]
+    monkeypatch.setattr(dynamodb_layer.FollowRelation, "get_follower_names", lambda self, user_name, limit=None: followers[:limit])
+    timeline_inbox = dynamodb_layer.TimelineInbox()
+    assert timeline_inbox.get_fan_out_owners("star") == ["#outbox#star"]
+
+    followers.pop()
+    # While outbox entries can still be read, write to both followers and the outbox
+    assert timeline_inbox.get_fan_out_owners("star") == ["a", "b", "#outbox#star"]
+    membership = inbox_table.puts[-1]
+    assert membership["sort_key"] == "star" and "expires_at" in membership
+    assert timeline_inbox.get_celebrities() == ["star"]
+    assert timeline_inbox.get_fan_out_owners("star") == ["a", "b", "#outbox#star"]
+    assert inbox_table.puts[-1] is membership
+
+    membership["expires_at"] = 0
+    assert timeline_inbox.get_fan_out_owners("star") == ["a", "b"]
+    assert timeline_inbox.get_celebrities() == []
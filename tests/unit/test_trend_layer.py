@@ -0,0 +1,39 @@
+from decimal import Decimal
+
+import pytest
+
+from trend_layer import TodoTrendObject, load_numpy
+
+
+ITEMS = [
+    {"id": Decimal(1), "user_name": "alice", "name": "bench", "weight": Decimal(60), "set": Decimal(3),
+     "clear_date": "2020-05-01T10:00:00.000000", "comment": "", "clear_plan": "2020-05-01"},
+    {"id": Decimal(2), "user_name": "bob", "name": "squat", "weight": "80", "set": Decimal(5),
+     "clear_date": "2020-05-01T12:00:00.000000", "comment": "", "clear_plan": "2020-05-01"},
+    {"id": Decimal(3), "user_name": "alice", "name": "bench", "weight": Decimal(65), "set": Decimal(2),
+     "clear_date": "2020-04-30T09:00:00.000000", "comment": "good", "clear_plan": "2020-04-30"},
+    {"id": Decimal(4), "user_name": "carol", "name": "deadlift", "weight": Decimal(100), "set": Decimal(1),
+     "clear_date": "0", "comment": "", "clear_plan": "2020-05-02"},
+]
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_trend_data_takes_daily_maximum_in_date_order(use_numpy):
+    if use_numpy and load_numpy() is None:
+        pytest.skip("numpy is not installed")
+    trend_object = TodoTrendObject(ITEMS, use_numpy=use_numpy)
+    trend_object.df["clear_date"] = trend_object.translate_to_datetime_from_decimal("clear_date")
+
+    weight = trend_object.get_trend_data("weight")
+    assert weight == {"2020-04-30": Decimal(65), "2020-05-01": "80"}
+    assert list(weight) == ["2020-04-30", "2020-05-01"]
+    assert trend_object.get_trend_data("set") == {"2020-04-30": Decimal(2), "2020-05-01": Decimal(5)}
+
+
+def test_timeline_keeps_followed_users_in_input_order():
+    trend_object = TodoTrendObject(ITEMS)
+    timeline_datas = trend_object.create_timeline_data([{"following_name": "alice"}, {"following_name": "carol"}])
+
+    assert [data["id"] for data in timeline_datas] == [Decimal(1), Decimal(3), Decimal(4)]
+    assert timeline_datas[0]["clear_date"] == "2020-05-01"
+    assert "clear_plan" not in timeline_datas[0]
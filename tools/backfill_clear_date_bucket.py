@@ -0,0 +1,116 @@
+"""
+既存の完了ずみTodoに clear_date_bucket(完了日 YYYY-MM-DD)を付与するバックフィルツール
+
+タイムライン取得は ClearDateBucketGSIndex(パーティションキー: clear_date_bucket,
+ソートキー: clear_date)を利用する。complete_todo 以降に完了したTodoには自動で付与されるため、
+このツールはインデックス導入前に完了したTodoに対して1度だけ実行する
+
+Usage
+-----
+# インデックスの作成(オンデマンド課金のテーブル)
+python tools/backfill_clear_date_bucket.py --create-index
+# 付与対象の件数だけを確認する
+python tools/backfill_clear_date_bucket.py --dry-run
+# バックフィルの実行
+python tools/backfill_clear_date_bucket.py --segments 8 --workers 8
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layer", "python"))
+
+from dynamodb_layer import Todo, dynamodb_registry
+
+
+def create_index(table_name, index_name, read_capacity=None, write_capacity=None):
+    """
+    clear_date_bucket / clear_date のグローバルセカンダリインデックスを作成する
+    """
+    index_definition = {
+        "IndexName": index_name,
+        "KeySchema": [
+            {"AttributeName": "clear_date_bucket", "KeyType": "HASH"},
+            {"AttributeName": "clear_date", "KeyType": "RANGE"}
+        ],
+        "Projection": {"ProjectionType": "ALL"}
+    }
+    if read_capacity and write_capacity:
+        index_definition["ProvisionedThroughput"] = {
+            "ReadCapacityUnits": read_capacity,
+            "WriteCapacityUnits": write_capacity
+        }
+    return dynamodb_registry.get_client().update_table(
+        TableName=table_name,
+        AttributeDefinitions=[
+            {"AttributeName": "clear_date_bucket", "AttributeType": "S"},
+            {"AttributeName": "clear_date", "AttributeType": "S"}
+        ],
+        GlobalSecondaryIndexUpdates=[{"Create": index_definition}]
+    )
+
+
+def iter_todos_without_bucket(todo_db, segments):
+    """
+    clear_date_bucketを持たない完了ずみTodoを返す
+    """
+    query = {
+        "FilterExpression": "#ClearD > :zero AND attribute_not_exists(#B)",
+        "ExpressionAttributeValues": {":zero": "0"},
+        "ExpressionAttributeNames": {"#ClearD": "clear_date", "#B": "clear_date_bucket"}
+    }
+    return todo_db.parallel_scan(query=query, total_segments=segments)
+
+
+def backfill_todo(todo_db, todo):
+    """
+    1件のTodoにclear_date_bucketを付与する
+    """
+    todo_db.updateItem(
+        {"id": todo["id"]},
+        "set #B = :b",
+        {":b": todo["clear_date"][:10]},
+        {"#B": "clear_date_bucket"}
+    )
+    return todo["id"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--create-index", action="store_true")
+    parser.add_argument("--read-capacity", type=int)
+    parser.add_argument("--write-capacity", type=int)
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    todo_db = Todo()
+    if args.create_index:
+        create_index(todo_db.dynamodb_table_name, todo_db.clear_date_bucket_gsi, args.read_capacity, args.write_capacity)
+        print("Creating index {}. Run backfill after the index becomes ACTIVE.".format(todo_db.clear_date_bucket_gsi))
+        return
+
+    todos = iter_todos_without_bucket(todo_db, args.segments)
+    if args.dry_run:
+        print("{} todos need clear_date_bucket".format(sum(1 for _ in todos)))
+        return
+    updated_count = 0
+    pending       = set()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for todo in todos:
+            pending.add(executor.submit(backfill_todo, todo_db, todo))
+            # 未完了の更新を一定数に抑え、Scan結果を溜め込まない
+            if len(pending) >= args.workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                updated_count += len([future.result() for future in done])
+                if updated_count // 1000 != (updated_count - len(done)) // 1000:
+                    print("{} todos updated".format(updated_count))
+        done, _ = wait(pending)
+        updated_count += len([future.result() for future in done])
+    print("Finished. {} todos updated".format(updated_count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+フォロワーごとのタイムライン(TimelineInbox)を用意するツール
+
+timeline_fanout関数はTodosテーブルのDynamoDB Streamsから、完了したTodoをフォロワーのタイムラインへ書き込む。
+導入前に完了したTodoはStreamsに流れないため、このツールで直近の期間分をタイムラインへ書き込む
+
+Usage
+-----
+# タイムラインのテーブル(TTL: expires_at)とFollowRelationのフォロワー用インデックスの作成
+python tools/backfill_timeline_inbox.py --create-table --create-follower-index
+# 直近14日分の完了ずみTodoをタイムラインへ書き込む
+python tools/backfill_timeline_inbox.py --days 14
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layer", "python"))
+
+from dynamodb_layer import Todo, FollowRelation, TimelineInbox, dynamodb_registry
+
+
+def create_table(table_name):
+    """
+    owner_name / sort_keyをキーに持つタイムラインのテーブルを作成し、expires_atのTTLを有効にする
+    """
+    client = dynamodb_registry.get_client()
+    client.create_table(
+        TableName=table_name,
+        AttributeDefinitions=[
+            {"AttributeName": "owner_name", "AttributeType": "S"},
+            {"AttributeName": "sort_key", "AttributeType": "S"}
+        ],
+        KeySchema=[
+            {"AttributeName": "owner_name", "KeyType": "HASH"},
+            {"AttributeName": "sort_key", "KeyType": "RANGE"}
+        ],
+        BillingMode="PAY_PER_REQUEST"
+    )
+    client.get_waiter("table_exists").wait(TableName=table_name)
+    client.update_time_to_live(
+        TableName=table_name,
+        TimeToLiveSpecification={"Enabled": True, "AttributeName": "expires_at"}
+    )
+
+
+def create_follower_index(table_name, index_name):
+    """
+    following_nameをパーティションキーに持つFollowRelationのインデックスを作成する
+    """
+    return dynamodb_registry.get_client().update_table(
+        TableName=table_name,
+        AttributeDefinitions=[{"AttributeName": "following_name", "AttributeType": "S"}],
+        GlobalSecondaryIndexUpdates=[{"Create": {
+            "IndexName": index_name,
+            "KeySchema": [{"AttributeName": "following_name", "KeyType": "HASH"}],
+            "Projection": {"ProjectionType": "KEYS_ONLY"}
+        }}]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--create-table", action="store_true")
+    parser.add_argument("--create-follower-index", action="store_true")
+    parser.add_argument("--days", type=int, default=14)
+    args = parser.parse_args()
+
+    timeline_inbox = TimelineInbox()
+    if args.create_table or args.create_follower_index:
+        if args.create_table:
+            create_table(timeline_inbox.dynamodb_table_name)
+            print("Created table {}.".format(timeline_inbox.dynamodb_table_name))
+        if args.create_follower_index:
+            follow_relation = FollowRelation()
+            create_follower_index(follow_relation.dynamodb_table_name, follow_relation.following_name_gsi)
+            print("Creating index {}. Run backfill after the index becomes ACTIVE.".format(follow_relation.following_name_gsi))
+        return
+
+    clear_todos = list(Todo().iter_clear_todos_newest_first(-args.days, projection="timeline"))
+    entry_count = 0
+    for todo in clear_todos:
+        entry_count += len(timeline_inbox.fan_out(timeline_inbox.build_entry(todo)))
+    print("Finished. {} todos, {} timeline entries written".format(len(clear_todos), entry_count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+テーブルの容量・Lambdaのメモリの見積もり用に、Todos / FollowRelation の合成データを生成するツール
+
+- ユーザの活動量(Todo件数・フォロー数)は対数正規分布、フォローされる数はユーザの順位に対するべき乗則(Zipf)に従う
+- Todoはput_todoが書き込む形(clear_date="0")と、complete_todoで完了にした後の形
+  (is_cleared, clear_date, comment, clear_date_bucket)で出力する
+- フォローはput_follow_relationが書き込む形で出力する
+- 完了ずみTodoの集計(TodoAggregates)と採番カウンタ(MuscleAtomicCounter)も、書き込んだデータと整合するように出力する
+
+同じシード・同じパラメータからは同じデータを生成する。1行ずつ生成するため、数百万行でもメモリに保持しない
+(フォロー先の抽選に、ユーザ数分の累積重みのみを保持する)
+
+Usage
+-----
+# JSONL(テーブルごとのファイル)に書き出す
+python tools/generate_workload.py --users 10000 --seed 1 --jsonl /tmp/workload
+# 設定されたDynamoDB(DYNAMODB_BACKEND / AWS_SAM_LOCAL に従う)へ書き込む
+python tools/generate_workload.py --users 1000 --seed 1 --load
+# 件数とサイズの見積もりのみ表示する
+python tools/generate_workload.py --users 100000 --summary
+"""
+import argparse
+import bisect
+import json
+import math
+import os
+import random
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layer", "python"))
+
+from dynamodb_layer import TODO_AGGREGATE_MENU_PREFIX, TODO_AGGREGATE_DAY_PREFIX, TODO_AGGREGATE_BUILT_ATTRIBUTE
+
+# テーブル名
+TODOS_TABLE          = "Todos"
+FOLLOW_RELATION_TABLE = "FollowRelation"
+ATOMIC_COUNTER_TABLE = "MuscleAtomicCounter"
+AGGREGATES_TABLE     = os.getenv("TODO_AGGREGATES_TABLE", "TodoAggregates")
+
+# メニュー名, 選ばれやすさ, 重量の(平均, 標準偏差)kg。自重のメニューはNone
+MENUS = (
+    ("ベンチプレス", 20, (60, 15)),
+    ("スクワット", 18, (70, 20)),
+    ("腕立て伏せ", 15, None),
+    ("懸垂", 12, None),
+    ("デッドリフト", 10, (90, 25)),
+    ("腹筋", 10, None),
+    ("ショルダープレス", 8, (30, 8)),
+    ("アームカール", 7, (12, 4))
+)
+# セット数の分布(1〜5セット)
+SET_WEIGHTS = (1, 3, 5, 2, 1)
+COMMENTS    = ("", "", "", "きつかった", "余裕", "フォームを意識した", "自己ベスト更新", "次は重量を上げる")
+
+
+class WorkloadGenerator():
+    """
+    合成データを1行ずつ生成する
+
+    Parameters
+    ----------
+    users : int
+        ユーザ数
+    seed : int
+        乱数のシード
+    days : int
+        データの期間(now以前の日数)
+    todos_per_user : float
+        ユーザあたりのTodo件数の平均
+    follows_per_user : float
+        ユーザあたりのフォロー数の平均
+    follow_alpha : float
+        フォローされる数のべき乗則の指数(大きいほど一部のユーザに集中する)
+    completion_rate : float
+        完了予定日を過ぎたTodoが完了ずみになる確率
+    now : datetime
+        データの基準日時。未指定の場合は今日の0時
+    """
+    def __init__(self, users=1000, seed=0, days=90, todos_per_user=30.0, follows_per_user=20.0,
+                 follow_alpha=1.1, completion_rate=0.7, now=None):
+        self.users            = users
+        self.seed             = seed
+        self.days             = days
+        self.todos_per_user   = todos_per_user
+        self.follows_per_user = follows_per_user
+        self.follow_alpha     = follow_alpha
+        self.completion_rate  = completion_rate
+        self.now              = now or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.menu_weights     = list(accumulate(menu[1] for menu in MENUS))
+        self.set_weights      = list(accumulate(SET_WEIGHTS))
+        self.todo_count       = 0
+        self.follow_count     = 0
+        self.__popularity     = None
+
+    def user_name(self, index):
+        return "user{:07d}".format(index)
+
+    def iter_user_names(self):
+        for index in range(self.users):
+            yield self.user_name(index)
+
+    def iter_rows(self):
+        """
+        (テーブル名, アイテム)を生成する
+        ユーザごとのTodoと集計、フォロー、最後に採番カウンタの順に出力する
+        """
+        for index in range(self.users):
+            todos = list(self.__iter_user_todos(index))
+            yield from ((TODOS_TABLE, todo) for todo in todos)
+            yield AGGREGATES_TABLE, self.build_aggregate_item(self.user_name(index), todos)
+        yield from ((FOLLOW_RELATION_TABLE, relation) for relation in self.iter_follow_relations())
+        yield from ((ATOMIC_COUNTER_TABLE, counter) for counter in self.build_counter_items())
+
+    def iter_todos(self):
+        """
+        Todosのアイテムを生成する(idは1からの連番)
+        """
+        self.todo_count = 0
+        for index in range(self.users):
+            yield from self.__iter_user_todos(index)
+
+    def iter_follow_relations(self):
+        """
+        FollowRelationのアイテムを生成する(idは1からの連番)
+        """
+        self.follow_count = 0
+        for index in range(self.users):
+            rng = self.__random("follow", index)
+            follower_name = self.user_name(index)
+            for following_index in self.__choose_following(rng, index):
+                self.follow_count += 1
+                yield {
+                    "follower_name": follower_name,
+                    "following_name": self.user_name(following_index),
+                    "created_at": self.__random_datetime(rng).isoformat(),
+                    "id": self.follow_count
+                }
+
+    def build_aggregate_item(self, user_name, todos):
+        """
+        ユーザの完了ずみTodoからTodoAggregatesのアイテムを作る(TodoAggregate.build_aggregate_itemと同じ形)
+        """
+        # 全件から作った集計として扱われるように、作り直した日時(基準日)を入れる
+        item = {"user_name": user_name, TODO_AGGREGATE_BUILT_ATTRIBUTE: self.now.isoformat(timespec="seconds")}
+        for todo in todos:
+            if todo["clear_date"] == "0":
+                continue
+            for attribute in (TODO_AGGREGATE_MENU_PREFIX + todo["name"], TODO_AGGREGATE_DAY_PREFIX + todo["clear_date"][:10]):
+                item[attribute] = item.get(attribute, 0) + 1
+        return item
+
+    def build_counter_items(self):
+        """
+        生成した件数に合わせた採番カウンタのアイテム(iter_todos / iter_follow_relationsを読み終えた後に呼ぶ)
+        """
+        return [
+            {"table_name": TODOS_TABLE, "current_number": self.todo_count},
+            {"table_name": FOLLOW_RELATION_TABLE, "current_number": self.follow_count}
+        ]
+
+    #private method
+    def __random(self, stream, index):
+        # ユーザ・用途ごとに独立した乱数を使い、他のユーザの生成結果に影響されないようにする
+        return random.Random("{}:{}:{}".format(self.seed, stream, index))
+
+    def __iter_user_todos(self, index):
+        rng       = self.__random("todo", index)
+        user_name = self.user_name(index)
+        for _ in range(self.__lognormal_count(rng, self.todos_per_user)):
+            self.todo_count += 1
+            yield self.__build_todo(rng, user_name, self.todo_count)
+
+    def __build_todo(self, rng, user_name, todo_id):
+        name, _, weight_distribution = MENUS[bisect.bisect_left(self.menu_weights, rng.random() * self.menu_weights[-1])]
+        created_at = self.__random_datetime(rng)
+        clear_plan = created_at.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=rng.randint(0, 7))
+        weight     = max(5, int(round(rng.gauss(*weight_distribution)))) if weight_distribution else 0
+        todo = {
+            "user_name": user_name,
+            "name": name,
+            "clear_plan": clear_plan.isoformat(timespec="microseconds"),
+            "set": bisect.bisect_left(self.set_weights, rng.random() * self.set_weights[-1]) + 1,
+            "weight": weight,
+            "id": todo_id,
+            "created_at": created_at.isoformat(timespec="microseconds"),
+            "clear_date": "0"
+        }
+        if clear_plan <= self.now and rng.random() < self.completion_rate:
+            # 予定日の前日〜2日後に完了する(未来の日付にはしない)
+            clear_date = min(self.now, max(created_at, clear_plan + timedelta(days=rng.randint(-1, 2)))).replace(
+                hour=0, minute=0, second=0, microsecond=0)
+            todo.update({
+                "is_cleared": True,
+                "clear_date": clear_date.isoformat(timespec="microseconds"),
+                "comment": rng.choice(COMMENTS),
+                "clear_date_bucket": clear_date.strftime("%Y-%m-%d")
+            })
+        return todo
+
+    def __choose_following(self, rng, index):
+        if self.users < 2:
+            return []
+        count     = min(self.users - 1, self.__lognormal_count(rng, self.follows_per_user))
+        following = set()
+        popularity = self.__get_popularity()
+        # 重複・自分自身は引き直す(人気ユーザに集中する場合に終わらなくならないよう回数を制限する)
+        for _ in range(count * 4):
+            if len(following) >= count:
+                break
+            candidate = bisect.bisect_left(popularity, rng.random() * popularity[-1])
+            if candidate != index:
+                following.add(candidate)
+        return sorted(following)
+
+    def __get_popularity(self):
+        # 順位kのユーザがフォローされる重みは 1 / k^alpha (ユーザ番号が小さいほど人気)
+        if self.__popularity is None:
+            self.__popularity = list(accumulate(1.0 / (rank ** self.follow_alpha) for rank in range(1, self.users + 1)))
+        return self.__popularity
+
+    def __lognormal_count(self, rng, mean, sigma=1.0):
+        # 平均がmeanになる対数正規分布。極端な値はmeanの50倍で打ち切る
+        if mean <= 0:
+            return 0
+        mu = math.log(mean) - sigma ** 2 / 2
+        return min(int(mean * 50), int(round(rng.lognormvariate(mu, sigma))))
+
+    def __random_datetime(self, rng):
+        return self.now - timedelta(seconds=rng.uniform(0, self.days * 86400))
+
+
+def write_jsonl(rows, output_dir):
+    """
+    (テーブル名, アイテム)をテーブルごとのJSONLファイル(<output_dir>/<テーブル名>.jsonl)に書き出す
+
+    Returns
+    -------
+    counts : Counter
+        テーブル名 -> 行数
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    files  = {}
+    counts = Counter()
+    try:
+        for table_name, item in rows:
+            if table_name not in files:
+                files[table_name] = open(os.path.join(output_dir, table_name + ".jsonl"), "w", encoding="utf-8")
+            files[table_name].write(json.dumps(item, ensure_ascii=False) + "\n")
+            counts[table_name] += 1
+    finally:
+        for file in files.values():
+            file.close()
+    return counts
+
+
+def read_jsonl(path):
+    """
+    write_jsonlで書き出したファイルを1行ずつ読み込む(数値はDecimalにする)
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line, parse_float=Decimal)
+
+
+def load_rows(rows, chunk_size=500):
+    """
+    (テーブル名, アイテム)をテーブルごとのDynamodbObjectのbatch_put_itemsで書き込む
+    dynamodb_registryの設定(boto3 / DynamoDB Local / DYNAMODB_BACKEND=memory)に従う
+
+    Returns
+    -------
+    counts : Counter
+        テーブル名 -> 書き込んだ件数
+    unprocessed : Counter
+        テーブル名 -> 再送しても書き込めなかった件数
+    """
+    from dynamodb_layer import DynamodbObject
+    from metrics_layer import invocation_metrics
+    tables      = {}
+    buffers     = {}
+    counts      = Counter()
+    unprocessed = Counter()
+
+    def flush(table_name):
+        # 再試行の予算は呼び出しごとのため、チャンクごとに集計を区切る
+        invocation_metrics.reset("generate_workload")
+        failed = tables[table_name].batch_put_items(buffers.pop(table_name))
+        unprocessed[table_name] += len(failed)
+
+    for table_name, item in rows:
+        if table_name not in tables:
+            tables[table_name] = DynamodbObject()
+            tables[table_name].set_table(table_name)
+        buffers.setdefault(table_name, []).append(item)
+        counts[table_name] += 1
+        if len(buffers[table_name]) >= chunk_size:
+            flush(table_name)
+    for table_name in list(buffers):
+        flush(table_name)
+    return counts, unprocessed
+
+
+def summarize_rows(rows):
+    """
+    テーブルごとの件数と、アイテムサイズの合計・最大(バイトの概算)を集計する
+    """
+    from memory_dynamodb_layer import item_size, to_dynamodb_item
+    summary = {}
+    for table_name, item in rows:
+        size  = item_size(to_dynamodb_item(item))
+        entry = summary.setdefault(table_name, {"items": 0, "bytes": 0, "max_item_bytes": 0})
+        entry["items"] += 1
+        entry["bytes"] += size
+        entry["max_item_bytes"] = max(entry["max_item_bytes"], size)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--days", type=int, default=90, help="データの期間(日数)")
+    parser.add_argument("--todos-per-user", type=float, default=30.0)
+    parser.add_argument("--follows-per-user", type=float, default=20.0)
+    parser.add_argument("--follow-alpha", type=float, default=1.1, help="フォローされる数のべき乗則の指数")
+    parser.add_argument("--completion-rate", type=float, default=0.7)
+    parser.add_argument("--now", help="基準日(YYYY-MM-DD)。同じデータを再生成する場合に指定する")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--jsonl", metavar="DIR", help="テーブルごとのJSONLを書き出すディレクトリ")
+    output.add_argument("--load", action="store_true", help="設定されたDynamoDBへ書き込む")
+    output.add_argument("--summary", action="store_true", help="件数とサイズの概算のみ表示する")
+    args = parser.parse_args()
+
+    generator = WorkloadGenerator(
+        users=args.users, seed=args.seed, days=args.days, todos_per_user=args.todos_per_user,
+        follows_per_user=args.follows_per_user, follow_alpha=args.follow_alpha, completion_rate=args.completion_rate,
+        now=datetime.strptime(args.now, "%Y-%m-%d") if args.now else None
+    )
+    if args.summary:
+        for table_name, entry in summarize_rows(generator.iter_rows()).items():
+            print("{:<20} {:>10} items {:>12} bytes (max {} bytes/item)".format(
+                table_name, entry["items"], entry["bytes"], entry["max_item_bytes"]))
+        return
+    if args.jsonl:
+        counts = write_jsonl(generator.iter_rows(), args.jsonl)
+    else:
+        counts, unprocessed = load_rows(generator.iter_rows())
+        for table_name, count in unprocessed.items():
+            if count:
+                print("{} items are unprocessed in {}".format(count, table_name))
+    print("Finished. " + ", ".join("{}: {}".format(table_name, count) for table_name, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
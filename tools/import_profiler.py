@@ -0,0 +1,195 @@
+"""
+Lambda関数(src/*/app.py)やレイヤーのモジュールの読み込み時間を計測するツール
+
+python -X importtime で新しいプロセスにモジュールを読み込ませ、その出力からモジュールごとの
+累積の読み込み時間(そのモジュールが読み込んだモジュールを含む)を集計する。
+siteなど対象のモジュールより前に読み込まれたものは含めない。
+読み込み時間はばらつくため、--repeatを指定した場合はモジュールごとに最小値を採る
+
+Usage
+-----
+# 全ての関数の読み込み時間と、時間のかかっているモジュール上位10件を表示する
+python tools/import_profiler.py
+# 一部の関数・レイヤーのモジュールのみ、5回計測する
+python tools/import_profiler.py --functions todo_query timelines --modules cognito_layer --repeat 5
+# 読み込み時間が予算を超えた関数があれば終了コード1にする(CIでの確認用)
+python tools/import_profiler.py --budget-ms 150 --output import_profile.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import namedtuple
+
+ROOT_DIR  = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+LAYER_DIR = os.path.join(ROOT_DIR, "layer", "python")
+SRC_DIR   = os.path.join(ROOT_DIR, "src")
+
+# -X importtime の1行(self, cumulativeはマイクロ秒、depthは読み込みの入れ子の深さ)
+ImportRecord = namedtuple("ImportRecord", ["name", "self_us", "cumulative_us", "depth"])
+
+
+def list_functions():
+    """
+    src配下のLambda関数(app.pyを持つディレクトリ)の一覧を返す
+    """
+    return sorted(name for name in os.listdir(SRC_DIR) if os.path.isfile(os.path.join(SRC_DIR, name, "app.py")))
+
+
+def parse_importtime(output):
+    """
+    -X importtime の出力(標準エラー)を解析する
+
+    Returns
+    -------
+    records : list
+        ImportRecordの配列(出力順。子のモジュールが親より先に並ぶ)
+    """
+    records = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|", 2)
+        if not self_us.strip().isdigit():
+            # 見出し行
+            continue
+        stripped = name.lstrip(" ")
+        records.append(ImportRecord(stripped.strip(), int(self_us), int(cumulative_us), (len(name) - len(stripped) - 1) // 2))
+    return records
+
+
+def extract_module_records(records, module_name):
+    """
+    対象のモジュールの読み込みで発生したレコードのみを取り出す
+    出力は子が親より先に並ぶため、対象(depth 0)の直前にあるdepth 0のレコードより後ろが対象の読み込み分になる
+    """
+    start = 0
+    for position, record in enumerate(records):
+        if record.depth != 0:
+            continue
+        if record.name == module_name:
+            return records[start:position + 1]
+        start = position + 1
+    return []
+
+
+def profile_import(module_name, paths, python=sys.executable, env=None):
+    """
+    新しいプロセスでモジュールを読み込み、読み込みで発生したレコードを返す
+
+    Parameters
+    ----------
+    module_name : string
+        読み込むモジュール名
+    paths : list
+        PYTHONPATHの先頭に追加するディレクトリ
+    python : string
+        計測に使うPythonの実行ファイル
+    env : dict
+        追加する環境変数
+
+    Returns
+    -------
+    records : list
+        ImportRecordの配列。読み込みに失敗した場合はRuntimeErrorを送出する
+    """
+    process_env = dict(os.environ)
+    process_env.update(env or {})
+    process_env["PYTHONPATH"] = os.pathsep.join(list(paths) + ([process_env["PYTHONPATH"]] if process_env.get("PYTHONPATH") else []))
+    process_env.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+    completed = subprocess.run([python, "-X", "importtime", "-c", "import {}".format(module_name)],
+                               env=process_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "exit {}".format(completed.returncode))
+    return extract_module_records(parse_importtime(completed.stderr), module_name)
+
+
+def summarize_records(runs, module_name, top=10):
+    """
+    複数回の計測結果を集計する(モジュールごとに最小値を採る)
+
+    Returns
+    -------
+    summary : dict
+        total_ms: 対象モジュールの累積時間, module_count: 読み込んだモジュール数,
+        direct: 対象が直接読み込んだモジュールの累積時間, top: 累積時間の上位, packages: トップレベルのパッケージごとの自己時間の合計
+    """
+    best = {}
+    for records in runs:
+        for record in records:
+            if record.name not in best or record.cumulative_us < best[record.name].cumulative_us:
+                best[record.name] = record
+    total    = best.get(module_name)
+    others   = [record for name, record in best.items() if name != module_name]
+    packages = {}
+    for record in others:
+        package = record.name.split(".", 1)[0]
+        packages[package] = packages.get(package, 0) + record.self_us
+    return {
+        "total_ms": total.cumulative_us / 1000 if total else 0.0,
+        "module_count": len(best),
+        "direct": sorted(((record.name, record.cumulative_us / 1000) for record in others if record.depth == 1),
+                         key=lambda entry: entry[1], reverse=True),
+        "top": [(record.name, record.cumulative_us / 1000)
+                for record in sorted(others, key=lambda record: record.cumulative_us, reverse=True)[:top]],
+        "packages": sorted(((name, self_us / 1000) for name, self_us in packages.items()), key=lambda entry: entry[1], reverse=True)[:top]
+    }
+
+
+def build_targets(functions, modules):
+    """
+    計測対象(表示名, モジュール名, PYTHONPATHに追加するディレクトリ)の配列を返す
+    """
+    targets = [(function_name, "app", [LAYER_DIR, os.path.join(SRC_DIR, function_name)]) for function_name in functions]
+    targets.extend((module_name, module_name, [LAYER_DIR]) for module_name in modules)
+    return targets
+
+
+def print_summary(name, summary):
+    print("{:<24} {:>9.1f} ms  {:>4} modules".format(name, summary["total_ms"], summary["module_count"]))
+    for module_name, cumulative_ms in summary["direct"]:
+        print("    import {:<40} {:>9.1f} ms".format(module_name, cumulative_ms))
+    print("    top modules (cumulative): " + ", ".join("{} {:.1f}".format(module_name, ms) for module_name, ms in summary["top"]))
+    print("    top packages (self):      " + ", ".join("{} {:.1f}".format(package, ms) for package, ms in summary["packages"]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--functions", nargs="*", help="計測する関数名(未指定の場合は全て)")
+    parser.add_argument("--modules", nargs="*", default=[], help="計測するレイヤーのモジュール名")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--python", default=sys.executable, help="計測に使うPythonの実行ファイル")
+    parser.add_argument("--budget-ms", type=float, help="関数ごとの読み込み時間の上限(超えた場合は終了コード1)")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    functions = list_functions() if args.functions is None else args.functions
+    report    = {}
+    for name, module_name, paths in build_targets(functions, args.modules):
+        try:
+            # バイトコードのキャッシュ(.pyc)を作る時間を含めないよう、1回目の結果は捨てる
+            profile_import(module_name, paths, python=args.python)
+            runs = [profile_import(module_name, paths, python=args.python) for _ in range(max(1, args.repeat))]
+        except RuntimeError as e:
+            print("{:<24} failed ({})".format(name, e))
+            report[name] = {"error": str(e)}
+            continue
+        report[name] = summarize_records(runs, module_name, top=args.top)
+        print_summary(name, report[name])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print("Saved {}".format(args.output))
+    if args.budget_ms is not None:
+        over = [(name, summary["total_ms"]) for name, summary in report.items() if summary.get("total_ms", 0.0) > args.budget_ms]
+        for name, total_ms in over:
+            print("OVER BUDGET {}: {:.1f} ms > {:.1f} ms".format(name, total_ms, args.budget_ms))
+        if over:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
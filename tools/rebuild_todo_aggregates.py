@@ -0,0 +1,121 @@
+"""
+完了ずみTodoからユーザごとのグラフ用の集計(TodoAggregates)を作り直すツール
+
+complete_todo / update_todo は集計を差分で更新するため、集計の導入前に完了したTodoがある場合や、
+集計がずれた場合にこのツールで全件から再計算する。
+集計テーブルの版数(version)を読んだ後にTodosテーブルを並列Scanしてユーザごとに集計し、
+読んだ版数から変わっていない集計のみ上書きする(TodoAggregate.put_built_item)。
+実行中にTodoが完了して版数が変わったユーザは、ユーザごとに集計を読み直して再試行するため、加算は失われない。
+作り直した集計はbuilt_atを持ち、get_graph_dataはbuilt_atがない集計を使わずに完了ずみTodoの全件から集計する
+
+Usage
+-----
+# 集計テーブルの作成(オンデマンド課金)
+python tools/rebuild_todo_aggregates.py --create-table
+# 作り直す件数だけを確認する
+python tools/rebuild_todo_aggregates.py --dry-run
+# 全ユーザの集計を作り直す
+python tools/rebuild_todo_aggregates.py --segments 8
+# 1ユーザのみ作り直す
+python tools/rebuild_todo_aggregates.py --user wara
+"""
+import argparse
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layer", "python"))
+
+from dynamodb_layer import Todo, dynamodb_registry, TODO_AGGREGATE_VERSION_ATTRIBUTE, TODO_AGGREGATE_UPDATED_ATTRIBUTE
+
+# 集計に必要な属性
+AGGREGATE_PROJECTION = ("user_name", "name", "clear_date")
+# 条件つきの書き込みに必要な集計の属性
+CURRENT_AGGREGATE_PROJECTION = ("user_name", TODO_AGGREGATE_VERSION_ATTRIBUTE, TODO_AGGREGATE_UPDATED_ATTRIBUTE)
+
+
+def create_table(table_name):
+    """
+    user_nameをパーティションキーに持つ集計テーブルを作成する
+    """
+    return dynamodb_registry.get_client().create_table(
+        TableName=table_name,
+        AttributeDefinitions=[{"AttributeName": "user_name", "AttributeType": "S"}],
+        KeySchema=[{"AttributeName": "user_name", "KeyType": "HASH"}],
+        BillingMode="PAY_PER_REQUEST"
+    )
+
+
+def iter_clear_todos(todo_db, segments, user_name=None):
+    """
+    完了ずみTodoのユーザ名・メニュー名・完了日を返す
+    """
+    if user_name:
+        params = {
+            "IndexName": "UserNameCreatedGSIndex",
+            "KeyConditionExpression": "#UN = :un",
+            "FilterExpression": "#ClearD > :zero",
+            "ExpressionAttributeNames": {"#UN": "user_name", "#ClearD": "clear_date"},
+            "ExpressionAttributeValues": {":un": user_name, ":zero": "0"}
+        }
+        return todo_db.iter_query(params, projection=AGGREGATE_PROJECTION)
+    query = {
+        "FilterExpression": "#ClearD > :zero",
+        "ExpressionAttributeNames": {"#ClearD": "clear_date"},
+        "ExpressionAttributeValues": {":zero": "0"}
+    }
+    return todo_db.parallel_scan(query=query, total_segments=segments, projection=AGGREGATE_PROJECTION)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--create-table", action="store_true")
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--user", help="指定したユーザの集計のみ作り直す")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    todo_db   = Todo()
+    aggregate = todo_db.aggregate
+    if args.create_table:
+        create_table(aggregate.dynamodb_table_name)
+        print("Creating table {}.".format(aggregate.dynamodb_table_name))
+        return
+
+    def load_clear_todos(user_name):
+        return [{"name": todo["name"], "clear_date": todo["clear_date"]} for todo in iter_clear_todos(todo_db, args.segments, user_name)]
+
+    if args.user:
+        if args.dry_run:
+            print("1 users, {} clear todos".format(len(load_clear_todos(args.user))))
+            return
+        # 完了ずみTodoがないユーザは空の集計にする
+        item = aggregate.rebuild(args.user, load_clear_todos)
+        print("Finished. {} aggregates written".format(0 if item is None else 1))
+        return
+
+    # 完了ずみTodoを読む前に版数を読み、読んだ後に加算された集計を上書きしないようにする
+    current_items = {item["user_name"]: item for item in aggregate.iter_scan(projection=CURRENT_AGGREGATE_PROJECTION)}
+    # ユーザごとの集計はメニュー数 + 完了日数の属性のみのため、全ユーザ分をメモリに持つ
+    todos_by_user = defaultdict(list)
+    for todo in iter_clear_todos(todo_db, args.segments):
+        todos_by_user[todo["user_name"]].append({"name": todo["name"], "clear_date": todo["clear_date"]})
+    print("{} users, {} clear todos".format(len(todos_by_user), sum(len(todos) for todos in todos_by_user.values())))
+    if args.dry_run:
+        return
+    written_count = 0
+    failed_users  = []
+    for user_name, todos in todos_by_user.items():
+        item = aggregate.build_aggregate_item(user_name, todos)
+        # 版数が変わった・直近に加算されたユーザは読み直して作り直す
+        if aggregate.put_built_item(item, current_items.get(user_name)) or aggregate.rebuild(user_name, load_clear_todos) is not None:
+            written_count += 1
+        else:
+            failed_users.append(user_name)
+    if failed_users:
+        print("{} aggregates are not written: {}".format(len(failed_users), failed_users))
+    print("Finished. {} aggregates written".format(written_count))
+
+
+if __name__ == "__main__":
+    main()